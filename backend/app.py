@@ -3,13 +3,18 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
+import asyncio
 import os
 from dotenv import load_dotenv
 import logging
 
-from database.connection import init_db, close_db
+from database.connection import init_db, close_db, get_database
+from services.ai_service import ai_service_instance
+from services.config_service import get_runtime_config
+from services.loop_monitor import loop_monitor
+from services.rate_limit import RateLimitMiddleware
 from routes import auth, chat, admin, analytics, ai
-from socketio_instance import init_app as init_socketio
+from socketio_instance import init_app as init_socketio, typing_engine, sweep_presence
 from routes.public import public_router
 
 # Configure logging
@@ -19,14 +24,34 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+async def watch_model_versions():
+    """Keeps this worker on the model versions requested in system_config (hot-swap)."""
+    runtime_config = get_runtime_config()
+    while True:
+        try:
+            config = await runtime_config.refresh(get_database(), force=True)
+            if ai_service_instance.initialized:
+                await ai_service_instance.reconcile_model_versions(config.model_versions)
+        except Exception as e:
+            logger.error(f"Model version watcher failed: {e}")
+        await asyncio.sleep(runtime_config.ttl_seconds)
+
 # FastAPI app with lifespan
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    await init_db()
+    await init_db(wait_for_indexes=False)
+    model_watcher = asyncio.create_task(watch_model_versions())
+    typing_expiry = asyncio.create_task(typing_engine.run_expiry())
+    presence_sweeper = asyncio.create_task(sweep_presence())
+    loop_lag = asyncio.create_task(loop_monitor.run())
     logger.info("🚀 Backend started successfully!")
     yield
     # Shutdown
+    model_watcher.cancel()
+    typing_expiry.cancel()
+    presence_sweeper.cancel()
+    loop_lag.cancel()
     await close_db()
     logger.info("👋 Backend shutdown complete!")
 
@@ -37,6 +62,9 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Rate limiting runs inside CORS so that 429 responses still carry CORS headers
+app.add_middleware(RateLimitMiddleware)
+
 # CORS middleware MUST be added BEFORE mounting Socket.IO
 app.add_middleware(
     CORSMiddleware,
@@ -44,6 +72,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Browsers only let scripts read these response headers when they are exposed
+    expose_headers=["X-Prev-Cursor", "X-Next-Cursor", "X-Has-More", "X-Search-Truncated", "Retry-After"],
 )
 print('[CORS] CORS middleware configured: allow_origins=*')
 
@@ -0,0 +1,58 @@
+"""
+Fills `search_tokens` (the accent-folded words message search looks up, see services/search.py)
+on messages saved before search used them. New messages get them in save_message.
+
+Walks the messages in _id order in batches, so it can be stopped and run again at any time:
+    python backfill_search_tokens.py                   # messages without search_tokens
+    python backfill_search_tokens.py --all             # recompute every message (tokenizer changed)
+    python backfill_search_tokens.py --batch-size 2000
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from pymongo import UpdateOne
+
+from database.connection import init_db, close_db, get_database
+from services.search import tokenize
+
+async def backfill(db, recompute=False, batch_size=1000):
+    scanned = updated = 0
+    last_id = None
+    while True:
+        # Paged by _id rather than by a search_tokens filter: the _id index serves every batch
+        query = {"_id": {"$gt": last_id}} if last_id else {}
+        batch = await db["messages"].find(query, {"content": 1, "search_tokens": 1}).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+        scanned += len(batch)
+        updates = [
+            UpdateOne({"_id": message["_id"]}, {"$set": {"search_tokens": tokenize(message.get("content"))}})
+            for message in batch
+            if recompute or "search_tokens" not in message
+        ]
+        if updates:
+            await db["messages"].bulk_write(updates, ordered=False)
+            updated += len(updates)
+        print(f"Scanned {scanned} messages, updated {updated}")
+    print(f"Done: {updated} of {scanned} messages updated")
+
+async def main(args):
+    await init_db()
+    try:
+        await backfill(get_database(), args.all, args.batch_size)
+    finally:
+        await close_db()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill search_tokens on existing messages")
+    parser.add_argument("--all", action="store_true", help="recompute search_tokens of every message")
+    parser.add_argument("--batch-size", type=int, default=1000, help="messages per bulk write")
+    asyncio.run(main(parser.parse_args()))
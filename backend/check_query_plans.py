@@ -0,0 +1,215 @@
+"""
+Query-plan check: explains every hot query of ChatService, the analytics and admin routes
+against a small seeded database carrying the indexes of database/indexes.py, and fails
+(exit code 1) when a winning plan contains a collection scan.
+
+    python check_query_plans.py            # seeds <DATABASE_NAME>_plan_check, checks, drops it
+    python check_query_plans.py --keep     # leave the seeded database for a look at the plans
+    python check_query_plans.py --verbose  # print the index used by every query
+
+Queries are built with the same builders the code uses: ChatService.message_page_query,
+search_query, room_list_pipeline... for the chat service, services/report_queries.py
+for the admin dashboard and analytics routes. A change of shape there is checked without
+touching this file. Only single-field lookups (users by username/email, intent history,
+AI feedback, system_config) are written out here. Queries that read a whole collection
+on purpose are listed with full_scan=<reason>: they are reported but do not fail the
+check. A query that starts scanning needs its index in database/indexes.py.
+"""
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import motor.motor_asyncio
+from bson import ObjectId
+
+from database.connection import MONGO_URL, DATABASE_NAME
+from database.indexes import reconcile_indexes
+from services.chat_service import ACTIVE_ROOMS, ChatService
+from services.pagination import DEFAULT_PAGE_SIZE, encode_cursor
+from services import report_queries
+from services.search import SEARCH_CANDIDATES
+
+NOW = datetime.utcnow()
+WEEK_AGO = NOW - timedelta(days=7)
+CUSTOMER_ID = ObjectId()
+ROOM_ID = str(CUSTOMER_ID)
+MESSAGE_IDS = [ObjectId() for _ in range(6)]
+
+def find(collection, filter, sort=None, limit=None, full_scan=None):
+    command = {"find": collection, "filter": filter}
+    if sort:
+        command["sort"] = dict(sort)
+    if limit:
+        command["limit"] = limit
+    return command, full_scan
+
+def count(collection, filter, full_scan=None):
+    return {"count": collection, "query": filter}, full_scan
+
+def aggregate(collection, pipeline, full_scan=None):
+    return {"aggregate": collection, "pipeline": pipeline, "cursor": {}}, full_scan
+
+def queries():
+    """name -> (explain command, full_scan reason or None), same shapes as the code they name."""
+    last_read = NOW - timedelta(minutes=5)
+    cursor = encode_cursor({"created_at": NOW - timedelta(minutes=3), "_id": MESSAGE_IDS[3]})
+    page_size = DEFAULT_PAGE_SIZE + 1
+    newest = [("created_at", -1)]
+    return {
+        # ChatService
+        "chat.get_or_create_room": find("chat_rooms", {"_id": ROOM_ID}),
+        "chat.rooms_of_customer": find("chat_rooms", {"customer_id": ROOM_ID}),
+        "chat.get_active_rooms": aggregate("chat_rooms", ChatService.room_list_pipeline(ACTIVE_ROOMS)),
+        "chat.get_room_summary": aggregate("chat_rooms", ChatService.room_list_pipeline({"_id": ROOM_ID})),
+        "chat.get_active_chat_rooms": find("chat_rooms", ACTIVE_ROOMS),
+        "chat.get_all_rooms": find("chat_rooms", {}, full_scan="lists every room"),
+        "chat.backfill_unread": count("messages", ChatService.unread_query(ROOM_ID, last_read)),
+        "chat.backfill_unread.never_read": count("messages", ChatService.unread_query(ROOM_ID, None)),
+        "chat.message_page.newest": find("messages", *ChatService.message_page_query(ROOM_ID), page_size),
+        "chat.message_page.before": find("messages", *ChatService.message_page_query(ROOM_ID, before=cursor), page_size),
+        "chat.message_page.after": find("messages", *ChatService.message_page_query(ROOM_ID, after=cursor), page_size),
+        "chat.messages_after_seq": find("messages", *ChatService.after_seq_query(ROOM_ID, 2), page_size),
+        "chat.hydrate_replies": find("messages", {"_id": {"$in": MESSAGE_IDS[:2]}}),
+        "chat.last_seen_by_customer": find("messages", *ChatService.last_seen_query(ROOM_ID, last_read), 1),
+        "chat.uncategorized_messages": find("messages", ChatService.uncategorized_query(), newest, 50),
+        "chat.search_messages.keyword": find("messages", ChatService.search_query("Order question"), newest, SEARCH_CANDIDATES),
+        "chat.search_messages.keyword_in_period": find("messages", ChatService.search_query("order", date_from=WEEK_AGO, date_to=NOW), newest, SEARCH_CANDIDATES),
+        "chat.search_messages.keyword_of_customer": find("messages", ChatService.search_query("order", room_ids=[ROOM_ID]), newest, SEARCH_CANDIDATES),
+        "chat.search_messages.intent": find("messages", ChatService.search_query(intent="inquiry"), newest, 50),
+        "chat.search_messages.period": find("messages", ChatService.search_query(date_from=WEEK_AGO, date_to=NOW), newest, 50),
+        "chat.search_messages.intent_of_customer": find("messages", ChatService.search_query(intent="inquiry", room_ids=[ROOM_ID]), newest, 50),
+        "chat.delete_customer_messages": find("messages", {"user_id": ROOM_ID}),
+        "intent_history.by_message": find("intent_history", {"message_id": MESSAGE_IDS[0]}, [("created_at", 1)]),
+        "intent_history.by_room": find("intent_history", {"room_id": ROOM_ID}, [("created_at", 1)]),
+        # routes/analytics.py
+        "analytics.overview.per_user_type": count("messages", report_queries.messages_of_user_type("admin")),
+        "analytics.overview.rooms": find("chat_rooms", {}, full_scan="walks every room for response times"),
+        "analytics.overview.room_messages": find("messages", *report_queries.room_messages(ROOM_ID)),
+        "analytics.overview.intents": aggregate("messages", report_queries.intent_distribution_pipeline()),
+        "analytics.overview.ai_messages": count("messages", report_queries.AI_GENERATED),
+        "analytics.overview.daily_messages": count("messages", report_queries.day_messages(NOW - timedelta(days=1), NOW)),
+        "analytics.customer_behavior.engagement": aggregate("chat_rooms", report_queries.engagement_pipeline(WEEK_AGO, NOW)),
+        "analytics.customer_behavior.customer_messages": aggregate("messages", report_queries.customer_messages_by_room_pipeline(WEEK_AGO, NOW)),
+        "analytics.customer_behavior.admin_replies": find("messages", *report_queries.admin_replies(ROOM_ID, WEEK_AGO, NOW)),
+        "analytics.ai_performance.trends": aggregate("messages", report_queries.ai_usage_pipeline(WEEK_AGO, NOW)),
+        # routes/admin.py
+        "admin.dashboard.active_rooms": count("chat_rooms", ACTIVE_ROOMS),
+        "admin.dashboard.rooms_by_status": count("chat_rooms", report_queries.RESOLVED_ROOMS),
+        "admin.dashboard.response_times": aggregate("messages", report_queries.dashboard_response_time_pipeline()),
+        "admin.dashboard.rated_rooms": find("chat_rooms", report_queries.RATED_ROOMS),
+        "admin.intent_stats": count("messages", report_queries.classified_messages(WEEK_AGO, NOW)),
+        "admin.intent_stats.pipeline": aggregate("messages", report_queries.intent_statistics_pipeline(WEEK_AGO, NOW)),
+        "admin.ai_performance.messages": count("messages", report_queries.period_messages(WEEK_AGO, NOW)),
+        "admin.ai_performance.ai_messages": count("messages", report_queries.period_messages(WEEK_AGO, NOW, ai_only=True)),
+        "admin.system_config": find("system_config", {"type": "main"}),
+        "admin.export.room": find("messages", *report_queries.export_messages(room_id=ROOM_ID)),
+        "admin.export.period": find("messages", *report_queries.export_messages(date_from=WEEK_AGO, date_to=NOW)),
+        "admin.customer_messages": find("messages", *report_queries.visible_customer_messages(ROOM_ID)),
+        "admin.customers": find("users", report_queries.customers()),
+        "admin.deleted_messages": find("messages", {"room_id": ROOM_ID, "is_deleted": True}),
+        "auth.user_by_username": find("users", {"username": "customer"}),
+        "auth.user_by_email": find("users", {"email": "customer@example.com"}),
+        "ai.feedback_by_room": find("ai_feedback", {"input_room_id": ROOM_ID}),
+        "ai.feedback_by_user": find("ai_feedback", {"user": "admin"}),
+    }
+
+async def seed(db):
+    await db["users"].insert_many([
+        {"_id": CUSTOMER_ID, "username": "customer", "email": "customer@example.com", "name": "Customer", "user_type": "customer"},
+        {"username": "admin", "email": "admin@example.com", "name": "Admin", "user_type": "admin"},
+    ])
+    await db["chat_rooms"].insert_one({
+        "_id": ROOM_ID, "customer_id": ROOM_ID, "status": "active", "created_at": WEEK_AGO,
+        "last_message_at": NOW, "satisfaction_rating": 5, "message_count": len(MESSAGE_IDS), "last_seq": len(MESSAGE_IDS),
+    })
+    messages = []
+    for seq, message_id in enumerate(MESSAGE_IDS, start=1):
+        user_type = "customer" if seq % 2 else "admin"
+        message = {
+            "_id": message_id, "room_id": ROOM_ID, "seq": seq, "user_type": user_type,
+            "user_id": ROOM_ID if user_type == "customer" else "admin",
+            "content": f"order question {seq}", "search_tokens": ["order", "question", str(seq)], "created_at": NOW - timedelta(minutes=len(MESSAGE_IDS) - seq),
+        }
+        if seq > 1:
+            message["intent"] = "inquiry"
+        if user_type == "admin" and seq == 2:
+            message["is_ai_generated"] = True
+        if seq == len(MESSAGE_IDS):
+            message["is_deleted"] = True
+        messages.append(message)
+    await db["messages"].insert_many(messages)
+    await db["intent_history"].insert_one({"message_id": MESSAGE_IDS[1], "room_id": ROOM_ID, "intent": "inquiry", "created_at": NOW})
+    await db["ai_feedback"].insert_one({"input_room_id": ROOM_ID, "user": "admin", "rating": 1})
+    await db["system_config"].insert_one({"type": "main"})
+
+def scanned_stages(plan, path="plan"):
+    """Paths of COLLSCAN stages in an explain document; rejected plans do not count."""
+    found = []
+    if isinstance(plan, dict):
+        if plan.get("stage") == "COLLSCAN":
+            found.append(path)
+        for key, value in plan.items():
+            if key != "rejectedPlans":
+                found.extend(scanned_stages(value, f"{path}.{key}"))
+    elif isinstance(plan, list):
+        for i, value in enumerate(plan):
+            found.extend(scanned_stages(value, f"{path}[{i}]"))
+    return found
+
+def index_names(plan):
+    names = set()
+    if isinstance(plan, dict):
+        if plan.get("indexName"):
+            names.add(plan["indexName"])
+        for key, value in plan.items():
+            if key != "rejectedPlans":
+                names |= index_names(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            names |= index_names(value)
+    return names
+
+async def check(db, verbose=False) -> int:
+    failures = 0
+    for name, (command, full_scan) in queries().items():
+        plan = await db.command("explain", command, verbosity="queryPlanner")
+        scans = scanned_stages(plan)
+        if scans and not full_scan:
+            failures += 1
+            print(f"❌ {name}: collection scan ({', '.join(scans)})")
+        elif scans:
+            print(f"➖ {name}: collection scan allowed ({full_scan})")
+        elif verbose:
+            print(f"✅ {name}: {', '.join(sorted(index_names(plan))) or 'no scan'}")
+    return failures
+
+async def main(args):
+    client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URL)
+    db = client[f"{DATABASE_NAME}_plan_check"]
+    try:
+        await client.drop_database(db.name)
+        await seed(db)
+        report = await reconcile_indexes(db)
+        if report["failed"] or report["conflicts"]:
+            print(f"⚠️ Index reconciliation: {report}")
+        failures = await check(db, args.verbose)
+        total = len(queries())
+        print(f"Checked {total} queries, {failures} with a collection scan")
+        return 1 if failures else 0
+    finally:
+        if not args.keep:
+            await client.drop_database(db.name)
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fail when a hot query's plan is a collection scan")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded database")
+    parser.add_argument("--verbose", action="store_true", help="print the index chosen for every query")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -60,9 +60,11 @@ async def classify_intent_for_old_messages():
     async for msg in cursor:
         msg_id = str(msg['_id'])
         content = msg['content']
-        intent, confidence = ai_service.classify_intent(content)
+        result = ai_service.classify_intent_detailed(content)
+        intent, confidence = result["intent"], result["confidence"]
         # Luôn lưu intent và confidence, không kiểm tra ngưỡng
-        await chat_service.update_message_intent(msg_id, intent, confidence)
+        await chat_service.update_message_intent(msg_id, intent, confidence,
+                                                 model_version=result["model_version"], probs=result["probs"])
         print(f'Updated message {msg_id} with intent {intent} (conf={confidence:.2f})')
         count += 1
     print(f'Done. Updated {count} messages.')
@@ -18,7 +18,7 @@ async def create_admin_user():
     print("🔧 Creating test admin account...")
     
     # Initialize database first
-    await init_db()
+    await init_db(wait_for_indexes=True)
     
     users_collection = get_users_collection()
     
@@ -1,8 +1,11 @@
 import motor.motor_asyncio
 from pymongo import MongoClient
+import asyncio
 import os
 from dotenv import load_dotenv
 
+from database.indexes import reconcile_indexes
+
 load_dotenv()
 
 # MongoDB connection settings
@@ -13,10 +16,16 @@ DATABASE_NAME = os.getenv("DATABASE_NAME", "ai_customer_support")
 client = None
 database = None
 is_connected = False
+# Index reconciliation started by init_db; kept so the task is not garbage-collected mid-build
+index_task = None
 
-async def init_db():
-    """Initialize database connection"""
-    global client, database, is_connected
+async def init_db(wait_for_indexes: bool = True):
+    """
+    Initialize database connection. With wait_for_indexes (scripts) the index reconciliation
+    is awaited: a script that exits while it runs in the background cancels it, and the unique
+    indexes on users may never be built. The app server passes False and builds them in the background.
+    """
+    global client, database, is_connected, index_task
     try:
         client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URL)
         database = client[DATABASE_NAME]
@@ -26,8 +35,11 @@ async def init_db():
         print(f"✅ Connected to MongoDB: {DATABASE_NAME}")
         is_connected = True
         
-        # Create indexes
-        await create_indexes()
+        if wait_for_indexes:
+            await create_indexes()
+        else:
+            # Building an index on a large collection must not hold up server startup
+            index_task = asyncio.create_task(create_indexes())
         
     except Exception as e:
         print(f"⚠️ Warning: Failed to connect to MongoDB: {e}")
@@ -38,41 +50,24 @@ async def init_db():
 async def close_db():
     """Close database connection"""
     global client, is_connected
+    if index_task and not index_task.done():
+        # Builds already sent to the server carry on there; only the reconciliation loop stops
+        index_task.cancel()
     if client and is_connected:
         client.close()
         print("🔌 MongoDB connection closed")
     is_connected = False
 
 async def create_indexes():
-    """Create database indexes for better performance"""
+    """Bring the indexes in line with database/indexes.py; returns the reconciliation report"""
     if not is_connected:
-        return
+        return None
         
     try:
-        # Messages collection indexes
-        await database.messages.create_index("room_id")
-        await database.messages.create_index("timestamp")
-        await database.messages.create_index("user_type")
-        await database.messages.create_index("intent")
-        
-        # Chat rooms collection indexes
-        await database.chat_rooms.create_index("customer_id", unique=True)
-        await database.chat_rooms.create_index("status")
-        await database.chat_rooms.create_index("last_message_at")
-        
-        # Users collection indexes
-        await database.users.create_index("username", unique=True)
-        await database.users.create_index("email", unique=True)
-        await database.users.create_index("user_type")
-        
-        # Analytics collection indexes
-        await database.analytics.create_index("date")
-        await database.analytics.create_index("intent")
-        
-        print("✅ Database indexes created successfully")
-        
+        return await reconcile_indexes(database)
     except Exception as e:
-        print(f"⚠️ Warning: Failed to create some indexes: {e}")
+        print(f"⚠️ Warning: Failed to reconcile indexes: {e}")
+        return None
 
 def get_database():
     """Get database instance"""
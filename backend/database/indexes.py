@@ -0,0 +1,137 @@
+"""
+Declarative index spec: every index the application's queries rely on, per collection.
+
+Startup reconciles the database against it (reconcile_indexes): missing indexes are created,
+indexes that exist but are not listed here are only reported, never dropped, so an index added
+by hand on a production database survives a deploy until someone removes it on purpose.
+check_query_plans.py explains every hot query against these indexes and fails on collection scans;
+when a query changes shape, add its index here and the check goes green again.
+"""
+from typing import Any, Dict, List
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from services import metrics
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "messages": [
+        # History pages: keyset on (created_at, _id) within a room, both directions
+        IndexModel([("room_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)]),
+        # Delta sync: messages of a room after a given seq
+        IndexModel([("room_id", ASCENDING), ("seq", ASCENDING)]),
+        # Unread backfill, last message seen by admin, customer messages of a room, admin replies in analytics
+        IndexModel([("room_id", ASCENDING), ("user_type", ASCENDING), ("created_at", ASCENDING)]),
+        # Message search (services/search.py): newest messages containing a word, overall or in some rooms
+        IndexModel([("search_tokens", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("room_id", ASCENDING), ("search_tokens", ASCENDING), ("created_at", DESCENDING)]),
+        # Deleting a customer: their messages by author
+        IndexModel([("user_id", ASCENDING)]),
+        # Date-range analytics (daily counts, AI usage trends, intent stats of a period)
+        IndexModel([("created_at", ASCENDING)]),
+        # Counts per user_type, dashboard response times
+        IndexModel([("user_type", ASCENDING), ("created_at", ASCENDING)]),
+        # Intent distribution and uncategorized messages ({"intent": {"$exists": False}} scans the null
+        # range of this index: a partial index cannot express $exists: false)
+        IndexModel([("intent", ASCENDING), ("created_at", DESCENDING)]),
+        # Only AI-generated and soft-deleted messages are indexed: both are a small share of the collection
+        IndexModel([("is_ai_generated", ASCENDING), ("created_at", ASCENDING)],
+                   name="ai_generated_by_date", partialFilterExpression={"is_ai_generated": True}),
+        IndexModel([("room_id", ASCENDING), ("created_at", ASCENDING)],
+                   name="deleted_by_room", partialFilterExpression={"is_deleted": True}),
+    ],
+    "chat_rooms": [
+        IndexModel([("customer_id", ASCENDING)], unique=True),
+        # Admin room list: rooms of a status, most recent first
+        IndexModel([("status", ASCENDING), ("last_message_at", DESCENDING)]),
+        # Customer behaviour analytics: rooms opened in a period
+        IndexModel([("created_at", ASCENDING)]),
+        # Dashboard satisfaction rate: only rated rooms are indexed
+        IndexModel([("satisfaction_rating", ASCENDING)],
+                   name="rated_rooms", partialFilterExpression={"satisfaction_rating": {"$exists": True}}),
+    ],
+    "users": [
+        IndexModel([("username", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("user_type", ASCENDING)]),
+    ],
+    "intent_history": [
+        IndexModel([("message_id", ASCENDING), ("created_at", ASCENDING)]),
+        IndexModel([("room_id", ASCENDING), ("created_at", ASCENDING)]),
+    ],
+    "ai_feedback": [
+        IndexModel([("input_room_id", ASCENDING)]),
+        IndexModel([("user", ASCENDING)]),
+    ],
+    "analytics": [
+        IndexModel([("date", ASCENDING)]),
+        IndexModel([("intent", ASCENDING)]),
+    ],
+    "system_config": [
+        IndexModel([("type", ASCENDING)]),
+    ],
+}
+
+# Options that make two indexes on the same keys different indexes
+_COMPARED_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+
+# Result of the last reconciliation on this worker, exposed in the admin metrics endpoint
+last_report: Dict[str, Any] = {}
+
+def _signature(index: Dict[str, Any]):
+    keys = tuple((field, int(direction) if isinstance(direction, (int, float)) else direction)
+                 for field, direction in index["key"].items())
+    options = tuple((option, repr(_plain(index[option]))) for option in _COMPARED_OPTIONS
+                    if index.get(option) not in (None, False))
+    return keys, options
+
+def _plain(value):
+    """SON/dict from the server and dicts from the spec compare equal once both are plain dicts."""
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    return value
+
+async def reconcile_indexes(db, spec: Dict[str, List[IndexModel]] = INDEXES) -> Dict[str, Any]:
+    """
+    Creates the indexes of `spec` that are missing and reports the ones the database has beyond it.
+    Returns {"created", "extra", "conflicts", "failed"} as lists of "collection.index_name".
+    """
+    report = {"created": [], "extra": [], "conflicts": [], "failed": []}
+    for collection_name, models in spec.items():
+        collection = db[collection_name]
+        existing = {index["name"]: index async for index in collection.list_indexes()}
+        existing_signatures = {_signature(index): name for name, index in existing.items()}
+        wanted_signatures = set()
+        for model in models:
+            document = model.document
+            signature = _signature(document)
+            wanted_signatures.add(signature)
+            if signature in existing_signatures:
+                continue
+            name = document["name"]
+            if name in existing:
+                # Same name, different keys or options: needs a manual drop, never done automatically
+                report["conflicts"].append(f"{collection_name}.{name}")
+                continue
+            try:
+                # background=True only matters before MongoDB 4.2; newer servers always build without
+                # holding the collection lock for the whole build
+                await collection.create_index(list(document["key"].items()), background=True,
+                                              **{k: v for k, v in document.items() if k not in ("key", "background")})
+                report["created"].append(f"{collection_name}.{name}")
+            except Exception as e:
+                print(f"⚠️ Warning: Failed to create index {collection_name}.{name}: {e}")
+                report["failed"].append(f"{collection_name}.{name}")
+        for signature, name in existing_signatures.items():
+            if name != "_id_" and signature not in wanted_signatures:
+                report["extra"].append(f"{collection_name}.{name}")
+
+    if report["created"]:
+        print(f"✅ Created indexes: {', '.join(report['created'])}")
+    if report["extra"]:
+        print(f"ℹ️ Indexes not in database/indexes.py (left in place): {', '.join(report['extra'])}")
+    if report["conflicts"]:
+        print(f"⚠️ Indexes differing from database/indexes.py (drop them to rebuild): {', '.join(report['conflicts'])}")
+    last_report.clear()
+    last_report.update(report)
+    return report
+
+metrics.register("indexes", lambda: dict(last_report))
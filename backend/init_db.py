@@ -3,7 +3,7 @@ import os
 from datetime import datetime
 from passlib.context import CryptContext
 from database.connection import init_db, get_users_collection, get_system_config_collection
-from models.schemas import UserType, ResponseStyle
+from models.schemas import UserType, ResponseStyle, default_decoding_profiles, default_rate_limits, default_suggest_versions
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -12,7 +12,7 @@ async def create_default_admin():
     """Create default admin user"""
     try:
         # Initialize database
-        await init_db()
+        await init_db(wait_for_indexes=True)
         
         users_collection = get_users_collection()
         
@@ -58,6 +58,9 @@ async def create_default_config():
             "max_response_length": 500,
             "ai_confidence_threshold": 0.7,
             "response_style_default": ResponseStyle.FRIENDLY.value,
+            "decoding_profiles": {style: profile.model_dump() for style, profile in default_decoding_profiles().items()},
+            "rate_limits": default_rate_limits().model_dump(),
+            "suggest_versions": default_suggest_versions(),
             "created_at": datetime.utcnow(),
             "updated_at": datetime.utcnow()
         }
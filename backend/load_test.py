@@ -0,0 +1,405 @@
+"""
+Socket.IO load test: simulated customers and admins against a running backend.
+
+Start the backend against a local MongoDB with stub inference (no model files needed):
+    AI_STUB_INFERENCE=1 uvicorn app:app --port 8000
+then, from the backend directory and with the same .env (SECRET_KEY, MONGO_URL):
+    python load_test.py --customers 200 --admins 5 --duration 60
+
+Each customer connects, joins its room and sends messages (preceded by a burst of
+typing events) at random intervals; each admin watches a share of the rooms, sends
+'seen' and sometimes replies. Load-test users are named loadtest_*; remove them and
+their rooms/messages with --cleanup.
+
+Reported: connect rate and latency, message round trip (customer sees its own
+message) and fan-out latency (admin sees a customer message), server event-loop lag
+(from /api/admin/metrics), MongoDB operations per message (serverStatus opcounters) and
+the rate_limited events the clients received.
+
+Rate limits: the default socket limits (join_room, seen, send_message...) reject much of
+this traffic, so the run measures rejections rather than throughput. By default the script
+sets system_config.rate_limits.enabled to false for the run and restores it afterwards; a
+backend already running picks the change up within CONFIG_TTL_SECONDS, which the script
+waits out. Pass --keep-rate-limits to load the backend with its limits on.
+
+Worker scaling: with --workers the script starts the backend itself (uvicorn --workers N,
+stub inference, SOCKETIO_MESSAGE_QUEUE from the environment) once per worker count and
+runs the same load against each, then prints connections/s, how close that is to linear
+scaling from the first count, and p95 connect / round-trip / fan-out latency per count:
+    SOCKETIO_MESSAGE_QUEUE=redis://localhost:6379/0 python load_test.py --workers 1,2,4 \\
+        --customers 1000 --duration 30 --results scaling.json
+Use enough customers that one worker is saturated, and a load generator on another machine
+(or with spare cores) so the client is not the bottleneck.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import httpx
+import socketio
+from jose import jwt
+from pymongo import ReturnDocument
+
+from database.connection import init_db, close_db, get_database, get_client
+from models.schemas import default_rate_limits
+from services.chat_service import ChatService
+from services.config_service import CONFIG_TTL_SECONDS
+from services.token_service import SECRET_KEY, ALGORITHM
+
+USER_PREFIX = "loadtest_"
+# Messages carry their send time so any receiver can compute the latency
+MARKER = "[lt "
+# Same namespaces as the frontends
+ADMIN_NAMESPACE = "/admin"
+CUSTOMER_NAMESPACE = "/customer"
+
+def percentiles(samples, points=(50, 90, 99)):
+    if not samples:
+        return {f"p{p}": None for p in points}
+    samples = sorted(samples)
+    result = {f"p{p}": round(samples[min(len(samples) - 1, int(len(samples) * p / 100))], 1) for p in points}
+    result["max"] = round(samples[-1], 1)
+    return result
+
+def make_token(user_id: str) -> str:
+    expire = datetime.utcnow() + timedelta(hours=2)
+    return jwt.encode({"sub": user_id, "exp": expire}, SECRET_KEY, algorithm=ALGORITHM)
+
+def latency_ms(content: str):
+    """Milliseconds since the send time embedded in a load-test message, or None."""
+    if not isinstance(content, str) or not content.startswith(MARKER):
+        return None
+    try:
+        sent_at = float(content[len(MARKER):content.index("]")])
+    except ValueError:
+        return None
+    return (time.time() - sent_at) * 1000
+
+class Stats:
+    def __init__(self):
+        self.connect_ms = []
+        self.connect_failed = 0
+        self.sent = 0
+        self.round_trip_ms = []
+        self.fan_out_ms = []
+        self.errors = 0
+        # rate_limited events received, per rejected event (typing events are rejected silently)
+        self.rate_limited = {}
+
+async def ensure_users(db, kind: str, count: int):
+    """Creates (or reuses) load-test users and returns their ids."""
+    ids = []
+    for i in range(count):
+        username = f"{USER_PREFIX}{kind}_{i}"
+        user = await db["users"].find_one_and_update(
+            {"username": username},
+            {"$setOnInsert": {"username": username, "name": f"Load {kind} {i}", "user_type": kind,
+                              "hashed_password": "", "created_at": datetime.utcnow()}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        ids.append(str(user["_id"]))
+    return ids
+
+async def cleanup(db):
+    users = await db["users"].find({"username": {"$regex": f"^{USER_PREFIX}"}}, {"_id": 1}).to_list(length=None)
+    ids = [str(u["_id"]) for u in users]
+    messages = await db["messages"].delete_many({"room_id": {"$in": ids}})
+    await db["intent_history"].delete_many({"room_id": {"$in": ids}})
+    rooms = await db["chat_rooms"].delete_many({"_id": {"$in": ids}})
+    await db["users"].delete_many({"_id": {"$in": [u["_id"] for u in users]}})
+    print(f"Removed {len(ids)} users, {rooms.deleted_count} rooms, {messages.deleted_count} messages")
+
+async def disable_rate_limits(db):
+    """Turns the rate limits off for the run; returns what restore_rate_limits needs."""
+    config = await db["system_config"].find_one({"type": "main"}, {"rate_limits": 1}) or {}
+    original = config.get("rate_limits")
+    # A config without rate_limits runs on the defaults: keep their policies, only switch them off
+    rate_limits = dict(original) if original is not None else default_rate_limits().model_dump()
+    rate_limits["enabled"] = False
+    await db["system_config"].update_one({"type": "main"}, {"$set": {"rate_limits": rate_limits}}, upsert=True)
+    return original
+
+async def restore_rate_limits(db, original):
+    if original is None:
+        await db["system_config"].update_one({"type": "main"}, {"$unset": {"rate_limits": ""}})
+    else:
+        await db["system_config"].update_one({"type": "main"}, {"$set": {"rate_limits": original}})
+
+async def opcounters(db):
+    status = await get_client().admin.command("serverStatus")
+    return dict(status["opcounters"])
+
+async def connect(url: str, namespace: str, token: str, stats: Stats, semaphore: asyncio.Semaphore):
+    client = socketio.AsyncClient(reconnection=False)
+
+    @client.on("rate_limited", namespace=namespace)
+    async def on_rate_limited(data):
+        event = (data or {}).get("event", "?")
+        stats.rate_limited[event] = stats.rate_limited.get(event, 0) + 1
+
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            await client.connect(url, auth={"token": token}, transports=["websocket"], namespaces=[namespace])
+        except Exception:
+            stats.connect_failed += 1
+            return None
+        stats.connect_ms.append((time.perf_counter() - start) * 1000)
+    return client
+
+async def run_customer(client, customer_id: str, args, stats: Stats, stop: asyncio.Event):
+    @client.on("new_message", namespace=CUSTOMER_NAMESPACE)
+    async def on_new_message(message):
+        if isinstance(message, dict) and message.get("user_id") == customer_id:
+            ms = latency_ms(message.get("content"))
+            if ms is not None:
+                stats.round_trip_ms.append(ms)
+
+    await client.emit("join_room", {"room_id": customer_id, "user_id": customer_id, "user_type": "customer"},
+                      namespace=CUSTOMER_NAMESPACE)
+    # Spread the first messages instead of sending them all at once
+    await asyncio.sleep(random.uniform(0, args.message_interval))
+    while not stop.is_set():
+        try:
+            for _ in range(args.typing_events):
+                await client.emit("typing", {"room_id": customer_id, "user_id": customer_id, "user_type": "customer"},
+                                  namespace=CUSTOMER_NAMESPACE)
+                await asyncio.sleep(0.1)
+            content = f"{MARKER}{time.time():.6f}] load test message {stats.sent}"
+            await client.emit("send_message", {"room_id": customer_id, "content": content}, namespace=CUSTOMER_NAMESPACE)
+            await client.emit("stop_typing", {"room_id": customer_id, "user_id": customer_id, "user_type": "customer"},
+                              namespace=CUSTOMER_NAMESPACE)
+            stats.sent += 1
+        except Exception:
+            stats.errors += 1
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=random.expovariate(1 / args.message_interval))
+        except asyncio.TimeoutError:
+            pass
+
+async def run_admin(client, admin_id: str, room_ids, args, stats: Stats, stop: asyncio.Event):
+    @client.on("new_message", namespace=ADMIN_NAMESPACE)
+    async def on_new_message(message):
+        if not isinstance(message, dict) or message.get("user_type") != "customer":
+            return
+        ms = latency_ms(message.get("content"))
+        if ms is not None:
+            stats.fan_out_ms.append(ms)
+        room_id = message.get("room_id")
+        await client.emit("seen", {"room_id": room_id, "user_id": admin_id, "user_type": "admin",
+                                   "last_message_id": message.get("_id")}, namespace=ADMIN_NAMESPACE)
+        if random.random() < args.admin_reply_rate:
+            await client.emit("send_message", {"room_id": room_id, "content": f"admin reply {stats.sent}"},
+                              namespace=ADMIN_NAMESPACE)
+            stats.sent += 1
+
+    for room_id in room_ids:
+        await client.emit("join_room", {"room_id": room_id, "user_id": admin_id, "user_type": "admin"},
+                          namespace=ADMIN_NAMESPACE)
+    await stop.wait()
+
+async def fetch_server_metrics(url: str, admin_token: str):
+    try:
+        async with httpx.AsyncClient(timeout=10) as http:
+            response = await http.get(f"{url}/api/admin/metrics", headers={"Authorization": f"Bearer {admin_token}"})
+            response.raise_for_status()
+            return response.json()
+    except Exception as e:
+        print(f"⚠️ Could not read /api/admin/metrics: {e}")
+        return {}
+
+async def run_round(args, url, db, customer_ids, admin_ids):
+    """One connect + traffic phase against `url`; returns its measurements."""
+    stats = Stats()
+    stop = asyncio.Event()
+    semaphore = asyncio.Semaphore(args.connect_concurrency)
+    ops_before = await opcounters(db)
+
+    print(f"🔌 Connecting to {url}...")
+    connect_start = time.perf_counter()
+    customer_clients = await asyncio.gather(*(connect(url, CUSTOMER_NAMESPACE, make_token(cid), stats, semaphore) for cid in customer_ids))
+    admin_clients = await asyncio.gather(*(connect(url, ADMIN_NAMESPACE, make_token(aid), stats, semaphore) for aid in admin_ids[:args.admins]))
+    connect_seconds = time.perf_counter() - connect_start
+
+    tasks = []
+    for client, customer_id in zip(customer_clients, customer_ids):
+        if client:
+            tasks.append(asyncio.create_task(run_customer(client, customer_id, args, stats, stop)))
+    for i, (client, admin_id) in enumerate(zip(admin_clients, admin_ids)):
+        if client:
+            # Admins split the rooms between them
+            rooms = customer_ids[i::max(args.admins, 1)]
+            tasks.append(asyncio.create_task(run_admin(client, admin_id, rooms, args, stats, stop)))
+
+    print(f"💬 Running for {args.duration}s...")
+    await asyncio.sleep(args.duration)
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    # Let in-flight messages arrive before measuring
+    await asyncio.sleep(2)
+
+    ops_after = await opcounters(db)
+    server_metrics = await fetch_server_metrics(url, make_token(admin_ids[0]))
+    for client in (*customer_clients, *admin_clients):
+        if client:
+            await client.disconnect()
+    ops = {name: ops_after.get(name, 0) - ops_before.get(name, 0) for name in ops_before}
+    return {"stats": stats, "connect_seconds": connect_seconds, "ops": ops, "server_metrics": server_metrics}
+
+def print_report(result, args):
+    stats, connect_seconds, ops, server_metrics = result["stats"], result["connect_seconds"], result["ops"], result["server_metrics"]
+    connected = len(stats.connect_ms)
+    total_ops = sum(ops.values())
+    print("\n===== Load test report =====")
+    print(f"Connections:   {connected} ok, {stats.connect_failed} failed in {connect_seconds:.1f}s "
+          f"({connected / connect_seconds:.1f}/s), connect ms {percentiles(stats.connect_ms)}")
+    print(f"Messages sent: {stats.sent} ({stats.sent / args.duration:.1f}/s), send errors: {stats.errors}")
+    print(f"Round trip ms: {percentiles(stats.round_trip_ms)} over {len(stats.round_trip_ms)} messages")
+    print(f"Fan-out ms:    {percentiles(stats.fan_out_ms)} over {len(stats.fan_out_ms)} deliveries to admins")
+    print(f"Rate limited:  {sum(stats.rate_limited.values())} events {stats.rate_limited}")
+    print(f"Event loop:    {server_metrics.get('event_loop', 'n/a')}")
+    print(f"Mongo ops:     {ops}")
+    print(f"Mongo ops per message sent: {total_ops / stats.sent:.1f}" if stats.sent else "Mongo ops per message sent: n/a")
+    for name in ("namespaces", "typing", "room_updated", "intent_classified", "wire", "rate_limit"):
+        if name in server_metrics:
+            print(f"{name}: {server_metrics[name]}")
+
+def start_server(workers: int, port: int):
+    """uvicorn with `workers` processes and stub inference, from this directory and environment."""
+    env = dict(os.environ, AI_STUB_INFERENCE="1")
+    command = [sys.executable, "-m", "uvicorn", "app:app", "--workers", str(workers), "--port", str(port)]
+    return subprocess.Popen(command, env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+async def wait_ready(url: str, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=2) as http:
+        while time.monotonic() < deadline:
+            try:
+                if (await http.get(f"{url}/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    raise RuntimeError(f"Backend at {url} did not become ready within {timeout:.0f}s")
+
+async def sweep(args, db, customer_ids, admin_ids):
+    """Runs one round per worker count against a backend started here, and tabulates the scaling."""
+    url = f"http://127.0.0.1:{args.port}"
+    rows = []
+    for workers in args.workers:
+        print(f"\n🚀 Starting backend with {workers} worker(s) on port {args.port}...")
+        process = start_server(workers, args.port)
+        try:
+            await wait_ready(url)
+            # /health answers as soon as one worker is up; give the others time to start
+            await asyncio.sleep(args.warmup)
+            result = await run_round(args, url, db, customer_ids, admin_ids)
+        finally:
+            stop_server(process)
+        stats = result["stats"]
+        connected = len(stats.connect_ms)
+        rows.append({
+            "workers": workers,
+            "connected": connected,
+            "connect_failed": stats.connect_failed,
+            "connects_per_s": round(connected / result["connect_seconds"], 1),
+            "connect_ms": percentiles(stats.connect_ms, (50, 95)),
+            "round_trip_ms": percentiles(stats.round_trip_ms, (50, 95)),
+            "fan_out_ms": percentiles(stats.fan_out_ms, (50, 95)),
+            "messages_sent": stats.sent,
+            "rate_limited": dict(stats.rate_limited),
+        })
+
+    base = rows[0]["connects_per_s"] / rows[0]["workers"] if rows and rows[0]["connects_per_s"] else None
+    print("\n===== Worker scaling =====")
+    print(f"{'workers':>7} {'conn ok':>8} {'failed':>6} {'conn/s':>8} {'linear':>7} {'conn p95':>9} {'rtt p95':>8} {'fan-out p95':>12} {'limited':>8}")
+    for row in rows:
+        # Share of perfectly linear scaling from the first worker count (1.0 = linear)
+        row["linearity"] = round(row["connects_per_s"] / (base * row["workers"]), 2) if base else None
+        print(f"{row['workers']:>7} {row['connected']:>8} {row['connect_failed']:>6} {row['connects_per_s']:>8} "
+              f"{str(row['linearity']):>7} {str(row['connect_ms']['p95']):>9} {str(row['round_trip_ms']['p95']):>8} "
+              f"{str(row['fan_out_ms']['p95']):>12} {sum(row['rate_limited'].values()):>8}")
+    if args.results:
+        with open(args.results, "w", encoding="utf-8") as f:
+            json.dump({"customers": args.customers, "admins": args.admins, "duration": args.duration,
+                       "run_at": datetime.utcnow().isoformat(), "rows": rows}, f, indent=2)
+        print(f"📝 Results written to {args.results}")
+
+async def main(args):
+    await init_db()
+    db = get_database()
+    if args.cleanup:
+        await cleanup(db)
+        await close_db()
+        return
+    if args.workers and max(args.workers) > 1 and not os.getenv("SOCKETIO_MESSAGE_QUEUE"):
+        print("❌ Several workers need SOCKETIO_MESSAGE_QUEUE (Redis) so events reach sockets on every worker")
+        await close_db()
+        return
+
+    print(f"🔧 Preparing {args.customers} customers and {args.admins} admins...")
+    customer_ids = await ensure_users(db, "customer", args.customers)
+    admin_ids = await ensure_users(db, "admin", max(args.admins, 1))
+    chat_service = ChatService(db)
+    for customer_id in customer_ids:
+        await chat_service.create_room(customer_id, f"Load customer {customer_id[-6:]}")
+
+    original_rate_limits = None
+    if not args.keep_rate_limits:
+        original_rate_limits = await disable_rate_limits(db)
+        print("🔓 Rate limits disabled for the run (--keep-rate-limits to keep them)")
+    try:
+        if args.workers:
+            # The backend is started after the change and reads it at startup
+            await sweep(args, db, customer_ids, admin_ids)
+        else:
+            if not args.keep_rate_limits:
+                print(f"⏳ Waiting {CONFIG_TTL_SECONDS}s for the running backend to reload system_config...")
+                await asyncio.sleep(CONFIG_TTL_SECONDS)
+            print_report(await run_round(args, args.url, db, customer_ids, admin_ids), args)
+    finally:
+        if not args.keep_rate_limits:
+            await restore_rate_limits(db, original_rate_limits)
+            print("🔒 Rate limits restored")
+        await close_db()
+
+def worker_counts(value: str):
+    return [int(count) for count in value.split(",") if count.strip()]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Socket.IO load test with simulated customers and admins")
+    parser.add_argument("--url", default=os.getenv("LOAD_TEST_URL", "http://localhost:8000"))
+    parser.add_argument("--customers", type=int, default=50)
+    parser.add_argument("--admins", type=int, default=3)
+    parser.add_argument("--duration", type=float, default=60, help="seconds of traffic after connecting")
+    parser.add_argument("--message-interval", type=float, default=5, help="mean seconds between a customer's messages")
+    parser.add_argument("--typing-events", type=int, default=5, help="typing events sent before each message")
+    parser.add_argument("--admin-reply-rate", type=float, default=0.3, help="share of customer messages an admin answers")
+    parser.add_argument("--connect-concurrency", type=int, default=50, help="handshakes in flight at once")
+    parser.add_argument("--workers", type=worker_counts, help="comma-separated worker counts to sweep, e.g. 1,2,4 (starts the backend itself)")
+    parser.add_argument("--port", type=int, default=8100, help="port of the backend started by --workers")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds to wait after the backend answers before connecting")
+    parser.add_argument("--results", help="JSON file to record the --workers sweep in")
+    parser.add_argument("--keep-rate-limits", action="store_true", help="leave system_config.rate_limits as is instead of disabling them for the run")
+    parser.add_argument("--cleanup", action="store_true", help="delete load-test users, rooms and messages, then exit")
+    asyncio.run(main(parser.parse_args()))
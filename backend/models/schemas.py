@@ -45,6 +45,10 @@ class IntentType(str, Enum):
     ORDER_STATUS = "order_status"
     TECHNICAL_SUPPORT = "technical_support"
 
+# intent_model_version recorded on messages whose intent was set by a person;
+# such labels are reused as-is instead of being re-inferred.
+MANUAL_INTENT_VERSION = "manual"
+
 class ResponseStyle(str, Enum):
     FORMAL = "formal"
     FRIENDLY = "friendly"
@@ -145,11 +149,68 @@ class ConversationSearch(BaseModel):
     date_to: Optional[datetime] = None
     limit: int = Field(default=50, ge=1, le=100)
 
+class DecodingProfile(BaseModel):
+    """Generation settings for one suggestion style."""
+    max_words: int = Field(..., ge=1)
+    max_new_tokens: Optional[int] = Field(default=None, ge=1)  # None = derived from max_words
+    do_sample: bool = True
+    top_k: int = 30
+    top_p: float = 0.95
+    temperature: float = 1.0
+    num_beams: int = Field(default=1, ge=1)
+    max_attempts: int = Field(default=5, ge=1)
+    deadline_ms: int = Field(default=3000, ge=50)  # wall-clock budget for the whole call
+
+# Suggestion model versions offered next to the default one (the admin AI panel's "v1.01 (Beta)")
+def default_suggest_versions() -> List[str]:
+    return ["v1.01"]
+
+def default_decoding_profiles() -> Dict[str, DecodingProfile]:
+    return {
+        "simple": DecodingProfile(max_words=25, deadline_ms=1500),
+        "friendly": DecodingProfile(max_words=50, deadline_ms=2500),
+        "formal": DecodingProfile(max_words=70, deadline_ms=3000),
+    }
+
+class RateLimitPolicy(BaseModel):
+    """Token bucket: up to `burst` calls at once, refilled at `rate_per_second`."""
+    rate_per_second: float = Field(..., gt=0)
+    burst: int = Field(..., ge=1)
+
+class RateLimitConfig(BaseModel):
+    enabled: bool = True
+    # "METHOD /path/{param}" -> policy; "*" applies to every other request
+    http: Dict[str, RateLimitPolicy] = Field(default_factory=dict)
+    # Socket.IO event name -> policy; "*" applies to every other event
+    socket: Dict[str, RateLimitPolicy] = Field(default_factory=dict)
+
+def default_rate_limits() -> RateLimitConfig:
+    return RateLimitConfig(
+        http={
+            "POST /api/ai/suggest": RateLimitPolicy(rate_per_second=0.5, burst=5),
+            "POST /api/public/rooms/{room_id}/messages": RateLimitPolicy(rate_per_second=1, burst=10),
+            "*": RateLimitPolicy(rate_per_second=20, burst=60),
+        },
+        socket={
+            "send_message": RateLimitPolicy(rate_per_second=1, burst=10),
+            "typing": RateLimitPolicy(rate_per_second=5, burst=10),
+            "stop_typing": RateLimitPolicy(rate_per_second=5, burst=10),
+            "seen": RateLimitPolicy(rate_per_second=2, burst=10),
+            "*": RateLimitPolicy(rate_per_second=10, burst=30),
+        },
+    )
+
 class SystemConfig(BaseModel):
     auto_reply_enabled: bool = True
     max_response_length: int = 500
     ai_confidence_threshold: float = 0.7
     response_style_default: ResponseStyle = ResponseStyle.FRIENDLY
+    decoding_profiles: Dict[str, DecodingProfile] = Field(default_factory=default_decoding_profiles)
+    # Desired model version per kind ("intent", "suggest"); workers hot-swap to it. Empty = built-in default
+    model_versions: Dict[str, str] = Field(default_factory=dict)
+    # Other suggestion model versions a request may ask for with model_version (e.g. to compare versions)
+    suggest_versions: List[str] = Field(default_factory=default_suggest_versions)
+    rate_limits: RateLimitConfig = Field(default_factory=default_rate_limits)
 
 # Analytics schemas
 class IntentStats(BaseModel):
@@ -253,6 +314,7 @@ class IntentHistory(BaseModel):
     intent: IntentType
     confidence: float
     classified_by: str  # 'ai' hoặc username nếu do người sửa
+    model_version: Optional[str] = None  # intent model version when classified_by == 'ai'
     created_at: datetime = Field(default_factory=datetime.utcnow)
     note: Optional[str] = None
 
@@ -0,0 +1,99 @@
+"""
+Rebuilds the counters kept on chat_rooms from the messages collection:
+message_count, ai_message_count, intent_counts, dominant_intent, unread_count and last_seq.
+Soft-deleted messages (is_deleted) are not counted, as the delete endpoint takes them out;
+last_seq still covers them, since their numbers were handed out.
+
+They are maintained at write time (save_message, update_message_intent, mark-read);
+run this after restoring a backup, deleting messages by hand, or if they ever drift:
+    python rebuild_room_stats.py               # every room
+    python rebuild_room_stats.py --room <id>   # some rooms
+    python rebuild_room_stats.py --dry-run     # only report rooms whose counters differ
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from database.connection import init_db, close_db, get_database
+from services.chat_service import ChatService
+
+# Messages the counters include: everything but soft-deleted messages
+COUNTED = {"is_deleted": {"$ne": True}}
+
+COUNTER_FIELDS = ("message_count", "ai_message_count", "intent_counts", "dominant_intent", "unread_count", "last_seq")
+
+async def message_totals(db, match):
+    """room_id: {message_count, ai_message_count, last_seq} in one aggregation."""
+    counted = {"$ne": ["$is_deleted", True]}
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": "$room_id",
+            "message_count": {"$sum": {"$cond": [counted, 1, 0]}},
+            "ai_message_count": {"$sum": {"$cond": [{"$and": [counted, {"$eq": ["$is_ai_generated", True]}]}, 1, 0]}},
+            "last_seq": {"$max": "$seq"},
+        }},
+    ]
+    return {doc["_id"]: doc async for doc in db["messages"].aggregate(pipeline)}
+
+async def intent_histograms(db, match):
+    """room_id: {intent: count} in one aggregation."""
+    pipeline = [
+        {"$match": {**match, **COUNTED, "intent": {"$ne": None}}},
+        {"$group": {"_id": {"room_id": "$room_id", "intent": "$intent"}, "count": {"$sum": 1}}},
+    ]
+    histograms = {}
+    async for doc in db["messages"].aggregate(pipeline):
+        histograms.setdefault(doc["_id"]["room_id"], {})[doc["_id"]["intent"]] = doc["count"]
+    return histograms
+
+async def rebuild(db, room_ids=None, dry_run=False):
+    match = {"room_id": {"$in": room_ids}} if room_ids else {}
+    totals = await message_totals(db, match)
+    histograms = await intent_histograms(db, match)
+
+    room_filter = {"_id": {"$in": room_ids}} if room_ids else {}
+    checked = changed = 0
+    async for room in db["chat_rooms"].find(room_filter):
+        checked += 1
+        room_id = room["_id"]
+        total = totals.get(room_id, {})
+        intent_counts = histograms.get(room_id, {})
+        unread_query = ChatService.unread_query(room_id, room.get("admin_last_read_at"))
+        counters = {
+            "message_count": total.get("message_count", 0),
+            "ai_message_count": total.get("ai_message_count", 0),
+            "intent_counts": intent_counts,
+            "dominant_intent": max(intent_counts, key=intent_counts.get) if intent_counts else None,
+            "unread_count": await db["messages"].count_documents(unread_query),
+            # Never move the sequence backwards: clients may already hold higher numbers
+            "last_seq": max(room.get("last_seq") or 0, total.get("last_seq") or 0),
+        }
+        if all(room.get(field) == counters[field] for field in COUNTER_FIELDS):
+            continue
+        changed += 1
+        drift = {field: (room.get(field), counters[field]) for field in COUNTER_FIELDS if room.get(field) != counters[field]}
+        print(f"{room_id}: {drift}")
+        if not dry_run:
+            await db["chat_rooms"].update_one({"_id": room_id}, {"$set": counters})
+    action = "would be rebuilt" if dry_run else "rebuilt"
+    print(f"Checked {checked} rooms, {changed} {action}")
+
+async def main(args):
+    await init_db()
+    try:
+        await rebuild(get_database(), args.room, args.dry_run)
+    finally:
+        await close_db()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild per-room statistics counters from messages")
+    parser.add_argument("--room", action="append", help="room id to rebuild (repeatable); default: every room")
+    parser.add_argument("--dry-run", action="store_true", help="report differences without writing")
+    asyncio.run(main(parser.parse_args()))
@@ -1,37 +1,38 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Body, Path
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, status, Body, Path, BackgroundTasks, Response
+from typing import List, Optional, Dict
 from datetime import datetime, timedelta
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+import os
 
-from models.schemas import AdminDashboard, SystemConfig, UserType, User, UserUpdate, IntentHistory
-from services.chat_service import get_chat_service, ChatService
-from services.ai_service import AIService, IntentHistoryService
+from models.schemas import AdminDashboard, SystemConfig, UserType, User, UserUpdate, IntentHistory, DecodingProfile, RateLimitConfig
+from services.chat_service import get_chat_service, ChatService, MESSAGE_PROJECTION, ACTIVE_ROOMS
+from services.ai_service import AIService, IntentHistoryService, model_path
+from services.config_service import get_runtime_config
 from routes.auth import get_current_user, get_current_admin_user
 from database.connection import get_analytics_collection, get_system_config_collection, get_database, get_users_collection
 from services.token_service import verify_admin_access
+from services.identity_cache import get_identity_cache
+from services.rate_limit import rate_limiter
+from services.pagination import DEFAULT_PAGE_SIZE, InvalidCursor, set_cursor_headers
+from services import metrics, report_queries
+from socketio_instance import schedule_room_update, presence
 
 router = APIRouter()
 
 @router.get("/dashboard", response_model=AdminDashboard, dependencies=[Depends(verify_admin_access)])
 async def get_dashboard(chat_service: ChatService = Depends(get_chat_service)):
     # Lấy tổng số room
-    total_chats = await chat_service.chat_rooms.count_documents({})
+    total_chats = await chat_service.chat_rooms.estimated_document_count()
     # Lấy số room đang active
-    active_chats = await chat_service.chat_rooms.count_documents({"status": "active"})
+    active_chats = await chat_service.chat_rooms.count_documents(ACTIVE_ROOMS)
     # Lấy số room đã resolved/closed
-    resolved_chats = await chat_service.chat_rooms.count_documents({"status": {"$in": ["resolved", "closed"]}})
+    resolved_chats = await chat_service.chat_rooms.count_documents(report_queries.RESOLVED_ROOMS)
     # Tính avg response time (phút)
-    pipeline = [
-        {"$match": {"user_type": {"$in": ["admin", "customer"]}}},
-        {"$sort": {"room_id": 1, "created_at": 1}},
-        {"$group": {
-            "_id": "$room_id",
-            "messages": {"$push": {"user_type": "$user_type", "created_at": "$created_at"}}
-        }}
-    ]
+    pipeline = report_queries.dashboard_response_time_pipeline()
     response_times = []
     async for room in chat_service.messages.aggregate(pipeline):
         msgs = room["messages"]
@@ -45,7 +46,7 @@ async def get_dashboard(chat_service: ChatService = Depends(get_chat_service)):
                         response_times.append(diff)
     avg_response_time = round(sum(response_times)/len(response_times), 1) if response_times else 0
     # Satisfaction rate: trung bình satisfaction_rating các room (nếu có)
-    cursor = chat_service.chat_rooms.find({"satisfaction_rating": {"$exists": True}})
+    cursor = chat_service.chat_rooms.find(report_queries.RATED_ROOMS)
     ratings = []
     async for room in cursor:
         if room.get("satisfaction_rating") is not None:
@@ -63,18 +64,18 @@ async def get_dashboard(chat_service: ChatService = Depends(get_chat_service)):
 async def get_customers(current_user: dict = Depends(verify_admin_access), chat_service: ChatService = Depends(get_chat_service)):
     """Get list of all customers with their chat statistics"""
     try:
-        rooms = await chat_service.get_active_chat_rooms()
+        rooms = await chat_service.get_active_rooms()
         customers = []
         
         for room in rooms:
-            # Get customer statistics
-            stats = await chat_service.get_chat_statistics(room["_id"])
+            # Statistics come from the counters on the room document
+            stats = ChatService.room_statistics(room)
             
             customer_info = {
                 "customer_id": room["customer_id"],
                 "customer_name": room["customer_name"],
                 "room_id": room["_id"],
-                "message_count": stats["message_count"],
+                "message_count": room.get("message_count", 0),
                 "last_activity": room.get("last_message_at"),
                 "status": room["status"],
                 "ai_usage_percentage": stats["ai_usage_percentage"]
@@ -104,32 +105,13 @@ async def get_intent_statistics(
         start_date = end_date - timedelta(days=days)
         
         # Aggregate intent statistics
-        pipeline = [
-            {
-                "$match": {
-                    "created_at": {"$gte": start_date, "$lte": end_date},
-                    "intent": {"$ne": None}
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$intent",
-                    "count": {"$sum": 1}
-                }
-            },
-            {
-                "$sort": {"count": -1}
-            }
-        ]
+        pipeline = report_queries.intent_statistics_pipeline(start_date, end_date)
         
         messages_collection = chat_service.messages
         intent_stats = []
         
         # Get total messages in the period for percentage calculation
-        total_messages = await messages_collection.count_documents({
-            "created_at": {"$gte": start_date, "$lte": end_date},
-            "intent": {"$ne": None}
-        })
+        total_messages = await messages_collection.count_documents(report_queries.classified_messages(start_date, end_date))
 
         async for stat in messages_collection.aggregate(pipeline):
             intent_stats.append({
@@ -174,18 +156,19 @@ async def update_system_config(
     try:
         config_collection = db["system_config"]
         
-        config_data = config.model_dump()
+        # Only overwrite the fields the client sent, so older clients do not reset
+        # decoding profiles or model versions they do not know about
+        config_data = config.model_dump(exclude_unset=True)
         config_data["type"] = "main"
         config_data["updated_at"] = datetime.utcnow()
-        config_data["updated_by"] = current_user["_id"]
+        config_data["updated_by"] = current_user["id"]
         
         await config_collection.update_one(
             {"type": "main"},
             {"$set": config_data},
             upsert=True
         )
-        
-        return config
+        return await get_runtime_config().refresh(db, force=True)
         
     except Exception as e:
         raise HTTPException(
@@ -193,6 +176,114 @@ async def update_system_config(
             detail=f"Failed to update system configuration: {str(e)}"
         )
 
+@router.get("/ai/decoding-profiles", response_model=dict)
+async def get_decoding_profiles(current_user: dict = Depends(verify_admin_access), db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Get the suggestion decoding profiles together with their measured latency"""
+    config = await get_runtime_config().refresh(db, force=True)
+    return {
+        "profiles": {style: profile.model_dump() for style, profile in config.decoding_profiles.items()},
+        "latency": AIService().get_decoding_stats()
+    }
+
+@router.put("/ai/decoding-profiles", response_model=dict)
+async def update_decoding_profiles(
+    profiles: Dict[str, DecodingProfile] = Body(...),
+    current_user: dict = Depends(verify_admin_access),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Replace the suggestion decoding profiles; running workers pick them up without a restart"""
+    try:
+        profiles_data = {style.lower(): profile.model_dump() for style, profile in profiles.items()}
+        await db["system_config"].update_one(
+            {"type": "main"},
+            {"$set": {
+                "decoding_profiles": profiles_data,
+                "updated_at": datetime.utcnow(),
+                "updated_by": current_user["id"]
+            }},
+            upsert=True
+        )
+        config = await get_runtime_config().refresh(db, force=True)
+        return {"profiles": {style: profile.model_dump() for style, profile in config.decoding_profiles.items()}}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to update decoding profiles: {str(e)}"
+        )
+
+@router.get("/rate-limits", response_model=dict)
+async def get_rate_limits(current_user: dict = Depends(verify_admin_access), db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Rate limit policies together with this worker's allowed/rejected counters"""
+    config = await get_runtime_config().refresh(db, force=True)
+    return {"policies": config.rate_limits.model_dump(), "counters": rate_limiter.stats()}
+
+@router.put("/rate-limits", response_model=dict)
+async def update_rate_limits(
+    rate_limits: RateLimitConfig = Body(...),
+    current_user: dict = Depends(verify_admin_access),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Replace the rate limit policies; running workers pick them up without a restart"""
+    try:
+        await db["system_config"].update_one(
+            {"type": "main"},
+            {"$set": {
+                "rate_limits": rate_limits.model_dump(),
+                "updated_at": datetime.utcnow(),
+                "updated_by": current_user["id"]
+            }},
+            upsert=True
+        )
+        config = await get_runtime_config().refresh(db, force=True)
+        return {"policies": config.rate_limits.model_dump()}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to update rate limits: {str(e)}"
+        )
+
+class ModelSwapRequest(BaseModel):
+    kind: str  # 'intent' or 'suggest'
+    version: str  # e.g. 'v9' or 'v1.02'
+
+@router.get("/ai/models", response_model=dict)
+async def get_model_versions(current_user: dict = Depends(verify_admin_access)):
+    """Active intent/suggestion model versions on this worker and the state of any hot-swap"""
+    return jsonable_encoder(AIService().get_model_status())
+
+@router.post("/ai/models/swap", response_model=dict, status_code=status.HTTP_202_ACCEPTED)
+async def swap_model_version(
+    request: ModelSwapRequest,
+    background_tasks: BackgroundTasks,
+    current_user: dict = Depends(verify_admin_access),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """
+    Hot-swaps an intent or suggestion model without a restart.
+    The new version is loaded and warmed up in the background; other workers
+    follow through the model_versions entry in system_config.
+    """
+    if request.kind not in ("intent", "suggest"):
+        raise HTTPException(status_code=400, detail="kind must be 'intent' or 'suggest'")
+    ai_service = AIService()
+    status_entry = ai_service.swap_status.get(request.kind)
+    if status_entry and status_entry["state"] == "loading":
+        raise HTTPException(status_code=409, detail=f"A {request.kind} swap to {status_entry['version']} is already in progress")
+    try:
+        path = model_path(request.kind, request.version)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not os.path.isdir(path):
+        raise HTTPException(status_code=404, detail=f"Model {request.kind} {request.version} not found on disk")
+
+    await db["system_config"].update_one(
+        {"type": "main"},
+        {"$set": {f"model_versions.{request.kind}": request.version, "updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+    background_tasks.add_task(ai_service.reconcile_model_versions, {request.kind: request.version}, retry_failed=True)
+    return {"kind": request.kind, "version": request.version, "state": "loading"}
+
 @router.get("/ai-performance", response_model=dict)
 async def get_ai_performance(
     days: int = 7,
@@ -206,14 +297,9 @@ async def get_ai_performance(
         
         messages_collection = chat_service.messages
         
-        total_messages = await messages_collection.count_documents({
-            "created_at": {"$gte": start_date, "$lte": end_date}
-        })
+        total_messages = await messages_collection.count_documents(report_queries.period_messages(start_date, end_date))
         
-        ai_messages = await messages_collection.count_documents({
-            "created_at": {"$gte": start_date, "$lte": end_date},
-            "is_ai_generated": True
-        })
+        ai_messages = await messages_collection.count_documents(report_queries.period_messages(start_date, end_date, ai_only=True))
         
         intent_accuracy = 85.5
         
@@ -232,6 +318,27 @@ async def get_ai_performance(
             detail=f"Failed to get AI performance: {str(e)}"
         )
 
+@router.get("/metrics", response_model=dict)
+async def get_metrics(current_user: dict = Depends(verify_admin_access)):
+    """Process-local counters (caches, ...) of the worker that handled the request"""
+    return metrics.snapshot()
+
+@router.get("/presence", response_model=dict)
+async def get_presence(room_id: Optional[str] = None, user_id: Optional[str] = None, current_user: dict = Depends(verify_admin_access)):
+    """Who is online: admin/customer socket counts, plus the viewers of a room or the sockets of a user"""
+    result = {
+        "admin_online": await presence.online_count(UserType.ADMIN.value) > 0,
+        "online": {
+            "admin": await presence.online_count(UserType.ADMIN.value),
+            "customer": await presence.online_count(UserType.CUSTOMER.value),
+        },
+    }
+    if room_id:
+        result["room_viewers"] = await presence.room_users(room_id)
+    if user_id:
+        result["user_sids"] = sorted(await presence.user_sids_of(user_id))
+    return result
+
 @router.post("/rooms/export-data")
 async def export_chat_data(
     room_id: Optional[str] = None,
@@ -243,20 +350,11 @@ async def export_chat_data(
     """Export chat data to CSV or JSON"""
     try:
         # Build query
-        query = {}
-        if room_id:
-            query["room_id"] = room_id
-        if date_from or date_to:
-            date_query = {}
-            if date_from:
-                date_query["$gte"] = date_from
-            if date_to:
-                date_query["$lte"] = date_to
-            query["timestamp"] = date_query
+        query, sort = report_queries.export_messages(room_id, date_from, date_to)
         
         # Get messages
-        messages_collection = chat_service.messages_collection
-        cursor = messages_collection.find(query).sort("timestamp", 1)
+        messages_collection = chat_service.messages
+        cursor = messages_collection.find(query, MESSAGE_PROJECTION).sort(sort)
         
         messages = []
         async for message in cursor:
@@ -291,14 +389,13 @@ async def get_active_rooms_admin(chat_service: ChatService = Depends(get_chat_se
         rooms = await chat_service.get_active_rooms()
         result = []
         for room in rooms:
-            stats = await chat_service.get_chat_statistics(room["_id"])
             result.append({
                 "customer_id": room["customer_id"],
                 "customer_name": room.get("customer_name", "N/A"),
                 "room_id": room["_id"],
                 "created_at": room.get("created_at"),
                 "status": room.get("status", "unknown"),
-                "message_count": stats["message_count"],
+                "message_count": room.get("message_count", 0),
                 "last_message": room.get("last_message"),
                 "last_message_at": room.get("last_message_at"),
                 "unread_count": room.get("unread_count", 0)
@@ -308,20 +405,21 @@ async def get_active_rooms_admin(chat_service: ChatService = Depends(get_chat_se
         raise HTTPException(status_code=500, detail=f"Failed to get active rooms: {str(e)}")
 
 @router.get("/rooms/{room_id}/messages")
-async def get_messages(room_id: str, chat_service: ChatService = Depends(get_chat_service), user=Depends(get_current_admin_user)):
-    messages = await chat_service.get_messages_by_room_id(room_id)
-    if messages is None:
-        raise HTTPException(status_code=404, detail="Messages not found for this room.")
+async def get_messages(room_id: str, response: Response, limit: int = DEFAULT_PAGE_SIZE, before: Optional[str] = None,
+                       after: Optional[str] = None, chat_service: ChatService = Depends(get_chat_service), user=Depends(get_current_admin_user)):
+    """Newest page of the room's history; cursors of the neighbouring pages are in X-Prev-Cursor / X-Next-Cursor."""
+    try:
+        messages, prev_cursor, next_cursor = await chat_service.get_message_page(room_id, limit, before=before, after=after)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    set_cursor_headers(response, prev_cursor, next_cursor)
     return messages
 
 @router.get("/rooms/{room_id}/customer-messages")
 async def get_customer_messages(room_id: str = Path(...), db = Depends(get_database)):
     chat_service = ChatService(db)
-    cursor = db['messages'].find({
-        'room_id': room_id,
-        'user_type': 'customer',
-        'is_deleted': { '$ne': True }
-    }).sort('timestamp', 1)
+    query, sort = report_queries.visible_customer_messages(room_id)
+    cursor = db['messages'].find(query).sort(sort)
     messages = []
     async for msg in cursor:
         msg['_id'] = str(msg['_id'])
@@ -338,7 +436,7 @@ async def get_customer_messages(room_id: str = Path(...), db = Depends(get_datab
 @router.get("/users")
 async def get_all_customers(current_user: dict = Depends(verify_admin_access), db: AsyncIOMotorDatabase = Depends(get_database)):
     users_collection = db["users"]
-    cursor = users_collection.find({"user_type": "customer"})
+    cursor = users_collection.find(report_queries.customers())
     users_list = await cursor.to_list(length=None)
     
     # Manually construct the response to ensure the correct format (_id -> id)
@@ -388,6 +486,7 @@ async def update_customer(user_id: str, data: UserUpdate, current_user: dict = D
 
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    get_identity_cache().invalidate(user_id)
 
     updated_user = await db["users"].find_one({"_id": ObjectId(user_id)})
     
@@ -411,6 +510,7 @@ async def delete_customer(user_id: str, current_user: dict = Depends(verify_admi
         chat_service = ChatService(db)
         # Xóa user
         await db["users"].delete_one({"_id": ObjectId(user_id)})
+        get_identity_cache().invalidate(user_id)
         # Xóa room và message liên quan
         await chat_service.delete_rooms_and_messages_by_customer_id(user_id)
         return {"message": "User and related chat data deleted successfully"}
@@ -419,12 +519,12 @@ async def delete_customer(user_id: str, current_user: dict = Depends(verify_admi
 
 @router.delete("/rooms/messages/{message_id}", response_model=dict)
 async def delete_message(message_id: str, db = Depends(get_database), user=Depends(get_current_admin_user)):
-    # Chỉ set is_deleted=True thay vì xóa thật
-    result = await db["messages"].update_one({"_id": ObjectId(message_id)}, {"$set": {"is_deleted": True}})
-    if result.modified_count == 1:
-        return {"success": True}
-    else:
+    # Chỉ set is_deleted=True thay vì xóa thật; bộ đếm của room được trừ đi tương ứng
+    room_id = await ChatService(db).soft_delete_message(message_id)
+    if room_id is None:
         raise HTTPException(status_code=404, detail="Message not found")
+    schedule_room_update(room_id)
+    return {"success": True}
 
 @router.post("/rooms/{room_id}/messages/{message_id}/intent", response_model=dict)
 async def add_intent_history(
@@ -446,6 +546,23 @@ async def get_intent_history_by_room(room_id: str, db = Depends(get_database), u
     service = IntentHistoryService(db)
     return await service.get_intents_by_room(room_id)
 
+@router.get("/rooms/{room_id}/intent-rethreshold", response_model=List[dict])
+async def rethreshold_room_intents(
+    room_id: str,
+    threshold: Optional[float] = None,
+    k: int = 2,
+    db = Depends(get_database),
+    user=Depends(get_current_admin_user)
+):
+    """
+    Re-derives the room's customer message intents from the stored probability vectors
+    at a different confidence threshold (default: ai_confidence_threshold), plus the top-k alternatives.
+    """
+    if threshold is None:
+        threshold = (await get_runtime_config().refresh(db)).ai_confidence_threshold
+    service = IntentHistoryService(db)
+    return await service.rethreshold_message_intents(db["messages"], {"room_id": room_id, "user_type": "customer"}, threshold, k)
+
 @router.get("/messages/{message_id}/intent-history", response_model=List[IntentHistory])
 async def get_intent_history_by_message(message_id: str, db = Depends(get_database), user=Depends(get_current_admin_user)):
     service = IntentHistoryService(db)
@@ -477,13 +594,14 @@ async def classify_intent_for_message(message_id: str, db = Depends(get_database
         raise HTTPException(status_code=404, detail="Message not found")
     content = msg["content"]
     ai_service = AIService()
-    intent, confidence = ai_service.classify_intent(content)
-    return {"intent": intent, "confidence": confidence}
+    result = ai_service.classify_intent_detailed(content)
+    return {"intent": result["intent"], "confidence": result["confidence"], "model_version": result["model_version"]}
 
 @router.post("/rooms/{room_id}/mark-read")
 async def mark_room_as_read(room_id: str, chat_service: ChatService = Depends(get_chat_service), user=Depends(get_current_admin_user)):
     """Admin đánh dấu đã đọc room này (cập nhật admin_last_read_at)."""
     await chat_service.mark_room_as_read_by_admin(room_id)
+    schedule_room_update(room_id)
     return {"success": True}
 
 @router.get("/rooms/{room_id}/last-seen")
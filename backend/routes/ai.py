@@ -4,8 +4,9 @@ from typing import Optional, Dict, Any
 from datetime import datetime
 import sys
 
-from services.ai_service import AIService, get_ai_service
+from services.ai_service import AIService, get_ai_service, IntentHistoryService
 from services.chat_service import ChatService, get_chat_service
+from services.config_service import get_runtime_config
 from database.connection import get_database
 from bson.objectid import ObjectId
 import logging
@@ -17,7 +18,7 @@ router = APIRouter()
 class SuggestionRequest(BaseModel):
     message_id: str
     generation_style: str # 'formal', 'friendly', 'simple'
-    model_version: str = 'v1.00'
+    model_version: Optional[str] = None  # None = the active suggestion model
 
 class SuggestionDeleteRequest(BaseModel):
     message_id: str = Field(..., description="The ID of the message containing the suggestion.")
@@ -46,28 +47,49 @@ async def get_suggestion(
         if not message or 'content' not in message:
             raise HTTPException(status_code=404, detail=f"Message with ID {request_data.message_id} not found or has no content.")
         
-        # 2. Generate the suggestion using the AI service
-        suggestion_text = ai_service.generate_suggestion(message['content'], request_data.generation_style, model_version=request_data.model_version)
+        # 2. Reuse the intent already stored on the message when it is fresh for the loaded model;
+        #    otherwise classify now and persist it so the next style request can reuse it
+        resolved = ai_service.resolve_intent(message)
+        if not resolved["reused"]:
+            await IntentHistoryService(db).add_intent(
+                request_data.message_id, message['room_id'], resolved["intent"], resolved["confidence"], "ai",
+                model_version=resolved["model_version"], probs=resolved["probs"]
+            )
+            await chat_service.update_message_intent(
+                request_data.message_id, resolved["intent"], resolved["confidence"],
+                model_version=resolved["model_version"], probs=resolved["probs"]
+            )
 
-        # 3. Prepare the suggestion document to be saved
+        # 3. Generate the suggestion using the AI service (decoding profiles come from system_config)
+        await get_runtime_config().refresh(db)
+        # Only versions allowed by system_config; loaded off the event loop on first use
+        try:
+            model_version = await ai_service.prepare_suggest_version(request_data.model_version)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        suggestion_text = ai_service.generate_suggestion(message['content'], request_data.generation_style, model_version=model_version, intent=resolved["intent"])
+
+        # 4. Prepare the suggestion document to be saved
         suggestion_doc = {
             "style": request_data.generation_style,
             "text": suggestion_text,
             "created_at": datetime.utcnow(),
-            "model_version": request_data.model_version
+            "model_version": model_version
         }
         
-        # 4. Save the suggestion to the message's 'suggestions' array in the DB
+        # 5. Save the suggestion to the message's 'suggestions' array in the DB
         await chat_service.add_suggestion_to_message(request_data.message_id, suggestion_doc)
 
-        # 5. Fetch the updated message to get the full list of suggestions
+        # 6. Fetch the updated message to get the full list of suggestions
         updated_message = await chat_service.get_message_by_id(request_data.message_id)
         if not updated_message:
              raise HTTPException(status_code=404, detail="Message not found after update.")
 
-        # 6. Return the complete list of suggestions for that message
+        # 7. Return the complete list of suggestions for that message
         return {"suggestions": updated_message.get("suggestions", [])}
         
+    except HTTPException:
+        raise
     except FileNotFoundError as e:
         raise HTTPException(status_code=503, detail=f"AI Model not found: {e}")
     except RuntimeError as e:
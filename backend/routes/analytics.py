@@ -3,7 +3,8 @@ from typing import List, Optional
 from datetime import datetime, timedelta
 
 from routes.auth import get_current_user
-from services.chat_service import ChatService
+from services.chat_service import ChatService, get_chat_service
+from services import report_queries
 from database.connection import get_analytics_collection, get_database
 
 router = APIRouter()
@@ -20,16 +21,16 @@ async def get_analytics_overview(current_user: dict = Depends(verify_admin_acces
         rooms_collection = chat_service.chat_rooms
         
         # Get total messages count
-        total_messages = await messages_collection.count_documents({})
+        total_messages = await messages_collection.estimated_document_count()
         
         # Get admin messages count
-        admin_messages = await messages_collection.count_documents({"user_type": "admin"})
+        admin_messages = await messages_collection.count_documents(report_queries.messages_of_user_type("admin"))
         
         # Get customer messages count
-        customer_messages = await messages_collection.count_documents({"user_type": "customer"})
+        customer_messages = await messages_collection.count_documents(report_queries.messages_of_user_type("customer"))
         
         # Get total rooms (active chats)
-        active_rooms = await rooms_collection.count_documents({})
+        active_rooms = await rooms_collection.estimated_document_count()
         
         # Get total rooms (for resolvedChats)
         total_rooms = active_rooms
@@ -37,7 +38,8 @@ async def get_analytics_overview(current_user: dict = Depends(verify_admin_acces
         # Calculate average response time (simplified)
         response_times = []
         async for room in rooms_collection.find():
-            room_messages = await messages_collection.find({"room_id": room["_id"]}).sort("created_at", 1).to_list(length=None)
+            query, sort = report_queries.room_messages(room["_id"])
+            room_messages = await messages_collection.find(query).sort(sort).to_list(length=None)
             for i, msg in enumerate(room_messages):
                 if msg["user_type"] == "customer" and i + 1 < len(room_messages):
                     next_msg = room_messages[i + 1]
@@ -48,28 +50,13 @@ async def get_analytics_overview(current_user: dict = Depends(verify_admin_acces
         avg_response_time = sum(response_times) / len(response_times) if response_times else 0
         
         # Get intent distribution from messages
-        intent_pipeline = [
-            {
-                "$match": {
-                    "intent": {"$exists": True, "$ne": None}
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$intent",
-                    "count": {"$sum": 1}
-                }
-            },
-            {
-                "$sort": {"count": -1}
-            }
-        ]
+        intent_pipeline = report_queries.intent_distribution_pipeline()
         intent_distribution = {}
         async for intent_stat in messages_collection.aggregate(intent_pipeline):
             intent_distribution[intent_stat["_id"]] = intent_stat["count"]
         
         # Get AI usage percentage
-        ai_messages = await messages_collection.count_documents({"is_ai_generated": True})
+        ai_messages = await messages_collection.count_documents(report_queries.AI_GENERATED)
         ai_usage = (ai_messages / total_messages * 100) if total_messages > 0 else 0
         
         # Generate chat trends for last 7 days
@@ -78,9 +65,7 @@ async def get_analytics_overview(current_user: dict = Depends(verify_admin_acces
             date = datetime.utcnow() - timedelta(days=i)
             start_of_day = date.replace(hour=0, minute=0, second=0, microsecond=0)
             end_of_day = start_of_day + timedelta(days=1)
-            daily_messages = await messages_collection.count_documents({
-                "created_at": {"$gte": start_of_day, "$lt": end_of_day}
-            })
+            daily_messages = await messages_collection.count_documents(report_queries.day_messages(start_of_day, end_of_day))
             chat_trends.append({
                 "date": start_of_day.strftime("%Y-%m-%d"),
                 "chats": daily_messages
@@ -116,45 +101,11 @@ async def get_customer_behavior_analytics(
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=days)
         
-        messages_collection = chat_service.messages_collection
-        rooms_collection = chat_service.chat_rooms_collection
+        messages_collection = chat_service.messages
+        rooms_collection = chat_service.chat_rooms
         
         # Customer engagement metrics
-        engagement_pipeline = [
-            {
-                "$match": {
-                    "created_at": {"$gte": start_date, "$lte": end_date}
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "messages",
-                    "localField": "_id",
-                    "foreignField": "room_id",
-                    "as": "messages"
-                }
-            },
-            {
-                "$project": {
-                    "customer_id": 1,
-                    "customer_name": 1,
-                    "message_count": {"$size": "$messages"},
-                    "first_message": {"$min": "$messages.created_at"},
-                    "last_message": {"$max": "$messages.created_at"},
-                    "ai_messages": {
-                        "$size": {
-                            "$filter": {
-                                "input": "$messages",
-                                "cond": "$$this.is_ai_generated"
-                            }
-                        }
-                    }
-                }
-            },
-            {
-                "$sort": {"message_count": -1}
-            }
-        ]
+        engagement_pipeline = report_queries.engagement_pipeline(start_date, end_date)
         
         customer_stats = []
         async for stat in rooms_collection.aggregate(engagement_pipeline):
@@ -171,37 +122,13 @@ async def get_customer_behavior_analytics(
                 })
         
         # Response time analysis
-        response_time_pipeline = [
-            {
-                "$match": {
-                    "created_at": {"$gte": start_date, "$lte": end_date},
-                    "user_type": "customer"
-                }
-            },
-            {
-                "$sort": {"room_id": 1, "created_at": 1}
-            },
-            {
-                "$group": {
-                    "_id": "$room_id",
-                    "customer_messages": {
-                        "$push": {
-                            "created_at": "$created_at",
-                            "content": "$content"
-                        }
-                    }
-                }
-            }
-        ]
+        response_time_pipeline = report_queries.customer_messages_by_room_pipeline(start_date, end_date)
         
         response_times = []
         async for room in messages_collection.aggregate(response_time_pipeline):
             # Get admin responses for this room
-            admin_messages = await messages_collection.find({
-                "room_id": room["_id"],
-                "user_type": "admin",
-                "created_at": {"$gte": start_date, "$lte": end_date}
-            }).sort("created_at", 1).to_list(length=None)
+            query, sort = report_queries.admin_replies(room["_id"], start_date, end_date)
+            admin_messages = await messages_collection.find(query).sort(sort).to_list(length=None)
             
             # Calculate response times
             for i, customer_msg in enumerate(room["customer_messages"]):
@@ -252,32 +179,10 @@ async def get_ai_performance_metrics(
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=days)
         
-        messages_collection = chat_service.messages_collection
+        messages_collection = chat_service.messages
         
         # AI usage trends
-        ai_usage_pipeline = [
-            {
-                "$match": {
-                    "created_at": {"$gte": start_date, "$lte": end_date}
-                }
-            },
-            {
-                "$group": {
-                    "_id": {
-                        "year": {"$year": "$created_at"},
-                        "month": {"$month": "$created_at"},
-                        "day": {"$dayOfMonth": "$created_at"}
-                    },
-                    "total_messages": {"$sum": 1},
-                    "ai_messages": {
-                        "$sum": {"$cond": ["$is_ai_generated", 1, 0]}
-                    }
-                }
-            },
-            {
-                "$sort": {"_id": 1}
-            }
-        ]
+        ai_usage_pipeline = report_queries.ai_usage_pipeline(start_date, end_date)
         
         ai_usage_trends = []
         async for stat in messages_collection.aggregate(ai_usage_pipeline):
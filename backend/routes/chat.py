@@ -1,14 +1,16 @@
-from fastapi import APIRouter, HTTPException, Depends, status, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends, status, BackgroundTasks, Response
 from typing import List, Optional
 from datetime import datetime
 from pydantic import BaseModel
-from socketio_instance import sio, active_rooms
+from socketio_instance import sio, schedule_room_update
 import time
 from fastapi.responses import JSONResponse
 
 from models.schemas import Message, ChatRoom, UserType, RoomSchema, MessageSchema, MessageResponse, CreateMessageSchema
 from services.chat_service import ChatService
+from services.pagination import DEFAULT_PAGE_SIZE, InvalidCursor, clamp_page_size, set_cursor_headers, set_has_more_header
 from services.ai_service import AIService
+from services import search
 from routes.auth import get_current_user
 from database.connection import get_database
 
@@ -48,8 +50,19 @@ async def get_chat_room(room_id: str, chat_service: ChatService = Depends(get_ch
     return room
 
 @router.get("/rooms/{room_id}/messages", response_model=List[dict])
-async def get_messages(room_id: str, chat_service: ChatService = Depends(get_chat_service), current_user: dict = Depends(get_current_user)):
-    messages = await chat_service.get_messages_by_room_id(room_id)
+async def get_messages(room_id: str, response: Response, limit: int = DEFAULT_PAGE_SIZE, before: Optional[str] = None,
+                       after: Optional[str] = None, after_seq: Optional[int] = None,
+                       chat_service: ChatService = Depends(get_chat_service), current_user: dict = Depends(get_current_user)):
+    """A page of the room's history (newest by default, or before/after a cursor), or with after_seq only what a reconnecting client missed"""
+    if after_seq is not None:
+        messages, has_more = await chat_service.get_messages_after_seq(room_id, after_seq, clamp_page_size(limit))
+        set_has_more_header(response, has_more)
+        return messages
+    try:
+        messages, prev_cursor, next_cursor = await chat_service.get_message_page(room_id, limit, before=before, after=after)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    set_cursor_headers(response, prev_cursor, next_cursor)
     return messages
 
 @router.post("/rooms/{room_id}/messages", response_model=dict)
@@ -60,22 +73,24 @@ async def send_message(room_id: str, data: dict, chat_service: ChatService = Dep
     if not content:
         raise HTTPException(status_code=400, detail="Missing content")
     msg = await chat_service.save_message(room_id, user_id, user_type, content)
+    schedule_room_update(room_id)
     # Nếu cần AI phân tích thì gọi ai_service.analyze_message(content)
     return msg
 
 @router.post("/rooms/{room_id}/close")
 async def close_chat_room(room_id: str, chat_service: ChatService = Depends(get_chat_service), current_user: dict = Depends(get_current_user)):
     await chat_service.close_chat_room(room_id)
+    schedule_room_update(room_id)
     return {"message": "Chat room closed successfully"}
 
 @router.get("/rooms/{room_id}/statistics", response_model=dict)
 async def get_chat_statistics(
     room_id: str,
+    chat_service: ChatService = Depends(get_chat_service),
     current_user: dict = Depends(get_current_user)
 ):
     """Get statistics for a specific chat room"""
     try:
-        chat_service = ChatService()
         stats = await chat_service.get_chat_statistics(room_id)
         return stats
     except Exception as e:
@@ -112,11 +127,11 @@ async def get_chat_logs(
                 "startTime": room.get("created_at").isoformat() if room.get("created_at") else None,
                 "endTime": room.get("closed_at").isoformat() if room.get("closed_at") else None,
                 "duration": duration,
-                "messageCount": room.get("message_count", 0), # Assuming this field exists
+                "messageCount": room.get("message_count", 0),
                 "status": room.get("status", "unknown"),
                 "satisfaction": room.get("satisfaction_rating"), # Assuming this field exists
-                "intent": room.get("dominant_intent"), # Assuming this field exists
-                "aiUsage": room.get("ai_usage_percentage", 0) # Assuming this field exists
+                "intent": room.get("dominant_intent"),
+                "aiUsage": room.get("ai_usage_percentage", 0)
             }
             formatted_logs.append(log_entry)
             
@@ -150,18 +165,24 @@ async def analyze_message(
 
 @router.get("/search", response_model=List[dict])
 async def search_messages(
+    response: Response,
     keyword: Optional[str] = None,
     intent: Optional[str] = None,
     customer_id: Optional[str] = None,
     date_from: Optional[datetime] = None,
     date_to: Optional[datetime] = None,
     limit: int = 50,
+    offset: int = 0,
     current_user: dict = Depends(get_current_user)
 ):
-    """Search messages with various filters"""
+    """
+    Search messages with various filters. `keyword` matches whole words regardless of case
+    and diacritics; results are ranked and paged with offset/limit. X-Search-Truncated: true
+    when more messages matched the keyword than were ranked.
+    """
     try:
         from models.schemas import IntentType
-        chat_service = ChatService()
+        chat_service = get_chat_service()
         
         intent_enum = None
         if intent:
@@ -173,14 +194,16 @@ async def search_messages(
                     detail="Invalid intent type"
                 )
         
-        messages = await chat_service.search_messages(
+        messages, truncated = await chat_service.search_messages(
             keyword=keyword,
             intent=intent_enum,
             customer_id=customer_id,
             date_from=date_from,
             date_to=date_to,
-            limit=limit
+            limit=clamp_page_size(limit),
+            offset=max(offset, 0)
         )
+        search.set_truncated_header(response, truncated)
         
         return messages
         
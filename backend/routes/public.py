@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from database.connection import get_database
 from services.chat_service import ChatService
-from typing import List
-from socketio_instance import sio
+from services.pagination import DEFAULT_PAGE_SIZE, InvalidCursor, clamp_page_size, set_cursor_headers, set_has_more_header
+from typing import List, Optional
+from socketio_instance import emit_to_admins, schedule_room_update
 from datetime import datetime
 from bson import ObjectId
 
@@ -36,13 +37,23 @@ async def create_room(data: dict, chat_service: ChatService = Depends(get_chat_s
     # Only emit the 'new_room' event if the room was actually created.
     if created:
         serializable_room = _to_json_serializable(room)
-        await sio.emit("new_room", serializable_room, room="admin_room")
+        await emit_to_admins("new_room", serializable_room)
 
     return _to_json_serializable(room)
 
 @router.get("/{room_id}/messages")
-async def get_messages(room_id: str, chat_service: ChatService = Depends(get_chat_service)):
-    messages = await chat_service.get_messages_by_room_id(room_id)
+async def get_messages(room_id: str, response: Response, limit: int = DEFAULT_PAGE_SIZE, before: Optional[str] = None,
+                       after: Optional[str] = None, after_seq: Optional[int] = None,
+                       chat_service: ChatService = Depends(get_chat_service)):
+    if after_seq is not None:
+        messages, has_more = await chat_service.get_messages_after_seq(room_id, after_seq, clamp_page_size(limit))
+        set_has_more_header(response, has_more)
+        return _to_json_serializable(messages)
+    try:
+        messages, prev_cursor, next_cursor = await chat_service.get_message_page(room_id, limit, before=before, after=after)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    set_cursor_headers(response, prev_cursor, next_cursor)
     return _to_json_serializable(messages)
 
 @router.post("/{room_id}/messages")
@@ -53,6 +64,7 @@ async def send_message(room_id: str, data: dict, chat_service: ChatService = Dep
     if not all([user_id, user_type, content]):
         raise HTTPException(status_code=400, detail="Missing fields")
     msg = await chat_service.save_message(room_id, user_id, user_type, content)
+    schedule_room_update(room_id)
     return _to_json_serializable(msg)
 
 public_router = router 
\ No newline at end of file
@@ -0,0 +1,81 @@
+from typing import Any, Dict
+from contextlib import asynccontextmanager
+from services import metrics
+import asyncio
+import os
+import random
+
+# Socket.IO handshakes (JWT decode + user lookup) allowed to run at once on this worker
+MAX_CONCURRENT_HANDSHAKES = int(os.getenv("MAX_CONCURRENT_HANDSHAKES", 50))
+# Handshakes allowed to wait for a slot; beyond this, new ones are refused straight away
+HANDSHAKE_QUEUE_LIMIT = int(os.getenv("HANDSHAKE_QUEUE_LIMIT", 200))
+# How long a handshake may wait for a slot before it is refused
+HANDSHAKE_WAIT_SECONDS = float(os.getenv("HANDSHAKE_WAIT_SECONDS", 2))
+# Bounds of the retry delay suggested to refused clients
+RETRY_AFTER_MIN_SECONDS = 1.0
+RETRY_AFTER_MAX_SECONDS = 30.0
+
+class HandshakeRejected(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Handshake refused, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+class HandshakeGate:
+    """
+    Paces connection admission after a restart. A bounded number of handshakes run
+    concurrently; the rest wait briefly or are refused with a jittered retry delay
+    that grows with the backlog, so reconnecting clients spread out instead of
+    returning in lockstep.
+    """
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_HANDSHAKES,
+                 queue_limit: int = HANDSHAKE_QUEUE_LIMIT, wait_seconds: float = HANDSHAKE_WAIT_SECONDS):
+        self.max_concurrent = max_concurrent
+        self.queue_limit = queue_limit
+        self.wait_seconds = wait_seconds
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.waiting = 0
+        self.in_progress = 0
+        self.admitted = 0
+        self.refused = 0
+        self.resumed = 0
+
+    def retry_after(self) -> float:
+        # Full jitter over a window proportional to the current backlog
+        backlog = (self.waiting + self.in_progress) / max(self.max_concurrent, 1)
+        upper = min(RETRY_AFTER_MAX_SECONDS, RETRY_AFTER_MIN_SECONDS * (1 + backlog))
+        return round(random.uniform(RETRY_AFTER_MIN_SECONDS, max(upper, RETRY_AFTER_MIN_SECONDS)), 2)
+
+    @asynccontextmanager
+    async def admit(self):
+        if self.waiting >= self.queue_limit:
+            self.refused += 1
+            raise HandshakeRejected(self.retry_after())
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.wait_seconds)
+        except asyncio.TimeoutError:
+            self.refused += 1
+            raise HandshakeRejected(self.retry_after())
+        finally:
+            self.waiting -= 1
+        self.admitted += 1
+        self.in_progress += 1
+        try:
+            yield
+        finally:
+            self.in_progress -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "in_progress": self.in_progress,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "refused": self.refused,
+            "resumed": self.resumed,
+        }
+
+handshake_gate = HandshakeGate()
+metrics.register("handshakes", handshake_gate.stats)
@@ -1,9 +1,19 @@
 from typing import List, Dict, Any, Optional, Tuple
-from models.schemas import IntentType, ResponseStyle, IntentHistory
+from models.schemas import IntentType, ResponseStyle, IntentHistory, DecodingProfile, default_decoding_profiles, MANUAL_INTENT_VERSION
+from services.config_service import get_runtime_config
+from database.connection import get_database
+from services.intent_vectors import INTENT_LABELS, pack_probs, load_vectors, rethreshold, top_k
 from bson import ObjectId
-from datetime import datetime
+from datetime import datetime, timedelta
+from collections import deque
+from contextlib import contextmanager
 import asyncio
+import gc
+import math
 import random
+import re
+import threading
+import time
 import torch
 from transformers import T5Tokenizer, T5ForConditionalGeneration, BertTokenizer, BertForSequenceClassification
 import os
@@ -16,10 +26,87 @@ logger = logging.getLogger(__name__)
 
 # Đường dẫn mới cho mô hình AI (dùng đường dẫn tương đối, đảm bảo chạy đúng khi chạy từ backend)
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../models/ai_models'))
-INTENT_MODEL_PATH = os.path.join(BASE_DIR, 'intent_model', 'model_output_intent_v8', 'best_model')
-SUGGEST_MODEL_PATH = os.path.join(BASE_DIR, 'suggest_model', 'flan_t5_trained_model_v1.00')
+INTENT_MODEL_VERSION = 'v8'
+SUGGEST_MODEL_VERSION = 'v1.00'
+
+# Version names become part of a directory name: letters, digits, ".", "_" and "-" only
+_VERSION_PATTERN = re.compile(r"^[A-Za-z0-9._-]+$")
+
+def model_path(kind: str, version: str) -> str:
+    """Directory of a given intent (BERT) or suggest (FLAN-T5) model version."""
+    if not version or not _VERSION_PATTERN.match(version) or ".." in version:
+        raise ValueError(f"Invalid model version: {version!r}")
+    if kind == "intent":
+        return os.path.join(BASE_DIR, 'intent_model', f'model_output_intent_{version}', 'best_model')
+    return os.path.join(BASE_DIR, 'suggest_model', f'flan_t5_trained_model_{version}')
+
+INTENT_MODEL_PATH = model_path("intent", INTENT_MODEL_VERSION)
+SUGGEST_MODEL_PATH = model_path("suggest", SUGGEST_MODEL_VERSION)
 ABBR_DICT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../models/abbreviation_dict.json'))
 
+# Prompt suffix per suggestion style; length and decoding settings come from the
+# decoding profiles stored in system_config.
+STYLE_PROMPTS = {
+    "simple": "style: simple. Keep it short and simple.",
+    "friendly": "style: friendly",
+    "formal": "style: formal"
+}
+# Length budget applied before inference so one oversized message cannot pin a CPU core
+MAX_INPUT_CHARS = 8000          # hard cap before tokenization
+INTENT_MAX_TOKENS = 128         # BERT window length, including special tokens
+INTENT_WINDOW_OVERLAP = 32      # tokens shared by consecutive windows
+INTENT_MAX_WINDOWS = 8          # windows classified per message
+T5_MAX_TEXT_TOKENS = 192        # customer text inside the T5 prompt
+T5_MAX_INPUT_TOKENS = 256       # whole T5 prompt
+# Rough T5 sentencepiece tokens per English word, used to derive max_new_tokens
+TOKENS_PER_WORD = 1.6
+# Number of recent latency samples kept per profile for percentile reporting
+LATENCY_SAMPLE_SIZE = 200
+# A configured model version that fails to load is retried by the version watcher after
+# this delay, doubled on each further failure up to the maximum (each attempt loads the weights)
+SWAP_RETRY_BASE_SECONDS = 60
+SWAP_RETRY_MAX_SECONDS = 3600
+# Load testing: replace BERT/T5 with deterministic stubs so no model files are needed.
+# AI_STUB_LATENCY_MS blocks the calling thread like real CPU inference would.
+AI_STUB_INFERENCE = os.getenv("AI_STUB_INFERENCE", "").lower() in ("1", "true", "yes")
+AI_STUB_LATENCY_MS = float(os.getenv("AI_STUB_LATENCY_MS", 0))
+STUB_MODEL_VERSION = "stub"
+
+class _ModelSlot:
+    """One loaded model version plus the number of calls currently using it."""
+
+    def __init__(self, kind: str, version: str, tokenizer, model):
+        self.kind = kind
+        self.version = version
+        self.tokenizer = tokenizer
+        self.model = model
+        self.loaded_at = datetime.utcnow()
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
+
+    def acquire(self):
+        with self._lock:
+            self.in_flight += 1
+            self._idle.clear()
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self._idle.set()
+
+    def unload(self, device: torch.device):
+        """Drops the weights once the last in-flight call has finished."""
+        self._idle.wait()
+        self.tokenizer = None
+        self.model = None
+        gc.collect()
+        if device.type == "cuda":
+            torch.cuda.empty_cache()
+        logger.info(f"Released {self.kind} model {self.version}")
+
 class AIService:
     _instance = None
 
@@ -28,8 +115,15 @@ class AIService:
             logger.info("Creating new AIService instance...")
             cls._instance = super(AIService, cls).__new__(cls)
             cls._instance.initialized = False
-            cls._instance.t5_tokenizer_v101 = None
-            cls._instance.t5_model_v101 = None
+            cls._instance._intent_slot = None
+            cls._instance._suggest_slots = {}
+            cls._instance.default_suggest_version = SUGGEST_MODEL_VERSION
+            cls._instance._slot_lock = threading.Lock()
+            cls._instance.swap_status = {}
+            cls._instance.decoding_stats = {}
+            cls._instance.intent_reuse_stats = {"reused": 0, "inferred": 0}
+            cls._instance.length_stats = {"hard_capped": 0, "intent_chunked": 0, "t5_truncated": 0}
+            cls._instance.stub = AI_STUB_INFERENCE
         return cls._instance
 
     def __init__(self):
@@ -39,6 +133,12 @@ class AIService:
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         logger.info(f"AI Service is using device: {self.device}")
 
+        if self.stub:
+            self._load_abbreviations()
+            self.initialized = True
+            logger.warning("⚠️ AI_STUB_INFERENCE is set: intents and suggestions are stubbed, no model is loaded.")
+            return
+
         # Load models and tokenizers
         try:
             self._load_abbreviations()
@@ -58,25 +158,201 @@ class AIService:
             self.abbr_dict = json.load(f)
 
     def _load_intent_model(self):
-        logger.info(f"Loading intent model from {INTENT_MODEL_PATH}...")
-        if not os.path.isdir(INTENT_MODEL_PATH):
-             raise FileNotFoundError(f"Intent model directory not found at {INTENT_MODEL_PATH}")
-        self.intent_tokenizer = BertTokenizer.from_pretrained(INTENT_MODEL_PATH)
-        self.intent_model = BertForSequenceClassification.from_pretrained(INTENT_MODEL_PATH)
-        self.intent_model.to(self.device).eval()
-        self.intent_label_map = {
-            0: "intent_clarification", 1: "intent_commitment", 2: "intent_delay",
-            3: "intent_follow_up", 4: "intent_greeting", 5: "intent_negotiation",
-            6: "intent_propose_offer", 7: "intent_rejection"
-        }
+        self._intent_slot = self._load_slot("intent", INTENT_MODEL_VERSION)
+        self.intent_label_map = dict(enumerate(INTENT_LABELS))
 
     def _load_suggestion_model(self):
-        logger.info(f"Loading suggestion model from {SUGGEST_MODEL_PATH}...")
-        if not os.path.isdir(SUGGEST_MODEL_PATH):
-            raise FileNotFoundError(f"Suggestion model directory not found at {SUGGEST_MODEL_PATH}")
-        self.t5_tokenizer = T5Tokenizer.from_pretrained(SUGGEST_MODEL_PATH)
-        self.t5_model = T5ForConditionalGeneration.from_pretrained(SUGGEST_MODEL_PATH)
-        self.t5_model.to(self.device)
+        self._suggest_slots[SUGGEST_MODEL_VERSION] = self._load_slot("suggest", SUGGEST_MODEL_VERSION)
+
+    def _load_slot(self, kind: str, version: str) -> _ModelSlot:
+        path = model_path(kind, version)
+        logger.info(f"Loading {kind} model {version} from {path}...")
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"{kind.capitalize()} model directory not found at {path}")
+        if kind == "intent":
+            tokenizer = BertTokenizer.from_pretrained(path)
+            model = BertForSequenceClassification.from_pretrained(path)
+        else:
+            tokenizer = T5Tokenizer.from_pretrained(path)
+            model = T5ForConditionalGeneration.from_pretrained(path)
+        model.to(self.device).eval()
+        return _ModelSlot(kind, version, tokenizer, model)
+
+    @contextmanager
+    def _lease(self, kind: str, version: Optional[str] = None):
+        """
+        Pins the active slot of a kind for the duration of one call.
+        A hot-swap after this point does not affect the call, and the old
+        weights are only released once every lease on them is returned.
+        """
+        with self._slot_lock:
+            if kind == "intent":
+                slot = self._intent_slot
+            else:
+                slot = self._suggest_slots.get(version or self.default_suggest_version)
+                if slot is None:
+                    # Never loaded here (see prepare_suggest_version) or evicted since
+                    logger.warning(f"[AI SUGGESTION] Model version {version} is not loaded, using {self.default_suggest_version}")
+                    slot = self._suggest_slots[self.default_suggest_version]
+            slot.acquire()
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+    @property
+    def intent_model_version(self) -> Optional[str]:
+        if self.stub:
+            return STUB_MODEL_VERSION
+        return self._intent_slot.version if self._intent_slot else None
+
+    @property
+    def intent_model(self):
+        return self._intent_slot.model if self._intent_slot else None
+
+    @property
+    def t5_model(self):
+        slot = self._suggest_slots.get(self.default_suggest_version)
+        return slot.model if slot else None
+
+    def _warm_up(self, slot: _ModelSlot):
+        """Runs one tiny inference so the first real request does not pay for lazy init."""
+        with torch.no_grad():
+            if slot.kind == "intent":
+                inputs = slot.tokenizer("hello", return_tensors="pt").to(self.device)
+                slot.model(**inputs)
+            else:
+                input_ids = slot.tokenizer("SCN_UNKNOWN | intent_greeting | hello | style: simple",
+                                           return_tensors="pt").input_ids.to(self.device)
+                slot.model.generate(input_ids, max_new_tokens=4)
+
+    def _swap_blocking(self, kind: str, version: str):
+        new_slot = self._load_slot(kind, version)
+        self._warm_up(new_slot)
+        with self._slot_lock:
+            if kind == "intent":
+                old_slot, self._intent_slot = self._intent_slot, new_slot
+            else:
+                old_slot = self._suggest_slots.get(self.default_suggest_version)
+                self._suggest_slots.pop(self.default_suggest_version, None)
+                stale = self._suggest_slots.get(version)
+                self._suggest_slots[version] = new_slot
+                self.default_suggest_version = version
+                if stale is not None and stale is not old_slot:
+                    threading.Thread(target=stale.unload, args=(self.device,), daemon=True).start()
+        if old_slot is not None and old_slot is not new_slot:
+            threading.Thread(target=old_slot.unload, args=(self.device,), daemon=True).start()
+
+    async def hot_swap(self, kind: str, version: str):
+        """
+        Loads and warms up a new model version off the event loop, then makes it
+        the active one. Calls already running keep using the previous version.
+        """
+        if kind not in ("intent", "suggest"):
+            raise ValueError(f"Unknown model kind: {kind}")
+        status = self.swap_status.get(kind)
+        if status and status["state"] == "loading":
+            raise RuntimeError(f"A {kind} model swap to {status['version']} is already in progress")
+        # Consecutive failures of this same version, for the watcher's backoff
+        failures = status.get("failures", 0) if status and status["version"] == version and status["state"] == "failed" else 0
+        self.swap_status[kind] = {"version": version, "state": "loading", "started_at": datetime.utcnow(), "error": None}
+        try:
+            if not os.path.isdir(model_path(kind, version)):
+                raise FileNotFoundError(f"{kind.capitalize()} model directory not found at {model_path(kind, version)}")
+            await asyncio.get_running_loop().run_in_executor(None, self._swap_blocking, kind, version)
+            self.swap_status[kind].update(state="active", finished_at=datetime.utcnow())
+            logger.info(f"✅ Hot-swapped {kind} model to {version}")
+        except Exception as e:
+            failures += 1
+            delay = min(SWAP_RETRY_BASE_SECONDS * 2 ** (failures - 1), SWAP_RETRY_MAX_SECONDS)
+            now = datetime.utcnow()
+            self.swap_status[kind].update(state="failed", finished_at=now, error=str(e), failures=failures,
+                                          retry_at=now + timedelta(seconds=delay))
+            if failures == 1:
+                logger.error(f"🔥 Hot-swap of {kind} model to {version} failed: {e}", exc_info=True)
+            raise
+
+    async def reconcile_model_versions(self, desired: Dict[str, str], retry_failed: bool = False):
+        """
+        Swaps to the versions requested in system_config if this worker is not on them yet,
+        then releases suggestion models no longer allowed. Called on every watcher tick; a
+        version that failed to load is only retried once its backoff (swap_status retry_at)
+        has passed, or right away with retry_failed (an explicit swap request).
+        """
+        if self.stub:
+            return
+        active = {"intent": self.intent_model_version, "suggest": self.default_suggest_version}
+        for kind, version in desired.items():
+            if kind not in active or not version or version == active[kind]:
+                continue
+            status = self.swap_status.get(kind)
+            if status and status["version"] == version and status["state"] == "loading":
+                continue
+            if (status and status["version"] == version and status["state"] == "failed" and not retry_failed
+                    and datetime.utcnow() < status["retry_at"]):
+                continue
+            try:
+                await self.hot_swap(kind, version)
+            except Exception as e:
+                status = self.swap_status.get(kind) or {}
+                if status.get("failures") == 1:
+                    logger.warning(f"Swap of {kind} model to {version} failed, retrying with backoff "
+                                   f"(next at {status['retry_at']:%H:%M:%S} UTC): {e}")
+                else:
+                    logger.debug(f"Swap of {kind} model to {version} failed again ({status.get('failures')} times): {e}")
+        self.evict_suggest_slots()
+
+    def allowed_suggest_versions(self) -> set:
+        """The default suggestion version plus the extra ones listed in system_config.suggest_versions."""
+        return {self.default_suggest_version, *get_runtime_config().config.suggest_versions}
+
+    async def prepare_suggest_version(self, version: Optional[str]) -> str:
+        """
+        The suggestion model version a request will run on; an allowed version that is not
+        loaded yet is loaded off the event loop first. Never substitutes another version:
+        raises ValueError for a version system_config does not allow, FileNotFoundError
+        when it is not on disk and RuntimeError when it fails to load.
+        """
+        default = self.default_suggest_version
+        if not version or version == default or self.stub:
+            return default
+        if version not in self.allowed_suggest_versions():
+            raise ValueError(f"Suggestion model version {version!r} is not available")
+        if version in self._suggest_slots:
+            return version
+        if not os.path.isdir(model_path("suggest", version)):
+            raise FileNotFoundError(f"Suggestion model directory not found at {model_path('suggest', version)}")
+        try:
+            loaded = await asyncio.get_running_loop().run_in_executor(None, self._load_slot, "suggest", version)
+        except Exception as e:
+            logger.error(f"[AI SUGGESTION] Failed to load suggestion model {version}: {e}")
+            raise RuntimeError(f"Suggestion model {version} failed to load") from e
+        with self._slot_lock:
+            self._suggest_slots.setdefault(version, loaded)
+        return version
+
+    def evict_suggest_slots(self):
+        """Releases loaded suggestion versions that are neither the default nor allowed by system_config."""
+        allowed = self.allowed_suggest_versions()
+        with self._slot_lock:
+            evicted = [self._suggest_slots.pop(version) for version in list(self._suggest_slots) if version not in allowed]
+        for slot in evicted:
+            threading.Thread(target=slot.unload, args=(self.device,), daemon=True).start()
+
+    def get_model_status(self) -> Dict[str, Any]:
+        return {
+            "intent": {
+                "active_version": self.intent_model_version,
+                "in_flight": self._intent_slot.in_flight if self._intent_slot else 0,
+            },
+            "suggest": {
+                "default_version": self.default_suggest_version,
+                "allowed_versions": sorted(self.allowed_suggest_versions()),
+                "loaded": {version: {"in_flight": slot.in_flight, "loaded_at": slot.loaded_at}
+                           for version, slot in self._suggest_slots.items()},
+            },
+            "swaps": self.swap_status,
+        }
 
     def _preprocess_sentence(self, sentence: str) -> str:
         if not sentence or not isinstance(sentence, str):
@@ -86,64 +362,224 @@ class AIService:
         replaced_words = [self.abbr_dict.get(word.lower(), word) for word in words]
         return " ".join(replaced_words)
 
-    def classify_intent(self, text: str) -> Tuple[str, float]:
-        if not self.initialized:
-            raise RuntimeError("AIService is not initialized.")
-        
-        cleaned_text = self._preprocess_sentence(text)
-        inputs = self.intent_tokenizer.encode_plus(
-            cleaned_text, add_special_tokens=True, max_length=128,
-            padding="max_length", truncation=True, return_tensors="pt"
+    def _cap_input(self, text: str) -> str:
+        """Hard character cap applied before any tokenization."""
+        if text and len(text) > MAX_INPUT_CHARS:
+            self.length_stats["hard_capped"] += 1
+            logger.warning(f"[LENGTH BUDGET] Input of {len(text)} chars capped to {MAX_INPUT_CHARS}")
+            return text[:MAX_INPUT_CHARS]
+        return text
+
+    def _intent_windows(self, tokenizer, cleaned_text: str) -> List[List[int]]:
+        """Splits the text into overlapping BERT-sized windows instead of silently truncating it."""
+        token_ids = tokenizer.encode(cleaned_text, add_special_tokens=False)
+        body = INTENT_MAX_TOKENS - 2  # room for [CLS] and [SEP]
+        if len(token_ids) <= body:
+            return [token_ids]
+        step = body - INTENT_WINDOW_OVERLAP
+        windows = [token_ids[start:start + body] for start in range(0, len(token_ids) - INTENT_WINDOW_OVERLAP, step)]
+        if len(windows) > INTENT_MAX_WINDOWS:
+            # Keep evenly spaced windows so the beginning and the end are both covered
+            last = len(windows) - 1
+            windows = [windows[round(i * last / (INTENT_MAX_WINDOWS - 1))] for i in range(INTENT_MAX_WINDOWS)]
+        self.length_stats["intent_chunked"] += 1
+        logger.warning(f"[LENGTH BUDGET] Intent input of {len(token_ids)} tokens split into {len(windows)} windows")
+        return windows
+
+    def _intent_probabilities(self, slot: _ModelSlot, text: str) -> torch.Tensor:
+        """Softmax over intent labels, averaged over windows weighted by their token count."""
+        cleaned_text = self._preprocess_sentence(self._cap_input(text))
+        windows = self._intent_windows(slot.tokenizer, cleaned_text)
+        batch = slot.tokenizer.pad(
+            {"input_ids": [slot.tokenizer.build_inputs_with_special_tokens(w) for w in windows]},
+            padding=True, return_tensors="pt"
         )
-        input_ids = inputs["input_ids"].to(self.device)
-        attention_mask = inputs["attention_mask"].to(self.device)
-        
+        input_ids = batch["input_ids"].to(self.device)
+        attention_mask = batch["attention_mask"].to(self.device)
+
         with torch.no_grad():
-            outputs = self.intent_model(input_ids, attention_mask=attention_mask)
-            logits = outputs.logits
-            confidence = torch.softmax(logits, dim=1).max().item()
-            predicted_label_id = torch.argmax(logits, dim=1).item()
+            outputs = slot.model(input_ids, attention_mask=attention_mask)
+            probs = torch.softmax(outputs.logits, dim=1)
+            weights = torch.tensor([max(len(w), 1) for w in windows], dtype=probs.dtype, device=probs.device)
+            return (probs * weights.unsqueeze(1)).sum(dim=0) / weights.sum()
+
+    def classify_intent_detailed(self, text: str) -> Dict[str, Any]:
+        """Classifies a text and reports which intent model version produced the result."""
+        if not self.initialized:
+            raise RuntimeError("AIService is not initialized.")
+        if self.stub:
+            return self._stub_classification(text)
         
-        intent = self.intent_label_map.get(predicted_label_id, "unknown_intent")
-        return intent, confidence
+        with self._lease("intent") as slot:
+            probs = self._intent_probabilities(slot, text)
+            version = slot.version
+        predicted_label_id = torch.argmax(probs).item()
+        return {
+            "intent": self.intent_label_map.get(predicted_label_id, "unknown_intent"),
+            "confidence": probs.max().item(),
+            "probs": probs.tolist(),  # full vector in INTENT_LABELS order
+            "model_version": version
+        }
 
-    def generate_suggestion(self, text: str, style: str = "formal", model_version: str = "v1.00") -> str:
+    def _stub_classification(self, text: str) -> Dict[str, Any]:
+        """Deterministic stand-in for BERT: the same text always gets the same intent."""
+        if AI_STUB_LATENCY_MS:
+            time.sleep(AI_STUB_LATENCY_MS / 1000)
+        label_id = sum(map(ord, text or "")) % len(INTENT_LABELS)
+        probs = [0.1 / (len(INTENT_LABELS) - 1)] * len(INTENT_LABELS)
+        probs[label_id] = 0.9
+        return {"intent": INTENT_LABELS[label_id], "confidence": 0.9, "probs": probs,
+                "model_version": STUB_MODEL_VERSION}
+
+    def classify_intent(self, text: str) -> Tuple[str, float]:
+        result = self.classify_intent_detailed(text)
+        return result["intent"], result["confidence"]
+
+    def _budget_t5_text(self, tokenizer, cleaned_text: str) -> str:
+        """Caps the customer text inside the T5 prompt, keeping its head and tail."""
+        token_ids = tokenizer.encode(cleaned_text, add_special_tokens=False)
+        if len(token_ids) <= T5_MAX_TEXT_TOKENS:
+            return cleaned_text
+        head = T5_MAX_TEXT_TOKENS * 3 // 4
+        tail = T5_MAX_TEXT_TOKENS - head
+        self.length_stats["t5_truncated"] += 1
+        logger.warning(f"[LENGTH BUDGET] T5 input of {len(token_ids)} tokens truncated to {T5_MAX_TEXT_TOKENS}")
+        return " ".join([
+            tokenizer.decode(token_ids[:head], skip_special_tokens=True),
+            tokenizer.decode(token_ids[-tail:], skip_special_tokens=True)
+        ])
+
+    def resolve_intent(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Returns the intent of a message document as
+        {intent, confidence, model_version, reused}.
+        The stored classification is reused when it came from the intent model
+        currently loaded (or from a person); otherwise BERT runs again.
+        """
         if not self.initialized:
             raise RuntimeError("AIService is not initialized.")
+        intent = message.get("intent")
+        stored_version = message.get("intent_model_version")
+        if intent and stored_version in (self.intent_model_version, MANUAL_INTENT_VERSION):
+            self.intent_reuse_stats["reused"] += 1
+            return {
+                "intent": intent,
+                "confidence": message.get("intent_confidence") or 0.0,
+                "probs": None,
+                "model_version": stored_version,
+                "reused": True
+            }
+        self.intent_reuse_stats["inferred"] += 1
+        result = self.classify_intent_detailed(message.get("content", ""))
+        result["reused"] = False
+        return result
+
+    def _resolve_decoding_profile(self, style: str) -> Tuple[str, DecodingProfile]:
+        profiles = get_runtime_config().config.decoding_profiles
+        requested = (style or "formal").lower()
+        style = requested
+        if style not in profiles:
+            logger.warning(f"[AI SUGGESTION] Unknown decoding style '{requested}', falling back to 'formal'")
+            style = "formal"
+        profile = profiles.get(style) or default_decoding_profiles()[style]
+        return style, profile
+
+    def _record_decoding_latency(self, style: str, elapsed_ms: float, attempts: int, deadline_hit: bool):
+        stats = self.decoding_stats.setdefault(style, {
+            "calls": 0, "attempts": 0, "deadline_hits": 0,
+            "total_ms": 0.0, "max_ms": 0.0, "samples": deque(maxlen=LATENCY_SAMPLE_SIZE)
+        })
+        stats["calls"] += 1
+        stats["attempts"] += attempts
+        stats["deadline_hits"] += int(deadline_hit)
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        stats["samples"].append(elapsed_ms)
+
+    def get_decoding_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Measured generation latency per decoding profile since startup."""
+        result = {}
+        for style, stats in self.decoding_stats.items():
+            samples = sorted(stats["samples"])
+            calls = stats["calls"]
+            result[style] = {
+                "calls": calls,
+                "avg_attempts": round(stats["attempts"] / calls, 2) if calls else 0,
+                "deadline_hits": stats["deadline_hits"],
+                "avg_ms": round(stats["total_ms"] / calls, 1) if calls else 0,
+                "p50_ms": round(samples[len(samples) // 2], 1) if samples else 0,
+                "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 1) if samples else 0,
+                "max_ms": round(stats["max_ms"], 1),
+            }
+        return result
+
+    def generate_suggestion(self, text: str, style: str = "formal", model_version: Optional[str] = None,
+                            intent: Optional[str] = None) -> str:
+        """
+        Generates a reply; pass ``intent`` when it is already known to skip the BERT pass.
+        ``model_version`` defaults to the active suggestion model.
+        """
+        if not self.initialized:
+            raise RuntimeError("AIService is not initialized.")
+        model_version = model_version or self.default_suggest_version
         logger.info(f"[AI SUGGESTION] Using model version: {model_version}")
-        intent, _ = self.classify_intent(text)
-        cleaned_text = self._preprocess_sentence(text)
-        style_map = {
-            "simple": ("style: simple. Keep it short and simple.", 25),
-            "friendly": ("style: friendly", 50),
-            "formal": ("style: formal", 70)
-        }
-        style_prompt, max_words = style_map.get(style.lower(), style_map["formal"])
-        input_text = f"SCN_UNKNOWN | {intent} | {cleaned_text} | {style_prompt}"
-        if model_version == "v1.01":
-            model_dir = os.path.join(BASE_DIR, 'suggest_model', 'flan_t5_trained_model_v1.01')
-            if self.t5_tokenizer_v101 is None or self.t5_model_v101 is None:
-                logger.info(f"Loading T5 v1.01 from {model_dir}...")
-                from transformers import T5Tokenizer, T5ForConditionalGeneration
-                self.t5_tokenizer_v101 = T5Tokenizer.from_pretrained(model_dir)
-                self.t5_model_v101 = T5ForConditionalGeneration.from_pretrained(model_dir)
-                self.t5_model_v101.to(self.device)
-            tokenizer = self.t5_tokenizer_v101
-            model = self.t5_model_v101
+        if not intent:
+            intent, _ = self.classify_intent(text)
+        if self.stub:
+            if AI_STUB_LATENCY_MS:
+                time.sleep(AI_STUB_LATENCY_MS / 1000)
+            return f"[{style}] Thanks for your message about {intent.replace('intent_', '').replace('_', ' ')}."
+        cleaned_text = self._preprocess_sentence(self._cap_input(text))
+        style, profile = self._resolve_decoding_profile(style)
+        style_prompt = STYLE_PROMPTS.get(style, f"style: {style}")
+        max_words = profile.max_words
+        max_new_tokens = profile.max_new_tokens or math.ceil(max_words * TOKENS_PER_WORD) + 2
+        with self._lease("suggest", model_version) as slot:
+            return self._generate_with_profile(slot, intent, cleaned_text, style, style_prompt,
+                                               profile, max_words, max_new_tokens)
+
+    def _generate_with_profile(self, slot: _ModelSlot, intent: str, cleaned_text: str, style: str,
+                               style_prompt: str, profile: DecodingProfile, max_words: int,
+                               max_new_tokens: int) -> str:
+        tokenizer, model = slot.tokenizer, slot.model
+        input_text = f"SCN_UNKNOWN | {intent} | {self._budget_t5_text(tokenizer, cleaned_text)} | {style_prompt}"
+        input_ids = tokenizer(
+            input_text, max_length=T5_MAX_INPUT_TOKENS, truncation=True, return_tensors="pt"
+        ).input_ids.to(self.device)
+        generate_kwargs = {"max_new_tokens": max_new_tokens, "num_return_sequences": 1}
+        if profile.do_sample:
+            generate_kwargs.update(do_sample=True, top_k=profile.top_k, top_p=profile.top_p,
+                                   temperature=profile.temperature)
         else:
-            model_dir = os.path.join(BASE_DIR, 'suggest_model', 'flan_t5_trained_model_v1.00')
-            tokenizer = self.t5_tokenizer
-            model = self.t5_model
-        input_ids = tokenizer(input_text, return_tensors="pt").input_ids.to(self.device)
-        for _ in range(5):
-            output_ids = model.generate(
-                input_ids,
-                do_sample=True, top_k=30, top_p=0.95,
-                temperature=1.0, max_length=100, num_return_sequences=1
-            )
-            response = tokenizer.decode(output_ids[0], skip_special_tokens=True)
-            if len(response.split()) <= max_words:
-                return response
+            generate_kwargs.update(do_sample=False, num_beams=profile.num_beams)
+        # Greedy/beam decoding is deterministic, so retrying cannot produce a shorter answer
+        max_attempts = profile.max_attempts if profile.do_sample else 1
+        deadline = profile.deadline_ms / 1000.0
+        started = time.perf_counter()
+        attempts = 0
+        deadline_hit = False
+        response = ""
+        with torch.no_grad():
+            while attempts < max_attempts:
+                remaining = deadline - (time.perf_counter() - started)
+                if remaining <= 0:
+                    deadline_hit = True
+                    break
+                attempts += 1
+                # max_time cuts generation off mid-sequence once the budget is spent
+                output_ids = model.generate(input_ids, max_time=remaining, **generate_kwargs)
+                response = tokenizer.decode(output_ids[0], skip_special_tokens=True)
+                if len(response.split()) <= max_words:
+                    break
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms >= profile.deadline_ms:
+            deadline_hit = True
+        self._record_decoding_latency(style, elapsed_ms, attempts, deadline_hit)
+        if deadline_hit:
+            logger.warning(f"[AI SUGGESTION] '{style}' hit its {profile.deadline_ms}ms deadline after {attempts} attempt(s)")
+        words = response.split()
+        if len(words) > max_words:
+            response = " ".join(words[:max_words])
         return response
 
     async def classify_intent_async(self, message: str) -> IntentType:
@@ -176,6 +612,8 @@ class AIService:
                 ResponseStyle.SIMPLE: "simple"
             }
             style_str = style_mapping.get(style, "friendly")
+            # Pick up decoding profiles changed on another worker (TTL-bound, usually no query)
+            await get_runtime_config().refresh(get_database())
             return self.generate_suggestion(message, style_str)
         except Exception as e:
             logger.error(f"❌ Response generation failed: {e}")
@@ -185,16 +623,19 @@ class AIService:
         """Generate response suggestions asynchronously"""
         try:
             suggestions = []
+            await get_runtime_config().refresh(get_database())
+            # Classify once and share the intent across all styles
+            intent, _ = self.classify_intent(message)
             
             # Generate main suggestion
-            main_suggestion = self.generate_suggestion(message, style)
+            main_suggestion = self.generate_suggestion(message, style, intent=intent)
             suggestions.append(main_suggestion)
             
             # Generate alternative suggestions with different styles
             other_styles = ["simple", "formal", "friendly"]
             for other_style in other_styles:
                 if other_style != style and len(suggestions) < 3:
-                    suggestion = self.generate_suggestion(message, other_style)
+                    suggestion = self.generate_suggestion(message, other_style, intent=intent)
                     if suggestion not in suggestions:
                         suggestions.append(suggestion)
             
@@ -216,10 +657,14 @@ class AIService:
                 "device": str(self.device)
             },
             "model_paths": {
-                "intent_model": INTENT_MODEL_PATH,
-                "suggest_model": SUGGEST_MODEL_PATH,
+                "intent_model": model_path("intent", self.intent_model_version),
+                "suggest_model": model_path("suggest", self.default_suggest_version),
                 "abbr_dict": ABBR_DICT_PATH
-            }
+            },
+            "model_versions": self.get_model_status(),
+            "decoding_latency": self.get_decoding_stats(),
+            "intent_reuse": dict(self.intent_reuse_stats),
+            "oversized_inputs": dict(self.length_stats)
         }
 
 # Singleton instance for the application to use
@@ -238,16 +683,19 @@ class IntentHistoryService:
     def __init__(self, db):
         self.collection = db['intent_history']
 
-    async def add_intent(self, message_id, room_id, intent, confidence, classified_by, note=None):
+    async def add_intent(self, message_id, room_id, intent, confidence, classified_by, note=None, model_version=None, probs=None):
         doc = {
             'message_id': ObjectId(message_id),
             'room_id': room_id,
             'intent': intent,
             'confidence': confidence,
             'classified_by': classified_by,
+            'model_version': model_version,
             'created_at': datetime.utcnow(),
             'note': note
         }
+        if probs is not None:
+            doc['probs'] = pack_probs(probs)
         result = await self.collection.insert_one(doc)
         return str(result.inserted_id)
 
@@ -259,6 +707,24 @@ class IntentHistoryService:
         cursor = self.collection.find({'room_id': room_id}).sort('created_at', 1)
         return [IntentHistory(**doc) async for doc in cursor]
 
+    async def rethreshold_message_intents(self, messages_collection, query: dict, threshold: float, k: int = 2):
+        """
+        Re-derives intents from the probability vectors stored on messages, without re-running BERT.
+        Returns one entry per message with the thresholded intent and its top-k alternatives.
+        """
+        docs, matrix = await load_vectors(messages_collection, query, field="intent_probs")
+        intents = rethreshold(matrix, threshold)
+        alternatives = top_k(matrix, k)
+        return [
+            {
+                "message_id": str(doc["_id"]),
+                "stored_intent": doc.get("intent"),
+                "intent": intent,
+                "top_k": [{"intent": label, "probability": p} for label, p in alts]
+            }
+            for doc, intent, alts in zip(docs, intents, alternatives)
+        ]
+
     async def delete_intent(self, intent_id):
         result = await self.collection.delete_one({'_id': ObjectId(intent_id)})
         return result.deleted_count == 1
@@ -1,14 +1,28 @@
 from database.connection import get_database
 from bson.objectid import ObjectId
 from datetime import datetime, timezone
-from typing import List, Dict, Any, Optional
-from models.schemas import Message, ChatRoom, UserType, IntentType
+from typing import List, Dict, Any, Optional, Tuple
+from models.schemas import Message, ChatRoom, UserType, IntentType, MANUAL_INTENT_VERSION
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
 from pymongo.errors import PyMongoError
+from services.intent_vectors import pack_probs
+from services.identity_cache import get_identity_cache
+from services.wire import REPLY_PREVIEW_PROJECTION, reply_preview, compact_message
+from services.pagination import DEFAULT_PAGE_SIZE, clamp_page_size, encode_cursor, keyset_filter
+from services import search
 import logging
 
 _chat_service_instance = None
 
+# Fields never sent to clients: the packed intent probability vector is only read by analytics helpers,
+# search_tokens only by the search index
+MESSAGE_PROJECTION = {"intent_probs": 0, "search_tokens": 0}
+# Room counters maintained at write time (see save_message_with_room / update_message_intent)
+ROOM_STATS_PROJECTION = {"message_count": 1, "ai_message_count": 1, "intent_counts": 1, "dominant_intent": 1}
+# Rooms shown in the admin room list
+ACTIVE_ROOMS = {"status": "active"}
+
 class ChatService:
     def __init__(self, db: AsyncIOMotorDatabase):
         if db is None:
@@ -66,10 +80,35 @@ class ChatService:
             "message_count": room.get("message_count", 0),
             "satisfaction_rating": room.get("satisfaction_rating"),
             "dominant_intent": room.get("dominant_intent"),
-            "ai_usage_percentage": room.get("ai_usage_percentage", 0)
+            "ai_usage_percentage": self.room_statistics(room)["ai_usage_percentage"]
         }
         return serialized
 
+    @staticmethod
+    def room_statistics(room: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Statistics of a room from the counters kept on the room document
+        (message_count, ai_message_count, intent_counts), without touching messages.
+        """
+        message_count = room.get("message_count", 0)
+        ai_messages = room.get("ai_message_count", 0)
+        intent_counts = sorted(((intent, count) for intent, count in (room.get("intent_counts") or {}).items() if count > 0),
+                               key=lambda item: item[1], reverse=True)
+        return {
+            "message_count": message_count,
+            "intent_distribution": [
+                {
+                    "intent": intent,
+                    "count": count,
+                    "percentage": (count / message_count * 100) if message_count > 0 else 0
+                }
+                for intent, count in intent_counts
+            ],
+            "dominant_intent": room.get("dominant_intent"),
+            "ai_usage_count": ai_messages,
+            "ai_usage_percentage": (ai_messages / message_count * 100) if message_count > 0 else 0
+        }
+
     async def create_room(self, customer_id: str, customer_name: str) -> (Dict[str, Any], bool):
         """
         Finds an existing room or creates a new one.
@@ -81,7 +120,7 @@ class ChatService:
         # Try to get full name from users collection first
         final_customer_name = customer_name
         try:
-            user_doc = await self.users.find_one({"_id": ObjectId(customer_id)})
+            user_doc = await get_identity_cache().get_or_load(customer_id, self.db)
             if user_doc and user_doc.get("name"):
                 final_customer_name = user_doc["name"]
         except Exception:
@@ -108,7 +147,8 @@ class ChatService:
                 "status": "active",
                 "created_at": now,
                 "last_message": None,
-                "last_message_at": None
+                "last_message_at": None,
+                "message_count": 0
             }
             await self.chat_rooms.insert_one(room)
 
@@ -118,45 +158,164 @@ class ChatService:
         room = await self.db.chat_rooms.find_one({"_id": ObjectId(room_id)})
         return self._serialize_room(room) if room else None
 
-    async def get_active_rooms(self) -> List[Dict[str, Any]]:
-        rooms = []
-        # Sort by last_message_at descending to get the most recent chats first
-        async for room in self.chat_rooms.find({"status": "active"}).sort("last_message_at", -1):
-            room["_id"] = str(room["_id"])
-            display_name = room.get("customer_name")
-            customer_id = room.get("customer_id")
-            if customer_id:
-                try:
-                    user_doc = await self.users.find_one({"_id": ObjectId(customer_id)})
-                    if user_doc and user_doc.get("name"):
-                        display_name = user_doc.get("name")
-                except Exception:
-                    pass
-            room["customer_name"] = display_name or f"User {str(room['_id'])[-6:]}"
-            # Serialize last_message if it's an object
-            if isinstance(room.get("last_message"), dict):
-                last_msg = room["last_message"]
-                if last_msg.get("_id"):
-                    last_msg["_id"] = str(last_msg["_id"])
-                if last_msg.get("user_id"):
-                    last_msg["user_id"] = str(last_msg["user_id"])
-                if last_msg.get("created_at") and isinstance(last_msg["created_at"], datetime):
-                    last_msg["created_at"] = last_msg["created_at"].isoformat()
-            # --- Bổ sung unread_count cho admin ---
-            admin_last_read_at = room.get("admin_last_read_at")
-            query = {"room_id": room["_id"], "user_type": "customer"}  # Chỉ tính tin nhắn của customer
-            if admin_last_read_at:
-                query["created_at"] = {"$gt": admin_last_read_at}
-            unread_count = await self.messages.count_documents(query)
-            room["unread_count"] = unread_count
-            rooms.append(room)
+    # Query builders: every filter of a hot query is built by one of these, so that
+    # check_query_plans.py explains exactly what the methods below send to MongoDB
+
+    @staticmethod
+    def room_list_pipeline(match: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Rooms matching `match`, most recent first, each with its customer's user document
+        (only the name) joined in: customer_id is a string, users._id an ObjectId.
+        """
+        return [
+            {"$match": match},
+            {"$sort": {"last_message_at": -1}},
+            {"$lookup": {
+                "from": "users",
+                "let": {"customer_oid": {"$convert": {"input": "$customer_id", "to": "objectId", "onError": None, "onNull": None}}},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$_id", "$$customer_oid"]}}},
+                    {"$project": {"name": 1}},
+                ],
+                "as": "customer",
+            }},
+        ]
+
+    @staticmethod
+    def unread_query(room_id: str, admin_last_read_at: Optional[datetime]) -> Dict[str, Any]:
+        """Customer messages of a room the admin has not read yet (soft-deleted ones excluded)."""
+        query = {"room_id": room_id, "user_type": "customer", "is_deleted": {"$ne": True}}  # Chỉ tính tin nhắn của customer
+        if admin_last_read_at:
+            query["created_at"] = {"$gt": admin_last_read_at}
+        return query
+
+    @staticmethod
+    def message_page_query(room_id: str, before: Optional[str] = None,
+                           after: Optional[str] = None) -> Tuple[Dict[str, Any], List[Tuple[str, int]]]:
+        """(filter, sort) of one history page, see get_message_page. Raises InvalidCursor."""
+        query: Dict[str, Any] = {"room_id": room_id}
+        if after:
+            query.update(keyset_filter(after, "after"))
+            order = 1
+        else:
+            if before:
+                query.update(keyset_filter(before, "before"))
+            order = -1
+        return query, [("created_at", order), ("_id", order)]
+
+    @staticmethod
+    def after_seq_query(room_id: str, after_seq: int) -> Tuple[Dict[str, Any], List[Tuple[str, int]]]:
+        """(filter, sort) of the messages a reconnecting client missed."""
+        return {"room_id": room_id, "seq": {"$gt": after_seq}}, [("seq", 1)]
+
+    @staticmethod
+    def search_query(keyword: Optional[str] = None, intent: Optional[IntentType] = None,
+                     room_ids: Optional[List[str]] = None, date_from: Optional[datetime] = None,
+                     date_to: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """
+        Filter of search_messages, sorted by created_at descending. room_ids are the rooms of
+        the searched customer, None for all rooms. None when the keyword has no searchable word.
+        """
+        query = {}
+
+        if keyword:
+            tokens = search.query_tokens(keyword)
+            if not tokens:
+                return None
+            query["search_tokens"] = {"$all": tokens}
+
+        if intent:
+            query["intent"] = getattr(intent, "value", intent)
+
+        if room_ids is not None:
+            query["room_id"] = {"$in": room_ids}
+
+        if date_from or date_to:
+            date_query = {}
+            if date_from:
+                date_query["$gte"] = date_from
+            if date_to:
+                date_query["$lte"] = date_to
+            query["created_at"] = date_query
+
+        return query
+
+    @staticmethod
+    def uncategorized_query() -> Dict[str, Any]:
+        return {"intent": {"$exists": False}}
+
+    @staticmethod
+    def last_seen_query(room_id: str, admin_last_read_at: datetime) -> Tuple[Dict[str, Any], List[Tuple[str, int]]]:
+        """(filter, sort) of the newest customer message at or before admin_last_read_at."""
+        return ({"room_id": room_id, "user_type": "customer", "created_at": {"$lte": admin_last_read_at}},
+                [("created_at", -1)])
+
+    async def _list_rooms(self, match: Dict[str, Any]) -> List[Dict[str, Any]]:
+        rooms = await self.chat_rooms.aggregate(self.room_list_pipeline(match)).to_list(length=None)
+        for room in rooms:
+            customer = room.pop("customer", None)
+            self._summarize_room(room, customer[0] if customer else None)
+            if "unread_count" not in room:
+                room["unread_count"] = await self._backfill_unread(room)
         return rooms
 
-    async def save_message(self, room_id: str, user_id: str, user_type: str, content: str, reply_to_message_id: str = None) -> Optional[Dict[str, Any]]:
+    async def get_active_rooms(self) -> List[Dict[str, Any]]:
+        # One aggregation served by the (status, last_message_at) index, customer names joined by $lookup
+        return await self._list_rooms(ACTIVE_ROOMS)
+
+    async def get_room_summary(self, room_id: str) -> Optional[Dict[str, Any]]:
+        """One room in the shape returned by get_active_rooms, for room_updated events."""
+        rooms = await self._list_rooms({"_id": room_id})
+        return rooms[0] if rooms else None
+
+    def _summarize_room(self, room: Dict[str, Any], user_doc: Optional[Dict[str, Any]]):
+        """Serializes a room document in place for the admin room list."""
+        room["_id"] = str(room["_id"])
+        display_name = room.get("customer_name")
+        if user_doc and user_doc.get("name"):
+            display_name = user_doc.get("name")
+        room["customer_name"] = display_name or f"User {str(room['_id'])[-6:]}"
+        # Serialize last_message if it's an object
+        if isinstance(room.get("last_message"), dict):
+            last_msg = room["last_message"]
+            if last_msg.get("_id"):
+                last_msg["_id"] = str(last_msg["_id"])
+            if last_msg.get("user_id"):
+                last_msg["user_id"] = str(last_msg["user_id"])
+            if last_msg.get("created_at") and isinstance(last_msg["created_at"], datetime):
+                last_msg["created_at"] = last_msg["created_at"].isoformat()
+
+    async def _backfill_unread(self, room: Dict[str, Any]) -> int:
+        """
+        unread_count is a counter kept on the room (save_message / mark_room_as_read_by_admin).
+        Rooms created before the counter existed get it counted once and stored.
+        """
+        unread = await self.messages.count_documents(self.unread_query(room["_id"], room.get("admin_last_read_at")))
+        # Only if no message created the counter in the meantime
+        await self.chat_rooms.update_one({"_id": room["_id"], "unread_count": {"$exists": False}},
+                                         {"$set": {"unread_count": unread}})
+        return unread
+
+    async def save_message(self, room_id: str, user_id: str, user_type: str, content: str, reply_to_message_id: str = None,
+                           is_ai_generated: bool = False) -> Optional[Dict[str, Any]]:
+        message, _ = await self.save_message_with_room(room_id, user_id, user_type, content, reply_to_message_id, is_ai_generated)
+        return message
+
+    async def save_message_with_room(self, room_id: str, user_id: str, user_type: str, content: str,
+                                     reply_to_message_id: str = None,
+                                     is_ai_generated: bool = False) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Updates the room, then inserts the message: one find_one_and_update plus one insert.
+        The room update atomically takes the next per-room sequence number (`seq`), so
+        messages of a room are numbered 1, 2, 3... in the order the server accepted them.
+        Returns (serialized message, room counters as they were *before* this message);
+        the second item is None when the room does not exist (the message then has no seq).
+        """
         now = datetime.utcnow()
         
-        # 1. Prepare the message document for insertion
+        # 1. Prepare the message document; the _id is generated here so the room can reference it
         new_message_data = {
+            "_id": ObjectId(),
             "room_id": room_id,
             "user_id": user_id,
             "user_type": user_type,
@@ -165,49 +324,150 @@ class ChatService:
         }
         if reply_to_message_id:
             new_message_data["reply_to_message_id"] = reply_to_message_id
+        if is_ai_generated:
+            new_message_data["is_ai_generated"] = True
 
-        # 2. Insert the new message
-        result = await self.messages.insert_one(new_message_data)
-        inserted_id = result.inserted_id
-        
-        # 3. Fetch the newly inserted message (now it's a dict)
-        final_msg = await self.messages.find_one({"_id": inserted_id})
-
-        # 4. If it's a reply, populate the `reply_to_message` field
+        # 2. If it's a reply, store a snapshot of the replied-to message (only the fields the
+        # UI shows) so reading the thread never has to look it up again
         if reply_to_message_id:
             try:
                 # Use ObjectId directly for the query
-                replied_to_message = await self.messages.find_one({"_id": ObjectId(reply_to_message_id)})
+                replied_to_message = await self.messages.find_one({"_id": ObjectId(reply_to_message_id)}, REPLY_PREVIEW_PROJECTION)
                 if replied_to_message:
-                    # Just attach the raw document. Serialization will handle it.
-                    final_msg["reply_to_message"] = replied_to_message
+                    new_message_data["reply_to_message"] = reply_preview(replied_to_message)
             except Exception as e:
                 print(f"Error populating replied-to message {reply_to_message_id}: {e}")
+        final_msg = dict(new_message_data)
+
+        serialized = self._serialize_message(final_msg)
+
+        # 3. Update the room's last message and counters in one round trip.
+        # The pre-update counters give the message's seq and tell the caller whether
+        # this was the room's first message.
+        counters = {"message_count": 1, "last_seq": 1}
+        if user_type == UserType.CUSTOMER.value:
+            # Unread by admins until mark_room_as_read_by_admin resets it
+            counters["unread_count"] = 1
+        if is_ai_generated:
+            counters["ai_message_count"] = 1
+        room_before = await self.chat_rooms.find_one_and_update(
+            {"_id": room_id},
+            {
+                "$set": {"last_message": compact_message(serialized), "last_message_at": serialized["created_at"]},
+                "$inc": counters
+            },
+            projection={"message_count": 1, "last_message": 1, "last_message_at": 1, "last_seq": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        if room_before is not None:
+            new_message_data["seq"] = serialized["seq"] = room_before.get("last_seq", 0) + 1
 
-        # 5. Update the room's last message with a serialized version of the message
-        # We serialize here to ensure the last_message stored in the room is clean
-        serialized_for_room = self._serialize_message(final_msg.copy())
-        await self.update_room_last_message(room_id, serialized_for_room)
+        # 4. Insert the message, with the words it is found by (kept out of the serialized copy).
+        # If this fails after the room update, its seq is simply never used: clients treat
+        # the gap as "nothing to fetch"; the other counters are taken back.
+        new_message_data["search_tokens"] = search.tokenize(content)
+        try:
+            await self.messages.insert_one(new_message_data)
+        except PyMongoError:
+            if room_before is not None:
+                await self._undo_room_update(room_id, counters, room_before, serialized["_id"])
+            raise
 
-        # 6. Return the fully serialized message for socket emission
-        return self._serialize_message(final_msg)
+        # 5. Return the fully serialized message for socket emission
+        return serialized, room_before
 
-    async def get_messages_by_room_id(self, room_id: str, limit: int = 100) -> List[Dict[str, Any]]:
-        messages = []
-        cursor = self.messages.find({"room_id": room_id}).sort("created_at", 1).limit(limit)
-        async for msg in cursor:
-            # Populate reply_to_message if this message is a reply
-            if msg.get("reply_to_message_id"):
-                try:
-                    replied_to_message = await self.messages.find_one({"_id": ObjectId(msg["reply_to_message_id"])})
-                    if replied_to_message:
-                        msg["reply_to_message"] = replied_to_message
-                except Exception as e:
-                    print(f"Error populating replied-to message {msg.get('reply_to_message_id')}: {e}")
-            
-            # The full serialization is now needed here as well
-            messages.append(self._serialize_message(msg))
-        return messages
+    async def _undo_room_update(self, room_id: str, counters: Dict[str, int], room_before: Dict[str, Any], message_id: str):
+        """Takes back the counters of a message whose insert failed (last_seq stays: a gap is harmless)."""
+        try:
+            await self.chat_rooms.update_one({"_id": room_id}, {"$inc": {field: -1 for field in counters if field != "last_seq"}})
+            # Restore the previous last message unless a newer message has replaced it meanwhile
+            await self.chat_rooms.update_one(
+                {"_id": room_id, "last_message._id": message_id},
+                {"$set": {"last_message": room_before.get("last_message"), "last_message_at": room_before.get("last_message_at")}}
+            )
+        except PyMongoError as e:
+            logging.error(f"Room {room_id} counters are off by one message after a failed insert "
+                          f"({e}); run rebuild_room_stats.py --room {room_id}")
+
+    @staticmethod
+    def is_first_message(room_before: Optional[Dict[str, Any]]) -> bool:
+        """True when the room had no message before the one just saved."""
+        if not room_before:
+            return False
+        # Rooms created before message_count existed still have last_message_at set
+        return not room_before.get("message_count") and not room_before.get("last_message_at")
+
+    async def get_messages_by_room_id(self, room_id: str, limit: int = 100, after_seq: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        The newest `limit` messages of a room, oldest first. With after_seq, only messages
+        whose seq is greater (what a reconnecting client missed), in seq order.
+        """
+        if after_seq is None:
+            messages, _, _ = await self.get_message_page(room_id, limit)
+            return messages
+        query, sort = self.after_seq_query(room_id, after_seq)
+        cursor = self.messages.find(query, MESSAGE_PROJECTION).sort(sort).limit(limit)
+        raw_messages = await cursor.to_list(length=limit)
+        await self._hydrate_replies(raw_messages)
+        return [self._serialize_message(msg) for msg in raw_messages]
+
+    async def get_messages_after_seq(self, room_id: str, after_seq: int,
+                                     limit: int = DEFAULT_PAGE_SIZE) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        At most `limit` messages with seq > after_seq, in seq order, and whether more follow
+        (the caller asks again from the last seq it got). Shared by the sync event and REST.
+        """
+        messages = await self.get_messages_by_room_id(room_id, limit=limit + 1, after_seq=after_seq)
+        return messages[:limit], len(messages) > limit
+
+    async def get_message_page(self, room_id: str, limit: int = DEFAULT_PAGE_SIZE, before: Optional[str] = None,
+                               after: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str], Optional[str]]:
+        """
+        One page of a room's history, oldest first, by keyset on (created_at, _id) using the
+        (room_id, created_at, _id) index: without a cursor the newest page, with `before`
+        the page of older messages, with `after` the page of newer ones.
+        Returns (messages, prev_cursor, next_cursor); prev_cursor points at older messages
+        and next_cursor at newer ones, each None when there is nothing more that way.
+        Raises InvalidCursor for a malformed cursor.
+        """
+        limit = clamp_page_size(limit)
+        query, sort = self.message_page_query(room_id, before, after)
+        order = sort[0][1]
+        # One extra document tells whether another page exists in the direction of travel
+        cursor = self.messages.find(query, MESSAGE_PROJECTION).sort(sort).limit(limit + 1)
+        raw_messages = await cursor.to_list(length=limit + 1)
+        has_more = len(raw_messages) > limit
+        raw_messages = raw_messages[:limit]
+        if order == -1:
+            raw_messages.reverse()
+
+        prev_cursor = next_cursor = None
+        if raw_messages:
+            # Moving backwards there is more before if the query overflowed; there is more
+            # after whenever we started from a cursor (the cursor's message itself), and
+            # symmetrically when moving forwards
+            if (order == -1 and has_more) or (order == 1 and after):
+                prev_cursor = encode_cursor(raw_messages[0])
+            if (order == 1 and has_more) or (order == -1 and before):
+                next_cursor = encode_cursor(raw_messages[-1])
+        await self._hydrate_replies(raw_messages)
+        return [self._serialize_message(msg) for msg in raw_messages], prev_cursor, next_cursor
+
+    async def _hydrate_replies(self, messages: List[Dict[str, Any]]):
+        """
+        Replies store a snapshot of the replied-to message when they are saved. Older
+        replies without one get it here: one $in query for the whole page.
+        """
+        missing = {}
+        for msg in messages:
+            reply_to = msg.get("reply_to_message_id")
+            if reply_to and not msg.get("reply_to_message") and ObjectId.is_valid(reply_to):
+                missing.setdefault(ObjectId(reply_to), []).append(msg)
+        if not missing:
+            return
+        async for replied_to_message in self.messages.find({"_id": {"$in": list(missing)}}, REPLY_PREVIEW_PROJECTION):
+            for msg in missing[replied_to_message["_id"]]:
+                msg["reply_to_message"] = reply_preview(replied_to_message)
 
     async def update_room_last_message(self, room_id: str, message: Dict[str, Any]):
         await self.chat_rooms.update_one(
@@ -239,7 +499,7 @@ class ChatService:
 
     async def get_active_chat_rooms(self) -> List[Dict[str, Any]]:
         """Get all active chat rooms, trả về đúng format cho frontend"""
-        cursor = self.chat_rooms.find({"status": "active"})
+        cursor = self.chat_rooms.find(ACTIVE_ROOMS)
         rooms = []
         name_count = {}
         async for room in cursor:
@@ -259,69 +519,146 @@ class ChatService:
             })
         return rooms
 
-    async def get_messages(self, room_id: str, limit: int = 50, skip: int = 0) -> List[Dict[str, Any]]:
-        """Get messages for a specific room, finding the room first."""
-        room = await self.get_room_by_id(room_id)
-        if not room:
-            print(f"[CHAT_SERVICE] Room not found for ID: {room_id}, cannot fetch messages.")
-            return []
-
-        print(f"[CHAT_SERVICE] Fetching messages from DB for room_id: {room_id}")
-        cursor = self.messages.find({"room_id": room_id})
-        cursor = cursor.sort("timestamp", 1).skip(skip).limit(limit)
-        
-        messages = []
-        async for message in cursor:
-            message["_id"] = str(message["_id"])
-            messages.append(message)
-        
-        print(f"[CHAT_SERVICE] Messages fetched: {messages}")
+    async def get_messages(self, room_id: str, limit: int = DEFAULT_PAGE_SIZE, before: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get messages for a specific room: the newest page, or the page before a cursor."""
+        messages, _, _ = await self.get_message_page(room_id, limit, before=before)
         return messages
 
     async def search_messages(self, keyword: str = None, intent: IntentType = None, 
                             customer_id: str = None, date_from: datetime = None, 
-                            date_to: datetime = None, limit: int = 50) -> List[Dict[str, Any]]:
-        """Search messages with filters"""
-        query = {}
-        
-        if keyword:
-            query["content"] = {"$regex": keyword, "$options": "i"}
-        
-        if intent:
-            query["intent"] = intent.value
-        
+                            date_to: datetime = None, limit: int = 50, offset: int = 0) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Search messages with filters, newest first. With a keyword, messages containing every
+        word of it regardless of case and diacritics ("khong" finds "không"), ranked by
+        services.search.rank among the newest SEARCH_CANDIDATES matches, each with its `score`.
+        Every filter is served by the search_tokens / created_at / intent / room_id indexes.
+        Returns (messages, truncated): truncated when more matches exist than were ranked.
+        """
+        room_ids = None
         if customer_id:
             # First get room IDs for this customer
-            rooms = await self.chat_rooms.find({"customer_id": customer_id})
-            room_ids = [str(room["_id"]) async for room in rooms]
-            query["room_id"] = {"$in": room_ids}
-        
-        if date_from or date_to:
-            date_query = {}
-            if date_from:
-                date_query["$gte"] = date_from
-            if date_to:
-                date_query["$lte"] = date_to
-            query["timestamp"] = date_query
+            room_ids = [room["_id"] async for room in self.chat_rooms.find({"customer_id": customer_id}, {"_id": 1})]
+        query = self.search_query(keyword, intent, room_ids, date_from, date_to)
+        if query is None:
+            return [], False
         
-        cursor = self.messages.find(query)
-        cursor = cursor.sort("timestamp", -1).limit(limit)
+        cursor = self.messages.find(query, MESSAGE_PROJECTION).sort("created_at", -1)
+        truncated = False
+        if keyword:
+            # One candidate past the window tells whether the window cut matches off
+            candidates = await cursor.limit(search.SEARCH_CANDIDATES + 1).to_list(length=search.SEARCH_CANDIDATES + 1)
+            truncated = len(candidates) > search.SEARCH_CANDIDATES
+            raw_messages = search.rank(candidates[:search.SEARCH_CANDIDATES], keyword)
+            raw_messages = raw_messages[offset:offset + limit]
+        else:
+            raw_messages = await cursor.skip(offset).limit(limit).to_list(length=limit)
         
         messages = []
-        async for message in cursor:
-            message["id"] = str(message["_id"])
-            message.pop("_id")
+        for message in raw_messages:
+            message = self._serialize_message(message)
+            message["id"] = message.pop("_id")
             messages.append(message)
         
-        return messages
+        return messages, truncated
 
-    async def update_message_intent(self, message_id: str, intent: str, confidence: float) -> bool:
-        """Update message intent classification. Accepts intent as a string."""
-        result = await self.messages.update_one(
-            {"_id": ObjectId(message_id)},
-            {"$set": {"intent": intent, "intent_confidence": confidence}}
+    async def update_message_intent(self, message_id: str, intent: str, confidence: float,
+                                    model_version: Optional[str] = None, probs: Optional[List[float]] = None) -> bool:
+        """
+        Update message intent classification. Accepts intent as a string.
+        `model_version` is the intent model that produced the label; None means it was set by a person.
+        `probs` is the full probability vector, stored packed so the message can be re-thresholded later.
+        """
+        update = {"$set": {
+            "intent": intent,
+            "intent_confidence": confidence,
+            "intent_model_version": model_version or MANUAL_INTENT_VERSION
+        }}
+        if probs is not None:
+            update["$set"]["intent_probs"] = pack_probs(probs)
+        else:
+            # A manual label makes any stored model vector stale
+            update["$unset"] = {"intent_probs": ""}
+        # The document as it was before tells whether this is a first classification or a
+        # reclassification, so the room histogram moves one count from the old intent
+        before = await self.messages.find_one_and_update(
+            {"_id": ObjectId(message_id)}, update,
+            projection={"room_id": 1, "intent": 1, "is_deleted": 1},
+            return_document=ReturnDocument.BEFORE
         )
-        return result.modified_count > 0
+        if before is None:
+            return False
+        previous_intent = before.get("intent")
+        intent = getattr(intent, "value", intent)  # IntentType from the manual labelling endpoint
+        # Soft-deleted messages no longer count in the room histogram (see soft_delete_message)
+        if previous_intent != intent and not before.get("is_deleted"):
+            await self.chat_rooms.update_one({"_id": before["room_id"]},
+                                             self._intent_histogram_update(previous_intent, intent))
+        return True
+
+    @staticmethod
+    def _intent_histogram_update(previous_intent: Optional[str], intent: Optional[str]) -> List[Dict[str, Any]]:
+        """
+        Update pipeline moving one message from previous_intent to intent in the room's
+        intent_counts and recomputing dominant_intent, atomically in one write.
+        """
+        changes = []
+        if intent:
+            changes.append({intent: {"$add": [{"$ifNull": [f"$intent_counts.{intent}", 0]}, 1]}})
+        if previous_intent:
+            changes.append({previous_intent: {"$max": [0, {"$add": [{"$ifNull": [f"$intent_counts.{previous_intent}", 0]}, -1]}]}})
+        return [
+            {"$set": {"intent_counts": {"$mergeObjects": [{"$ifNull": ["$intent_counts", {}]}, *changes]}}},
+            {"$set": {"dominant_intent": {"$let": {
+                "vars": {"top": {"$reduce": {
+                    "input": {"$objectToArray": "$intent_counts"},
+                    "initialValue": {"k": None, "v": 0},
+                    "in": {"$cond": [{"$gt": ["$$this.v", "$$value.v"]}, "$$this", "$$value"]},
+                }}},
+                "in": "$$top.k",
+            }}}},
+        ]
+
+    async def soft_delete_message(self, message_id: str) -> Optional[str]:
+        """
+        Marks a message deleted and takes it out of its room's counters (message_count,
+        ai_message_count, unread_count, intent_counts / dominant_intent) in one room update,
+        as rebuild_room_stats.py would count them. Returns the room id, or None when the
+        message does not exist or was already deleted.
+        """
+        before = await self.messages.find_one_and_update(
+            {"_id": ObjectId(message_id), "is_deleted": {"$ne": True}},
+            {"$set": {"is_deleted": True}},
+            projection={"room_id": 1, "user_type": 1, "is_ai_generated": 1, "intent": 1, "created_at": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        if before is None:
+            return None
+        room_id = before["room_id"]
+        await self.chat_rooms.update_one({"_id": room_id}, self._removed_message_update(before))
+        return room_id
+
+    @staticmethod
+    def _removed_message_update(message: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Update pipeline taking one message out of the room counters. Counters a legacy room
+        does not have yet stay missing, so they are still backfilled from the messages.
+        """
+        def decrement(field: str, condition: Any = True) -> Dict[str, Any]:
+            return {"$cond": [{"$and": [condition, {"$gt": [f"${field}", 0]}]},
+                              {"$add": [f"${field}", -1]}, f"${field}"]}
+
+        counters = {"message_count": decrement("message_count")}
+        if message.get("is_ai_generated"):
+            counters["ai_message_count"] = decrement("ai_message_count")
+        if message.get("user_type") == UserType.CUSTOMER.value:
+            # Only still unread if the admin last read the room before it was sent
+            unread = {"$or": [{"$eq": [{"$ifNull": ["$admin_last_read_at", None]}, None]},
+                              {"$gt": [message.get("created_at"), "$admin_last_read_at"]}]}
+            counters["unread_count"] = decrement("unread_count", unread)
+        pipeline = [{"$set": counters}]
+        if message.get("intent"):
+            pipeline.extend(ChatService._intent_histogram_update(message["intent"], None))
+        return pipeline
 
     async def add_suggestion_to_message(self, message_id: str, suggestion_doc: Dict[str, Any]):
         """
@@ -368,9 +705,8 @@ class ChatService:
 
     async def get_uncategorized_messages(self, limit: int = 50) -> List[Dict[str, Any]]:
         """Fetch messages that do not have an intent classified yet."""
-        query = {"intent": {"$exists": False}}
-        cursor = self.messages.find(query)
-        cursor = cursor.sort("timestamp", -1).limit(limit)
+        cursor = self.messages.find(self.uncategorized_query(), MESSAGE_PROJECTION)
+        cursor = cursor.sort("created_at", -1).limit(limit)
         
         messages = []
         async for message in cursor:
@@ -381,37 +717,9 @@ class ChatService:
         return messages
 
     async def get_chat_statistics(self, room_id: str) -> Dict[str, Any]:
-        """Get statistics for a specific chat room"""
-        # Get message count
-        message_count = await self.messages.count_documents({"room_id": room_id})
-        
-        # Get intent distribution
-        pipeline = [
-            {"$match": {"room_id": room_id, "intent": {"$ne": None}}},
-            {"$group": {"_id": "$intent", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}}
-        ]
-        
-        intent_stats = []
-        async for stat in self.messages.aggregate(pipeline):
-            intent_stats.append({
-                "intent": stat["_id"],
-                "count": stat["count"],
-                "percentage": (stat["count"] / message_count * 100) if message_count > 0 else 0
-            })
-        
-        # Get AI usage
-        ai_messages = await self.messages.count_documents({
-            "room_id": room_id,
-            "is_ai_generated": True
-        })
-        
-        return {
-            "message_count": message_count,
-            "intent_distribution": intent_stats,
-            "ai_usage_count": ai_messages,
-            "ai_usage_percentage": (ai_messages / message_count * 100) if message_count > 0 else 0
-        }
+        """Get statistics for a specific chat room: one read of the room's counters"""
+        room = await self.chat_rooms.find_one({"_id": room_id}, ROOM_STATS_PROJECTION) or {}
+        return self.room_statistics(room)
 
     async def update_ai_analysis(self, message_id: str, ai_analysis: dict):
         """Update ai_analysis and push to ai_analysis_history"""
@@ -451,7 +759,7 @@ class ChatService:
     async def get_message_by_id(self, message_id: str) -> Optional[Dict[str, Any]]:
         """Get a message by its ID"""
         try:
-            message = await self.messages.find_one({"_id": ObjectId(message_id)})
+            message = await self.messages.find_one({"_id": ObjectId(message_id)}, MESSAGE_PROJECTION)
             if message:
                 message["_id"] = str(message["_id"])
             return message
@@ -461,7 +769,7 @@ class ChatService:
 
     async def mark_room_as_read_by_admin(self, room_id: str):
         now = datetime.utcnow()
-        await self.chat_rooms.update_one({"_id": room_id}, {"$set": {"admin_last_read_at": now}})
+        await self.chat_rooms.update_one({"_id": room_id}, {"$set": {"admin_last_read_at": now, "unread_count": 0}})
 
     async def get_last_seen_message_by_customer(self, room_id: str) -> Optional[Dict[str, Any]]:
         """Trả về message cuối cùng của customer mà admin đã đọc (dựa vào admin_last_read_at)."""
@@ -472,10 +780,8 @@ class ChatService:
         if not admin_last_read_at:
             return None
         # Tìm message customer gần nhất trước hoặc bằng admin_last_read_at
-        msg = await self.messages.find_one(
-            {"room_id": room_id, "user_type": "customer", "created_at": {"$lte": admin_last_read_at}},
-            sort=[("created_at", -1)]
-        )
+        query, sort = self.last_seen_query(room_id, admin_last_read_at)
+        msg = await self.messages.find_one(query, sort=sort)
         if not msg:
             return None
         return {"user_id": msg.get("user_id"), "user_type": msg.get("user_type"), "last_message_id": str(msg["_id"])}
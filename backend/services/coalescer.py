@@ -0,0 +1,54 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable, Set
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class KeyedCoalescer:
+    """
+    Collapses bursts of "key changed" notifications into one flush per key.
+    The first schedule() for a key starts a timer; further calls within the window
+    are absorbed, and flush(key) runs once when the window closes, so it always
+    sees the latest state.
+    """
+
+    def __init__(self, flush: Callable[[Hashable], Awaitable[Any]], window_seconds: float, name: str = "coalescer"):
+        self._flush = flush
+        self.window_seconds = window_seconds
+        self.name = name
+        self._pending: Set[Hashable] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.scheduled = 0
+        self.flushed = 0
+        self.failed = 0
+
+    def schedule(self, key: Hashable):
+        self.scheduled += 1
+        if key in self._pending:
+            return
+        self._pending.add(key)
+        task = asyncio.get_running_loop().create_task(self._flush_later(key))
+        # Keep a reference so the task is not garbage collected mid-sleep
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush_later(self, key: Hashable):
+        await asyncio.sleep(self.window_seconds)
+        # Changes arriving from here on start a new window
+        self._pending.discard(key)
+        try:
+            await self._flush(key)
+            self.flushed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"{self.name}: flush for {key!r} failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": round(self.window_seconds * 1000),
+            "pending": len(self._pending),
+            "scheduled": self.scheduled,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "coalesced": self.scheduled - self.flushed - self.failed - len(self._pending),
+        }
@@ -0,0 +1,51 @@
+from typing import Optional, Union
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from models.schemas import SystemConfig
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# How long a worker may serve a cached copy of system_config before re-reading it.
+# Updates made through the admin API are applied immediately on the worker that
+# handled them; other workers pick them up within this window.
+CONFIG_TTL_SECONDS = 30
+
+class RuntimeConfig:
+    """In-process cache of the main ``system_config`` document."""
+
+    def __init__(self, ttl_seconds: float = CONFIG_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._config = SystemConfig()
+        self._loaded_at = 0.0
+
+    @property
+    def config(self) -> SystemConfig:
+        return self._config
+
+    def apply(self, config: Union[SystemConfig, dict]):
+        """Replace the cached config, e.g. right after an admin update."""
+        if isinstance(config, dict):
+            config = SystemConfig(**config)
+        self._config = config
+        self._loaded_at = time.monotonic()
+
+    async def refresh(self, db: Optional[AsyncIOMotorDatabase], force: bool = False) -> SystemConfig:
+        """Re-read system_config when the cached copy is older than the TTL."""
+        if db is None:
+            return self._config
+        if not force and time.monotonic() - self._loaded_at < self.ttl_seconds:
+            return self._config
+        try:
+            doc = await db["system_config"].find_one({"type": "main"})
+            self.apply(doc or SystemConfig())
+        except Exception as e:
+            # Keep serving the last known config rather than failing the request
+            logger.warning(f"Failed to refresh system_config, keeping cached copy: {e}")
+            self._loaded_at = time.monotonic()
+        return self._config
+
+runtime_config = RuntimeConfig()
+
+def get_runtime_config() -> RuntimeConfig:
+    return runtime_config
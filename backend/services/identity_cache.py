@@ -0,0 +1,78 @@
+from typing import Any, Dict, Optional
+from collections import OrderedDict
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from services import metrics
+import os
+import time
+
+IDENTITY_CACHE_TTL_SECONDS = float(os.getenv("IDENTITY_CACHE_TTL_SECONDS", 60))
+IDENTITY_CACHE_MAX_SIZE = int(os.getenv("IDENTITY_CACHE_MAX_SIZE", 10000))
+
+class IdentityCache:
+    """
+    TTL + LRU cache of user documents keyed by user id, shared by token auth,
+    socket connect and room creation. The admin room list joins customer names
+    with $lookup instead, so it does not show up in these counters. Entries are invalidated when an admin
+    updates or deletes the user; other workers converge within the TTL.
+    """
+
+    def __init__(self, ttl_seconds: float = IDENTITY_CACHE_TTL_SECONDS, max_size: int = IDENTITY_CACHE_MAX_SIZE):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # user_id: (expires_at, user_doc)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        # Callers mutate the returned document (e.g. _id -> id), so hand out a copy
+        return dict(entry[1])
+
+    def put(self, user_id: str, user: Dict[str, Any]):
+        self._entries[user_id] = (time.monotonic() + self.ttl_seconds, dict(user))
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id: str):
+        if self._entries.pop(str(user_id), None) is not None:
+            self.invalidations += 1
+
+    async def get_or_load(self, user_id: str, db: AsyncIOMotorDatabase) -> Optional[Dict[str, Any]]:
+        user = self.get(user_id)
+        if user is not None:
+            return user
+        user = await db["users"].find_one({"_id": ObjectId(user_id)})
+        if user:
+            self.put(user_id, user)
+        return user
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+identity_cache = IdentityCache()
+metrics.register("identity_cache", identity_cache.stats)
+
+def get_identity_cache() -> IdentityCache:
+    return identity_cache
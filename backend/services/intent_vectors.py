@@ -0,0 +1,70 @@
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+from bson.binary import Binary
+from motor.motor_asyncio import AsyncIOMotorCollection
+import numpy as np
+
+# Order of the values in a stored intent probability vector (index = BERT label id)
+INTENT_LABELS = [
+    "intent_clarification", "intent_commitment", "intent_delay",
+    "intent_follow_up", "intent_greeting", "intent_negotiation",
+    "intent_propose_offer", "intent_rejection"
+]
+# Intent reported when no label reaches the confidence threshold
+BELOW_THRESHOLD_INTENT = "uncategorized"
+
+# Vectors are stored as little-endian float16: 8 labels -> 16 bytes per document
+_DTYPE = np.dtype("<f2")
+
+def pack_probs(probs: Sequence[float]) -> Binary:
+    """Packs a probability vector into a compact BSON binary field."""
+    return Binary(np.asarray(probs, dtype=_DTYPE).tobytes())
+
+def unpack_probs(packed: bytes) -> np.ndarray:
+    return np.frombuffer(packed, dtype=_DTYPE).astype(np.float32)
+
+def stack_probs(packed_vectors: Sequence[bytes]) -> np.ndarray:
+    """Decodes many packed vectors into one (n, labels) float32 matrix in a single pass."""
+    if not packed_vectors:
+        return np.zeros((0, len(INTENT_LABELS)), dtype=np.float32)
+    buffer = b"".join(bytes(v) for v in packed_vectors)
+    return np.frombuffer(buffer, dtype=_DTYPE).reshape(len(packed_vectors), -1).astype(np.float32)
+
+def rethreshold(matrix: np.ndarray, threshold: float, labels: Sequence[str] = INTENT_LABELS) -> List[str]:
+    """Argmax intent per row, or BELOW_THRESHOLD_INTENT where the best probability is under the threshold."""
+    if matrix.shape[0] == 0:
+        return []
+    best = matrix.argmax(axis=1)
+    confident = matrix[np.arange(matrix.shape[0]), best] >= threshold
+    names = np.asarray(labels, dtype=object)[best]
+    return np.where(confident, names, BELOW_THRESHOLD_INTENT).tolist()
+
+def top_k(matrix: np.ndarray, k: int = 2, labels: Sequence[str] = INTENT_LABELS) -> List[List[Tuple[str, float]]]:
+    """The k most likely intents per row, highest first."""
+    if matrix.shape[0] == 0:
+        return []
+    k = max(1, min(k, matrix.shape[1]))
+    # argpartition is O(labels) per row; only the k winners are sorted
+    candidates = np.argpartition(-matrix, k - 1, axis=1)[:, :k]
+    scores = np.take_along_axis(matrix, candidates, axis=1)
+    order = np.argsort(-scores, axis=1)
+    indices = np.take_along_axis(candidates, order, axis=1)
+    scores = np.take_along_axis(scores, order, axis=1)
+    return [
+        [(labels[i], round(float(p), 4)) for i, p in zip(row_indices, row_scores)]
+        for row_indices, row_scores in zip(indices, scores)
+    ]
+
+async def load_vectors(collection: AsyncIOMotorCollection, query: Dict[str, Any],
+                       field: str = "intent_probs", limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+    """
+    Fetches the documents matching `query` that carry a stored vector.
+    Returns (documents without the vector field, (n, labels) probability matrix).
+    """
+    cursor = collection.find({**query, field: {"$exists": True}}, {"content": 0, "suggestions": 0})
+    if limit:
+        cursor = cursor.limit(limit)
+    docs, packed = [], []
+    async for doc in cursor:
+        packed.append(doc.pop(field))
+        docs.append(doc)
+    return docs, stack_probs(packed)
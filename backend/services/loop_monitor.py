@@ -0,0 +1,41 @@
+from typing import Any, Dict
+from collections import deque
+from services import metrics
+import asyncio
+import time
+
+# How often the monitor wakes up; lag is how late that wake-up happens
+LOOP_LAG_INTERVAL_SECONDS = 0.1
+# Samples kept for percentiles (600 x 0.1 s = the last minute)
+LOOP_LAG_SAMPLE_SIZE = 600
+
+class LoopLagMonitor:
+    """Measures event-loop lag: time a ready coroutine waits because something else holds the loop."""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL_SECONDS):
+        self.interval = interval
+        self.samples = deque(maxlen=LOOP_LAG_SAMPLE_SIZE)
+        self.max_ms = 0.0
+
+    async def run(self):
+        """Background loop started from the app lifespan."""
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (time.perf_counter() - start - self.interval) * 1000)
+            self.samples.append(lag_ms)
+            self.max_ms = max(self.max_ms, lag_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        samples = sorted(self.samples)
+        return {
+            "samples": len(samples),
+            "avg_ms": round(sum(samples) / len(samples), 2) if samples else 0,
+            "p50_ms": round(samples[len(samples) // 2], 2) if samples else 0,
+            "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2) if samples else 0,
+            "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 2) if samples else 0,
+            "max_ms": round(self.max_ms, 2),
+        }
+
+loop_monitor = LoopLagMonitor()
+metrics.register("event_loop", loop_monitor.stats)
@@ -0,0 +1,22 @@
+from typing import Any, Callable, Dict
+import logging
+
+logger = logging.getLogger(__name__)
+
+# name -> zero-argument callable returning that component's current counters
+_providers: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+def register(name: str, provider: Callable[[], Dict[str, Any]]):
+    """Exposes a component's counters under `name` in the admin metrics endpoint."""
+    _providers[name] = provider
+
+def snapshot() -> Dict[str, Any]:
+    """Current counters of every registered component on this worker."""
+    result = {}
+    for name, provider in _providers.items():
+        try:
+            result[name] = provider()
+        except Exception as e:
+            logger.error(f"Metrics provider '{name}' failed: {e}")
+            result[name] = {"error": str(e)}
+    return result
@@ -0,0 +1,59 @@
+from typing import Any, Dict, Optional, Tuple
+from datetime import datetime
+from bson import ObjectId
+import base64
+import json
+
+# Page size of message history when the client does not ask for one, and the largest it can ask for
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(message: Dict[str, Any]) -> str:
+    """Opaque cursor pointing at one message: its (created_at, _id) position."""
+    created_at = message["created_at"]
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat()
+    raw = json.dumps({"t": created_at, "i": str(message["_id"])}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        position = json.loads(raw)
+        return datetime.fromisoformat(position["t"]), ObjectId(position["i"])
+    except Exception:
+        raise InvalidCursor("Invalid cursor")
+
+def keyset_filter(cursor: str, direction: str) -> Dict[str, Any]:
+    """
+    Messages strictly before ("before") or after ("after") the cursor in (created_at, _id)
+    order; _id breaks ties between messages saved in the same millisecond.
+    """
+    created_at, _id = decode_cursor(cursor)
+    op = "$lt" if direction == "before" else "$gt"
+    return {"$or": [
+        {"created_at": {op: created_at}},
+        {"created_at": created_at, "_id": {op: _id}},
+    ]}
+
+def clamp_page_size(limit: Optional[int]) -> int:
+    return max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+
+# Response headers carrying the cursors of the neighbouring pages (exposed through CORS)
+PREV_CURSOR_HEADER = "X-Prev-Cursor"
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# after_seq responses: "true" when more messages follow the last one returned
+HAS_MORE_HEADER = "X-Has-More"
+
+def set_cursor_headers(response, prev_cursor: Optional[str], next_cursor: Optional[str]):
+    """X-Prev-Cursor: older messages (pass as ?before=), X-Next-Cursor: newer ones (?after=)."""
+    if prev_cursor:
+        response.headers[PREV_CURSOR_HEADER] = prev_cursor
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+def set_has_more_header(response, has_more: bool):
+    response.headers[HAS_MORE_HEADER] = "true" if has_more else "false"
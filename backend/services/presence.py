@@ -0,0 +1,244 @@
+from typing import Callable, Dict, List, Optional, Set, Any
+import asyncio
+import os
+import socket
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Redis-protocol URL shared by all workers, e.g. redis://localhost:6379/0.
+# When unset, Socket.IO and presence stay in process memory (single worker).
+SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE")
+# How often sids whose socket is gone are swept out of the registry
+PRESENCE_SWEEP_SECONDS = float(os.getenv("PRESENCE_SWEEP_SECONDS", 30))
+
+class InMemoryPresenceStore:
+    """
+    Who is connected and which rooms their sockets joined, for a single worker.
+    Forward and reverse indexes (sid -> rooms, room -> sids, user -> sids,
+    user_type -> sids) keep join/leave O(1) and disconnect O(rooms of that sid).
+    """
+
+    def __init__(self):
+        self.active_users: Dict[str, Dict[str, Any]] = {}  # sid: {user_id, user_type}
+        self.active_rooms: Dict[str, Set[str]] = {}  # room_id: set of sid
+        self.sid_rooms: Dict[str, Set[str]] = {}  # sid: set of room_id
+        self.user_sids: Dict[str, Set[str]] = {}  # user_id: set of sid
+        self.type_sids: Dict[str, Set[str]] = {}  # user_type: set of sid
+        self.swept = 0
+
+    @staticmethod
+    def _discard(index: Dict[str, Set[str]], key: str, value: str):
+        values = index.get(key)
+        if values is None:
+            return
+        values.discard(value)
+        if not values:
+            del index[key]
+
+    async def set_user(self, sid: str, user_id: str, user_type: str):
+        previous = self.active_users.get(sid)
+        if previous:
+            self._discard(self.user_sids, previous['user_id'], sid)
+            self._discard(self.type_sids, previous['user_type'], sid)
+        self.active_users[sid] = {'user_id': user_id, 'user_type': user_type}
+        self.user_sids.setdefault(user_id, set()).add(sid)
+        self.type_sids.setdefault(user_type, set()).add(sid)
+
+    async def get_user(self, sid: str) -> Optional[Dict[str, Any]]:
+        return self.active_users.get(sid)
+
+    async def join(self, room: str, sid: str):
+        self.active_rooms.setdefault(room, set()).add(sid)
+        self.sid_rooms.setdefault(sid, set()).add(room)
+
+    async def leave(self, room: str, sid: str):
+        self._discard(self.active_rooms, room, sid)
+        self._discard(self.sid_rooms, sid, room)
+
+    async def disconnect(self, sid: str):
+        for room in self.sid_rooms.pop(sid, ()):
+            self._discard(self.active_rooms, room, sid)
+        user = self.active_users.pop(sid, None)
+        if user:
+            self._discard(self.user_sids, user['user_id'], sid)
+            self._discard(self.type_sids, user['user_type'], sid)
+
+    # --- Queries ---
+
+    async def room_sids(self, room: str) -> Set[str]:
+        return set(self.active_rooms.get(room, ()))
+
+    async def room_users(self, room: str) -> List[Dict[str, Any]]:
+        """Who is viewing a room: one entry per socket."""
+        return [{'sid': sid, **self.active_users[sid]}
+                for sid in self.active_rooms.get(room, ()) if sid in self.active_users]
+
+    async def sid_rooms_of(self, sid: str) -> Set[str]:
+        return set(self.sid_rooms.get(sid, ()))
+
+    async def user_sids_of(self, user_id: str) -> Set[str]:
+        return set(self.user_sids.get(user_id, ()))
+
+    async def is_user_online(self, user_id: str) -> bool:
+        return bool(self.user_sids.get(user_id))
+
+    async def online_count(self, user_type: str) -> int:
+        return len(self.type_sids.get(user_type, ()))
+
+    async def sweep(self, is_connected: Callable[[str], bool]) -> int:
+        """Drops sids whose socket no longer exists (missed disconnects)."""
+        known = set(self.active_users) | set(self.sid_rooms)
+        dead = [sid for sid in known if not is_connected(sid)]
+        for sid in dead:
+            await self.disconnect(sid)
+        self.swept += len(dead)
+        return len(dead)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "sids": len(self.active_users),
+            "rooms": len(self.active_rooms),
+            "users": len(self.user_sids),
+            "by_type": {user_type: len(sids) for user_type, sids in self.type_sids.items()},
+            "swept": self.swept,
+        }
+
+class RedisPresenceStore:
+    """
+    Presence shared by every worker through Redis:
+    presence:user:<sid> (hash), presence:room:<room> (set of sids), presence:sid:<sid> (set of rooms),
+    presence:uid:<user_id> and presence:type:<user_type> (sets of sids),
+    presence:worker:<worker> (sids held by that worker) with a presence:heartbeat:<worker> key.
+    """
+
+    def __init__(self, url: str, prefix: str = "presence"):
+        import redis.asyncio as redis  # only needed in multi-worker mode
+        self.redis = redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.swept = 0
+
+    def _key(self, kind: str, name: str) -> str:
+        return f"{self.prefix}:{kind}:{name}"
+
+    async def set_user(self, sid: str, user_id: str, user_type: str):
+        previous = await self.get_user(sid)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            if previous:
+                pipe.srem(self._key("uid", previous['user_id']), sid)
+                pipe.srem(self._key("type", previous['user_type']), sid)
+            pipe.hset(self._key("user", sid), mapping={'user_id': user_id, 'user_type': user_type, 'worker': self.worker_id})
+            pipe.sadd(self._key("uid", user_id), sid)
+            pipe.sadd(self._key("type", user_type), sid)
+            pipe.sadd(self._key("worker", self.worker_id), sid)
+            await pipe.execute()
+
+    async def get_user(self, sid: str) -> Optional[Dict[str, Any]]:
+        return await self.redis.hgetall(self._key("user", sid)) or None
+
+    async def join(self, room: str, sid: str):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.sadd(self._key("room", room), sid)
+            pipe.sadd(self._key("sid", sid), room)
+            pipe.sadd(self._key("worker", self.worker_id), sid)
+            await pipe.execute()
+
+    async def leave(self, room: str, sid: str):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.srem(self._key("room", room), sid)
+            pipe.srem(self._key("sid", sid), room)
+            await pipe.execute()
+
+    async def disconnect(self, sid: str, worker_id: Optional[str] = None):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.smembers(self._key("sid", sid))
+            pipe.hgetall(self._key("user", sid))
+            rooms, user = await pipe.execute()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for room in rooms:
+                pipe.srem(self._key("room", room), sid)
+            if user:
+                pipe.srem(self._key("uid", user['user_id']), sid)
+                pipe.srem(self._key("type", user['user_type']), sid)
+            pipe.srem(self._key("worker", worker_id or self.worker_id), sid)
+            pipe.delete(self._key("sid", sid), self._key("user", sid))
+            await pipe.execute()
+
+    # --- Queries ---
+
+    async def room_sids(self, room: str) -> Set[str]:
+        return set(await self.redis.smembers(self._key("room", room)))
+
+    async def room_users(self, room: str) -> List[Dict[str, Any]]:
+        """Who is viewing a room: one entry per socket."""
+        sids = list(await self.redis.smembers(self._key("room", room)))
+        if not sids:
+            return []
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for sid in sids:
+                pipe.hgetall(self._key("user", sid))
+            users = await pipe.execute()
+        return [{'sid': sid, 'user_id': user['user_id'], 'user_type': user['user_type']}
+                for sid, user in zip(sids, users) if user]
+
+    async def sid_rooms_of(self, sid: str) -> Set[str]:
+        return set(await self.redis.smembers(self._key("sid", sid)))
+
+    async def user_sids_of(self, user_id: str) -> Set[str]:
+        return set(await self.redis.smembers(self._key("uid", user_id)))
+
+    async def is_user_online(self, user_id: str) -> bool:
+        return await self.redis.scard(self._key("uid", user_id)) > 0
+
+    async def online_count(self, user_type: str) -> int:
+        return await self.redis.scard(self._key("type", user_type))
+
+    async def sweep(self, is_connected: Callable[[str], bool]) -> int:
+        """
+        Drops this worker's sids whose socket no longer exists, refreshes this
+        worker's heartbeat and removes every sid of workers whose heartbeat expired.
+        """
+        heartbeat_ttl = int(PRESENCE_SWEEP_SECONDS * 3)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.set(self._key("heartbeat", self.worker_id), 1, ex=heartbeat_ttl)
+            pipe.sadd(self._key("workers", "all"), self.worker_id)
+            await pipe.execute()
+
+        dead = 0
+        for sid in await self.redis.smembers(self._key("worker", self.worker_id)):
+            if not is_connected(sid):
+                await self.disconnect(sid)
+                dead += 1
+        for worker_id in await self.redis.smembers(self._key("workers", "all")):
+            if worker_id == self.worker_id or await self.redis.exists(self._key("heartbeat", worker_id)):
+                continue
+            for sid in await self.redis.smembers(self._key("worker", worker_id)):
+                await self.disconnect(sid, worker_id=worker_id)
+                dead += 1
+            await self.redis.srem(self._key("workers", "all"), worker_id)
+            logger.info(f"Presence: removed sids of stopped worker {worker_id}")
+        self.swept += dead
+        return dead
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "redis", "worker_id": self.worker_id, "swept": self.swept}
+
+async def sweep_forever(store, is_connected: Callable[[str], bool], interval: float = PRESENCE_SWEEP_SECONDS):
+    """Background loop started from the app lifespan."""
+    while True:
+        try:
+            dead = await store.sweep(is_connected)
+            if dead:
+                logger.info(f"Presence: swept {dead} dead sid(s)")
+        except Exception as e:
+            logger.error(f"Presence sweep failed: {e}")
+        await asyncio.sleep(interval)
+
+def create_presence_store():
+    if SOCKETIO_MESSAGE_QUEUE:
+        logger.info("Presence is shared through the Socket.IO message queue")
+        return RedisPresenceStore(SOCKETIO_MESSAGE_QUEUE)
+    return InMemoryPresenceStore()
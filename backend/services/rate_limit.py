@@ -0,0 +1,123 @@
+from typing import Any, Dict, Optional, Tuple
+from collections import OrderedDict
+from jose import jwt, JWTError
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from models.schemas import RateLimitPolicy
+from services.config_service import get_runtime_config
+from services.token_service import SECRET_KEY, ALGORITHM
+from database.connection import get_database
+from services import metrics
+import math
+import os
+import re
+import time
+
+# Buckets kept in memory; the least recently used ones are dropped beyond this
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", 100000))
+# Paths never limited by the HTTP middleware (Socket.IO events are limited per event)
+RATE_LIMIT_EXEMPT_PREFIXES = ("/socket.io", "/health")
+
+class RateLimiter:
+    """
+    Token buckets keyed by (policy, principal) where the principal is the user id,
+    or the client IP for anonymous callers. Each check is O(1).
+    State is per worker, so with N workers a client gets up to N times the rate.
+    """
+
+    def __init__(self, max_buckets: int = RATE_LIMIT_MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[Tuple[str, str], list]" = OrderedDict()  # key: [tokens, updated_at]
+        self.allowed = 0
+        self.rejected: Dict[str, int] = {}
+        self._patterns_source = None
+        self._http_patterns = []
+
+    def check(self, policy_key: str, policy: RateLimitPolicy, principal: str) -> float:
+        """Consumes one token; returns 0 when allowed, otherwise seconds until a token is available."""
+        now = time.monotonic()
+        key = (policy_key, principal)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [float(policy.burst), now]
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(float(policy.burst), bucket[0] + (now - bucket[1]) * policy.rate_per_second)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            self.allowed += 1
+            return 0.0
+        self.rejected[policy_key] = self.rejected.get(policy_key, 0) + 1
+        return (1 - bucket[0]) / policy.rate_per_second
+
+    def http_policy(self, method: str, path: str) -> Tuple[Optional[str], Optional[RateLimitPolicy]]:
+        config = get_runtime_config().config.rate_limits
+        if not config.enabled:
+            return None, None
+        if self._patterns_source is not config.http:
+            # Recompile "{param}" templates only when the config object changes
+            self._http_patterns = [
+                (key, re.compile("^" + re.sub(r"\\\{[^/]+?\\\}", "[^/]+", re.escape(key)) + "$"))
+                for key in config.http if key != "*"
+            ]
+            self._patterns_source = config.http
+        route = f"{method} {path}"
+        for key, pattern in self._http_patterns:
+            if pattern.match(route):
+                return key, config.http[key]
+        return ("*", config.http["*"]) if "*" in config.http else (None, None)
+
+    def socket_policy(self, event: str) -> Tuple[Optional[str], Optional[RateLimitPolicy]]:
+        config = get_runtime_config().config.rate_limits
+        if not config.enabled:
+            return None, None
+        if event in config.socket:
+            return event, config.socket[event]
+        return ("*", config.socket["*"]) if "*" in config.socket else (None, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "buckets": len(self._buckets),
+            "allowed": self.allowed,
+            "rejected": dict(self.rejected),
+        }
+
+rate_limiter = RateLimiter()
+metrics.register("rate_limit", rate_limiter.stats)
+
+def principal_from_token(token: Optional[str]) -> Optional[str]:
+    """User id of a bearer token, without a database lookup; None when missing or invalid."""
+    if not token:
+        return None
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        return None
+
+class RateLimitMiddleware(BaseHTTPMiddleware):
+    """Applies the HTTP policies of system_config.rate_limits; over-limit requests get 429."""
+
+    async def dispatch(self, request: Request, call_next):
+        path = request.url.path
+        if request.method == "OPTIONS" or path.startswith(RATE_LIMIT_EXEMPT_PREFIXES):
+            return await call_next(request)
+        await get_runtime_config().refresh(get_database())
+        policy_key, policy = rate_limiter.http_policy(request.method, path)
+        if policy is None:
+            return await call_next(request)
+        authorization = request.headers.get("authorization", "")
+        token = authorization[7:] if authorization.lower().startswith("bearer ") else None
+        principal = principal_from_token(token) or f"ip:{request.client.host if request.client else 'unknown'}"
+        retry_after = rate_limiter.check(f"http:{policy_key}", policy, principal)
+        if retry_after:
+            return JSONResponse(
+                status_code=429,
+                content={"detail": "Too many requests"},
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+        return await call_next(request)
@@ -0,0 +1,195 @@
+"""
+Filters and pipelines of the admin dashboard and analytics routes. They are built here
+rather than inline so that check_query_plans.py explains the exact queries the routes run.
+Each function only builds the query; the routes execute it.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime
+
+Query = Dict[str, Any]
+Sort = List[Tuple[str, int]]
+
+OLDEST_FIRST: Sort = [("created_at", 1)]
+RESOLVED_ROOMS: Query = {"status": {"$in": ["resolved", "closed"]}}
+RATED_ROOMS: Query = {"satisfaction_rating": {"$exists": True}}
+AI_GENERATED: Query = {"is_ai_generated": True}
+
+def period(start: Optional[datetime], end: Optional[datetime]) -> Query:
+    """created_at range with both bounds included; a missing bound is left open."""
+    bounds = {}
+    if start:
+        bounds["$gte"] = start
+    if end:
+        bounds["$lte"] = end
+    return bounds
+
+def messages_of_user_type(user_type: str) -> Query:
+    return {"user_type": user_type}
+
+def room_messages(room_id: str) -> Tuple[Query, Sort]:
+    return {"room_id": room_id}, OLDEST_FIRST
+
+def day_messages(start_of_day: datetime, end_of_day: datetime) -> Query:
+    return {"created_at": {"$gte": start_of_day, "$lt": end_of_day}}
+
+def intent_distribution_pipeline() -> List[Query]:
+    return [
+        {
+            "$match": {
+                "intent": {"$exists": True, "$ne": None}
+            }
+        },
+        {
+            "$group": {
+                "_id": "$intent",
+                "count": {"$sum": 1}
+            }
+        },
+        {
+            "$sort": {"count": -1}
+        }
+    ]
+
+def engagement_pipeline(start: datetime, end: datetime) -> List[Query]:
+    """Rooms opened in the period with their message counts (analytics customer behaviour)."""
+    return [
+        {
+            "$match": {
+                "created_at": period(start, end)
+            }
+        },
+        {
+            "$lookup": {
+                "from": "messages",
+                "localField": "_id",
+                "foreignField": "room_id",
+                "as": "messages"
+            }
+        },
+        {
+            "$project": {
+                "customer_id": 1,
+                "customer_name": 1,
+                "message_count": {"$size": "$messages"},
+                "first_message": {"$min": "$messages.created_at"},
+                "last_message": {"$max": "$messages.created_at"},
+                "ai_messages": {
+                    "$size": {
+                        "$filter": {
+                            "input": "$messages",
+                            "cond": "$$this.is_ai_generated"
+                        }
+                    }
+                }
+            }
+        },
+        {
+            "$sort": {"message_count": -1}
+        }
+    ]
+
+def customer_messages_by_room_pipeline(start: datetime, end: datetime) -> List[Query]:
+    """Customer messages of the period grouped per room, oldest first."""
+    return [
+        {
+            "$match": {
+                "created_at": period(start, end),
+                "user_type": "customer"
+            }
+        },
+        {
+            "$sort": {"room_id": 1, "created_at": 1}
+        },
+        {
+            "$group": {
+                "_id": "$room_id",
+                "customer_messages": {
+                    "$push": {
+                        "created_at": "$created_at",
+                        "content": "$content"
+                    }
+                }
+            }
+        }
+    ]
+
+def admin_replies(room_id: str, start: datetime, end: datetime) -> Tuple[Query, Sort]:
+    return {"room_id": room_id, "user_type": "admin", "created_at": period(start, end)}, OLDEST_FIRST
+
+def ai_usage_pipeline(start: datetime, end: datetime) -> List[Query]:
+    """Total and AI-generated messages per day of the period."""
+    return [
+        {
+            "$match": {
+                "created_at": period(start, end)
+            }
+        },
+        {
+            "$group": {
+                "_id": {
+                    "year": {"$year": "$created_at"},
+                    "month": {"$month": "$created_at"},
+                    "day": {"$dayOfMonth": "$created_at"}
+                },
+                "total_messages": {"$sum": 1},
+                "ai_messages": {
+                    "$sum": {"$cond": ["$is_ai_generated", 1, 0]}
+                }
+            }
+        },
+        {
+            "$sort": {"_id": 1}
+        }
+    ]
+
+def dashboard_response_time_pipeline() -> List[Query]:
+    """Admin and customer messages of every room in order, for the dashboard response time."""
+    return [
+        {"$match": {"user_type": {"$in": ["admin", "customer"]}}},
+        {"$sort": {"room_id": 1, "created_at": 1}},
+        {"$group": {
+            "_id": "$room_id",
+            "messages": {"$push": {"user_type": "$user_type", "created_at": "$created_at"}}
+        }}
+    ]
+
+def classified_messages(start: datetime, end: datetime) -> Query:
+    return {"created_at": period(start, end), "intent": {"$ne": None}}
+
+def intent_statistics_pipeline(start: datetime, end: datetime) -> List[Query]:
+    return [
+        {
+            "$match": classified_messages(start, end)
+        },
+        {
+            "$group": {
+                "_id": "$intent",
+                "count": {"$sum": 1}
+            }
+        },
+        {
+            "$sort": {"count": -1}
+        }
+    ]
+
+def period_messages(start: datetime, end: datetime, ai_only: bool = False) -> Query:
+    query = {"created_at": period(start, end)}
+    if ai_only:
+        query.update(AI_GENERATED)
+    return query
+
+def export_messages(room_id: Optional[str] = None, date_from: Optional[datetime] = None,
+                    date_to: Optional[datetime] = None) -> Tuple[Query, Sort]:
+    query = {}
+    if room_id:
+        query["room_id"] = room_id
+    if date_from or date_to:
+        query["created_at"] = period(date_from, date_to)
+    return query, OLDEST_FIRST
+
+def visible_customer_messages(room_id: str) -> Tuple[Query, Sort]:
+    """Customer messages of a room that were not soft-deleted."""
+    return {"room_id": room_id, "user_type": "customer", "is_deleted": {"$ne": True}}, OLDEST_FIRST
+
+def customers() -> Query:
+    return {"user_type": "customer"}
@@ -0,0 +1,63 @@
+from typing import Any, Dict, List
+from datetime import datetime
+import os
+import re
+import unicodedata
+
+# Messages are searched through `search_tokens`: the distinct words of the content, lowercased
+# and with Vietnamese diacritics folded ("Không được" -> ["khong", "duoc"]), stored when the
+# message is saved and indexed as (search_tokens, created_at) / (room_id, search_tokens, created_at).
+# A keyword search reads the newest SEARCH_CANDIDATES messages containing every word of the query
+# straight from that index, then ranks only those; results past that window are not reachable,
+# and the response says so (X-Search-Truncated: true) when the window was full.
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", 500))
+# Words kept per message and per query; longer messages are still found by their first words
+MAX_MESSAGE_TOKENS = 128
+MAX_QUERY_TOKENS = 8
+# Keyword search responses: "true" when more than SEARCH_CANDIDATES messages matched
+TRUNCATED_HEADER = "X-Search-Truncated"
+
+_WORD = re.compile(r"\w+")
+
+def fold(text: str) -> str:
+    """Lowercase without diacritics: "Đơn hàng" -> "don hang"."""
+    decomposed = unicodedata.normalize("NFD", text.lower())
+    # đ is a letter of its own, not d + a combining mark; so is ð, the lowercase of Ð (U+00D0),
+    # which keyboards and OCR often produce in place of Đ (U+0110)
+    stripped = "".join(c for c in decomposed if unicodedata.category(c) != "Mn")
+    return stripped.replace("đ", "d").replace("ð", "d")
+
+def tokenize(text: str, limit: int = MAX_MESSAGE_TOKENS) -> List[str]:
+    """
+    Distinct folded words in order of first appearance. Words of one letter are dropped, digits
+    excepted: after folding, Vietnamese words such as "ở", "ạ" or "à" are the single letters
+    "o", "a", too common to narrow a search, so a query made only of them finds nothing.
+    """
+    tokens = dict.fromkeys(word for word in _WORD.findall(fold(text or "")) if len(word) > 1 or word.isdigit())
+    return list(tokens)[:limit]
+
+def query_tokens(keyword: str) -> List[str]:
+    return tokenize(keyword, MAX_QUERY_TOKENS)
+
+def set_truncated_header(response, truncated: bool):
+    response.headers[TRUNCATED_HEADER] = "true" if truncated else "false"
+
+def rank(messages: List[Dict[str, Any]], keyword: str) -> List[Dict[str, Any]]:
+    """
+    Orders candidates (all containing every query word) by, in turn: the exact keyword as typed,
+    with its diacritics; the folded keyword as a phrase; the share of the message the query
+    covers (short, focused messages first); recency. Sets each message's `score`.
+    """
+    exact = keyword.lower().strip()
+    phrase = " ".join(query_tokens(keyword))
+    wanted = len(query_tokens(keyword))
+    for message in messages:
+        content = message.get("content") or ""
+        score = 0.0
+        if exact and exact in content.lower():
+            score += 2
+        elif phrase and phrase in " ".join(_WORD.findall(fold(content))):
+            score += 1
+        score += wanted / max(len(tokenize(content)), wanted, 1)
+        message["score"] = round(score, 3)
+    return sorted(messages, key=lambda message: (message["score"], message.get("created_at") or datetime.min), reverse=True)
@@ -1,12 +1,17 @@
 from jose import jwt, JWTError
-from bson import ObjectId
 from fastapi import HTTPException, status, Depends
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
 import os
 from database.connection import get_database
+from services.identity_cache import get_identity_cache
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
 ALGORITHM = "HS256"
+# Socket.IO resume tokens: short-lived, only accepted by the socket handshake
+RESUME_TOKEN_TYPE = "resume"
+RESUME_TOKEN_TTL_SECONDS = int(os.getenv("RESUME_TOKEN_TTL_SECONDS", 300))
 
 # A dependency to get the bearer token from the Authorization header
 from fastapi.security import OAuth2PasswordBearer
@@ -19,12 +24,12 @@ async def get_user_from_token_str(token: str, db: AsyncIOMotorDatabase):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
-        if user_id is None:
+        if user_id is None or payload.get("typ") == RESUME_TOKEN_TYPE:
             return None
     except JWTError:
         return None
         
-    user = await db["users"].find_one({"_id": ObjectId(user_id)})
+    user = await get_identity_cache().get_or_load(user_id, db)
     
     if user:
         user["id"] = str(user["_id"])
@@ -44,12 +49,12 @@ async def verify_admin_access(token: str = Depends(oauth2_scheme), db: AsyncIOMo
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
-        if user_id is None:
+        if user_id is None or payload.get("typ") == RESUME_TOKEN_TYPE:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
         
-    user = await db["users"].find_one({"_id": ObjectId(user_id)})
+    user = await get_identity_cache().get_or_load(user_id, db)
     
     if user is None:
         raise credentials_exception
@@ -64,4 +69,23 @@ async def verify_admin_access(token: str = Depends(oauth2_scheme), db: AsyncIOMo
         user["id"] = str(user["_id"])
         del user["_id"]
     
-    return user 
\ No newline at end of file
+    return user 
+
+def create_resume_token(user_id: str, user_type: str, rooms: List[str], wire: str) -> str:
+    """Lets a reconnecting socket restore its session and rooms without a user lookup."""
+    expire = datetime.utcnow() + timedelta(seconds=RESUME_TOKEN_TTL_SECONDS)
+    payload = {"sub": user_id, "typ": RESUME_TOKEN_TYPE, "user_type": user_type,
+               "rooms": rooms, "wire": wire, "exp": expire}
+    return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+
+def decode_resume_token(token: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Claims of a valid, unexpired resume token; None otherwise."""
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("typ") != RESUME_TOKEN_TYPE or not payload.get("sub"):
+        return None
+    return payload
@@ -0,0 +1,119 @@
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from dataclasses import dataclass
+import asyncio
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# While a user keeps typing, 'typing' is re-broadcast at most this often so that
+# receivers can tell the indicator is still live.
+TYPING_KEEPALIVE_SECONDS = float(os.getenv("TYPING_KEEPALIVE_SECONDS", 3))
+# No typing event for this long ends the typing state (lost stop_typing, closed tab, ...).
+TYPING_EXPIRE_SECONDS = float(os.getenv("TYPING_EXPIRE_SECONDS", 6))
+# Events from one socket closer together than this are dropped before any state lookup.
+TYPING_MIN_INTERVAL_SECONDS = float(os.getenv("TYPING_MIN_INTERVAL_SECONDS", 0.25))
+
+@dataclass
+class _TypingState:
+    sid: str
+    user_type: str
+    last_seen: float
+    last_broadcast: float
+
+class TypingStateEngine:
+    """
+    Per-(room, user) typing state. Clients may send 'typing' on every keystroke;
+    the room only hears about transitions (started / stopped) plus a periodic keepalive.
+    """
+
+    def __init__(self, emit: Callable[..., Awaitable[Any]]):
+        self._emit = emit
+        self._states: Dict[Tuple[str, str], _TypingState] = {}
+        self._last_event_by_sid: Dict[str, float] = {}
+        self.received = 0
+        self.rate_limited = 0
+        self.broadcasts = {"typing": 0, "keepalive": 0, "stop_typing": 0, "expired": 0}
+
+    def _rate_limited(self, sid: str, now: float) -> bool:
+        last = self._last_event_by_sid.get(sid)
+        if last is not None and now - last < TYPING_MIN_INTERVAL_SECONDS:
+            self.rate_limited += 1
+            return True
+        self._last_event_by_sid[sid] = now
+        return False
+
+    async def _broadcast(self, event: str, room_id: str, user_id: str, user_type: str, skip_sid: Optional[str]):
+        await self._emit(event, {'room_id': room_id, 'user_id': user_id, 'user_type': user_type},
+                         room=room_id, skip_sid=skip_sid)
+
+    async def typing(self, sid: str, room_id: str, user_id: str, user_type: str):
+        self.received += 1
+        now = time.monotonic()
+        if self._rate_limited(sid, now):
+            return
+        key = (room_id, user_id)
+        state = self._states.get(key)
+        if state is None:
+            self._states[key] = _TypingState(sid, user_type, now, now)
+            self.broadcasts["typing"] += 1
+            await self._broadcast('typing', room_id, user_id, user_type, sid)
+            return
+        state.sid = sid
+        state.last_seen = now
+        if now - state.last_broadcast >= TYPING_KEEPALIVE_SECONDS:
+            state.last_broadcast = now
+            self.broadcasts["keepalive"] += 1
+            await self._broadcast('typing', room_id, user_id, user_type, sid)
+
+    async def stop_typing(self, sid: str, room_id: str, user_id: str, user_type: str):
+        # Not rate limited: a stop is always a transition or a no-op
+        self.received += 1
+        if self._states.pop((room_id, user_id), None) is None:
+            return
+        self.broadcasts["stop_typing"] += 1
+        await self._broadcast('stop_typing', room_id, user_id, user_type, sid)
+
+    async def clear_sid(self, sid: str):
+        """Ends every typing state held by a disconnected socket."""
+        self._last_event_by_sid.pop(sid, None)
+        for (room_id, user_id), state in list(self._states.items()):
+            if state.sid == sid:
+                del self._states[(room_id, user_id)]
+                self.broadcasts["stop_typing"] += 1
+                await self._broadcast('stop_typing', room_id, user_id, state.user_type, sid)
+
+    async def expire_stale(self):
+        cutoff = time.monotonic() - TYPING_EXPIRE_SECONDS
+        for (room_id, user_id), state in list(self._states.items()):
+            if state.last_seen < cutoff:
+                del self._states[(room_id, user_id)]
+                self.broadcasts["expired"] += 1
+                # The typer's own socket does not need to hear that it stopped, as with an explicit stop_typing
+                await self._broadcast('stop_typing', room_id, user_id, state.user_type, state.sid)
+        # Forget rate-limit timestamps of idle sockets
+        for sid, last in list(self._last_event_by_sid.items()):
+            if last < cutoff:
+                del self._last_event_by_sid[sid]
+
+    async def run_expiry(self, interval: float = 1.0):
+        """Background loop started from the app lifespan."""
+        while True:
+            try:
+                await self.expire_stale()
+            except Exception as e:
+                logger.error(f"Typing state expiry failed: {e}")
+            await asyncio.sleep(interval)
+
+    def stats(self) -> Dict[str, Any]:
+        sent = sum(self.broadcasts.values())
+        return {
+            "active": len(self._states),
+            # Before coalescing every received event was re-broadcast to the room
+            "received": self.received,
+            "rate_limited": self.rate_limited,
+            "broadcasts": dict(self.broadcasts),
+            "broadcast_total": sent,
+            "broadcast_ratio": round(sent / self.received, 3) if self.received else 0,
+        }
@@ -0,0 +1,114 @@
+from typing import Any, Dict, Optional
+import json
+import os
+import time
+
+try:
+    import msgpack
+except ImportError:  # msgpack payloads are optional
+    msgpack = None
+
+# Packet serializer of the whole Socket.IO server: "default" (JSON text) or "msgpack".
+# msgpack requires every client to use socket.io-msgpack-parser.
+SOCKETIO_SERIALIZER = os.getenv("SOCKETIO_SERIALIZER", "default")
+# Wire formats a client can ask for in its connect auth ({"token": ..., "wire": "msgpack"}).
+# "json" clients get the compact message as JSON; "msgpack" clients get it as one binary attachment.
+WIRE_FORMATS = ("json", "msgpack")
+# Measure payload size and serialization time on one emit out of this many
+WIRE_STATS_SAMPLE_EVERY = int(os.getenv("WIRE_STATS_SAMPLE_EVERY", 10))
+
+REPLY_PREVIEW_CHARS = 200
+# Fields of the replied-to message needed for a reply preview
+REPLY_PREVIEW_PROJECTION = {"_id": 1, "user_id": 1, "user_type": 1, "content": 1, "created_at": 1}
+# Fields of a message sent over the socket; suggestions, AI history and vectors stay in the database
+COMPACT_MESSAGE_FIELDS = (
+    "_id", "room_id", "seq", "user_id", "user_type", "content", "created_at",
+    "intent", "confidence", "reply_to_message_id", "is_ai_generated",
+)
+
+def reply_preview(message: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Just enough of a replied-to message to render the quote above a reply."""
+    if not message:
+        return None
+    content = message.get("content") or ""
+    return {
+        "_id": message.get("_id"),
+        "user_id": message.get("user_id"),
+        "user_type": message.get("user_type"),
+        "content": content[:REPLY_PREVIEW_CHARS],
+        "created_at": message.get("created_at"),
+    }
+
+def compact_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Projection of a serialized message for emits; keeps reply_to_message as a preview."""
+    compact = {key: message[key] for key in COMPACT_MESSAGE_FIELDS if key in message}
+    if message.get("reply_to_message"):
+        compact["reply_to_message"] = reply_preview(message["reply_to_message"])
+    return compact
+
+def room_for(room: str, wire_format: str) -> str:
+    """
+    Socket.IO room that receives `room`'s messages in the given wire format.
+    Sockets join both `room` (every other event) and the room of their format.
+    """
+    return f"{room}#{wire_format}"
+
+def enabled_formats():
+    return WIRE_FORMATS if msgpack is not None else ("json",)
+
+def negotiate(auth: Optional[Dict[str, Any]]) -> str:
+    requested = (auth or {}).get("wire", "json")
+    if requested == "msgpack" and msgpack is None:
+        return "json"
+    return requested if requested in WIRE_FORMATS else "json"
+
+class WireStats:
+    """Sampled bytes-on-wire and serialization time per wire format."""
+
+    def __init__(self, sample_every: int = WIRE_STATS_SAMPLE_EVERY):
+        self.sample_every = max(1, sample_every)
+        self.emits = 0
+        self._totals: Dict[str, Dict[str, float]] = {}
+
+    def _add(self, name: str, size: int, seconds: float):
+        totals = self._totals.setdefault(name, {"samples": 0, "bytes": 0, "seconds": 0.0})
+        totals["samples"] += 1
+        totals["bytes"] += size
+        totals["seconds"] += seconds
+
+    def sample(self, full: Dict[str, Any], compact: Dict[str, Any]):
+        """Measures what one emit of `full` would cost in each format (JSON as the Socket.IO default serializer writes it)."""
+        self.emits += 1
+        if self.emits % self.sample_every:
+            return
+        for name, payload in (("full_json", full), ("compact_json", compact)):
+            start = time.perf_counter()
+            size = len(json.dumps(payload, separators=(",", ":")).encode())
+            self._add(name, size, time.perf_counter() - start)
+        if msgpack is not None:
+            start = time.perf_counter()
+            size = len(msgpack.packb(compact, use_bin_type=True))
+            self._add("compact_msgpack", size, time.perf_counter() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "serializer": SOCKETIO_SERIALIZER,
+            "emits": self.emits,
+            "sample_every": self.sample_every,
+            "formats": {
+                name: {
+                    "samples": int(t["samples"]),
+                    "avg_bytes": round(t["bytes"] / t["samples"], 1),
+                    "avg_serialize_us": round(t["seconds"] / t["samples"] * 1e6, 1),
+                }
+                for name, t in self._totals.items()
+            },
+        }
+
+wire_stats = WireStats()
+
+def encode(message: Dict[str, Any], wire_format: str):
+    """Payload of one message emit in the given wire format."""
+    if wire_format == "msgpack":
+        return msgpack.packb(message, use_bin_type=True)
+    return message
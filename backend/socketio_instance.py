@@ -1,35 +1,190 @@
 # This file holds the global Socket.IO server instance for use across the backend.
 import socketio
 from fastapi import FastAPI
+from fastapi.encoders import jsonable_encoder
+import functools
 import logging
-from typing import Dict, List, Any
+import os
+from typing import Dict, List, Any, Optional
 from datetime import datetime
 from services.chat_service import ChatService, get_chat_service
 from services.ai_service import AIService, get_ai_service, IntentHistoryService
-from services.token_service import get_user_from_token_str
+from services.token_service import get_user_from_token_str, create_resume_token, decode_resume_token, RESUME_TOKEN_TTL_SECONDS
+from services.admission import handshake_gate, HandshakeRejected
 from bson.objectid import ObjectId
 from models.schemas import UserType
 from database.connection import get_database
+from services.presence import create_presence_store, sweep_forever, SOCKETIO_MESSAGE_QUEUE
+from services.typing_state import TypingStateEngine
+from services.coalescer import KeyedCoalescer
+from services import wire
+from services.rate_limit import rate_limiter
+from services import metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# With several uvicorn workers (or nodes), emits must go through a shared pub/sub
+# queue so that a message received on one worker reaches sockets held by another.
+# Only emits and presence are shared. This state stays per worker:
+# - the KeyedCoalescers (room_updated, room_list_changed, intent_classified): each worker batches
+#   what it saw, so an admin can get one event per worker for the same room and window;
+# - room_list_version and changed_rooms: versions from different workers interleave;
+# - the rate limiter buckets: the effective limit is the configured one times the worker count;
+# - the typing engine: sockets of one user on different workers have independent typing state.
+client_manager = socketio.AsyncRedisManager(SOCKETIO_MESSAGE_QUEUE) if SOCKETIO_MESSAGE_QUEUE else None
+
 # Create a Socket.IO server instance
 # We disable socketio's own CORS handling by providing an empty list,
 # as FastAPI's CORSMiddleware will handle it for all requests.
-sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins=[])
+sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins=[], client_manager=client_manager,
+                           serializer=wire.SOCKETIO_SERIALIZER)
 sio_app = socketio.ASGIApp(sio)
 
-# Store active users and their rooms
-active_users = {}  # sid: {user_id, user_type}
-active_rooms = {}  # room_id: set of sid
+# Store active users and their rooms (shared across workers when a message queue is configured)
+presence = create_presence_store()
+metrics.register("presence", presence.stats)
+metrics.register("wire", wire.wire_stats.stats)
+
+# Admins and customers connect to separate namespaces: each has its own handlers and
+# auth check, and admin-only events are broadcast to /admin without touching customer sockets.
+ADMIN_NAMESPACE = '/admin'
+CUSTOMER_NAMESPACE = '/customer'
+# A chat room spans both namespaces: its customer is in /customer, the admins viewing it in /admin
+CHAT_NAMESPACES = (ADMIN_NAMESPACE, CUSTOMER_NAMESPACE)
+NAMESPACE_USER_TYPES = {ADMIN_NAMESPACE: UserType.ADMIN.value, CUSTOMER_NAMESPACE: UserType.CUSTOMER.value}
+
+class NamespaceStats:
+    """Connections, received events and emit calls per namespace (this worker only)."""
+
+    def __init__(self, namespaces):
+        self.counters = {
+            namespace: {'connected': 0, 'connects': 0, 'refused': 0, 'events': 0, 'emits': 0}
+            for namespace in namespaces
+        }
+
+    def count(self, namespace: str, counter: str, delta: int = 1):
+        self.counters[namespace][counter] += delta
+
+    def stats(self) -> Dict[str, Any]:
+        return {namespace: dict(counters) for namespace, counters in self.counters.items()}
+
+namespace_stats = NamespaceStats(CHAT_NAMESPACES)
+metrics.register("namespaces", namespace_stats.stats)
+
+async def emit_to(namespace: str, event: str, data, **kwargs):
+    """sio.emit restricted to one namespace; every emit of this module goes through here."""
+    namespace_stats.count(namespace, 'emits')
+    await sio.emit(event, data, namespace=namespace, **kwargs)
+
+async def emit_to_room(event: str, data, room: str, skip_sid: str = None):
+    """Room events reach the customer and the admins viewing the room."""
+    for namespace in CHAT_NAMESPACES:
+        await emit_to(namespace, event, data, room=room, skip_sid=skip_sid)
+
+async def emit_to_admins(event: str, data):
+    """Admin-only events (room list, new rooms, intents): every socket of /admin."""
+    await emit_to(ADMIN_NAMESPACE, event, data)
+
+# Coalesces typing/stop_typing per (room, user) before they reach the room
+typing_engine = TypingStateEngine(emit_to_room)
+metrics.register("typing", typing_engine.stats)
 
 # Constants
-ADMIN_ROOM_NAME = "admin_room"
+# Changes to one room within this window are sent to admins as a single room_updated event
+ROOM_UPDATE_WINDOW_SECONDS = float(os.getenv("ROOM_UPDATE_WINDOW_SECONDS", 0.3))
+# Intent results of one room finishing within this window are sent as one intent_classified event
+INTENT_EVENT_WINDOW_SECONDS = float(os.getenv("INTENT_EVENT_WINDOW_SECONDS", 0.5))
+# Every admin gets at most one room_list_changed counter per window, whatever the traffic
+ROOM_LIST_COUNTER_WINDOW_SECONDS = float(os.getenv("ROOM_LIST_COUNTER_WINDOW_SECONDS", 2))
+# Rooms one admin socket can watch at once (a page or two of the room list)
+WATCH_ROOMS_MAX = int(os.getenv("WATCH_ROOMS_MAX", 200))
+# Messages returned by one sync call; clients call again while has_more is true
+SYNC_MAX_MESSAGES = int(os.getenv("SYNC_MAX_MESSAGES", 200))
+
+def watch_room(room_id: str) -> str:
+    """/admin room of the admin sockets that show `room_id` in their room list (see watch_rooms)."""
+    return f"watch:{room_id}"
+
+def room_watchers(room_id: str) -> List[str]:
+    """Admins that watch a room or have its conversation open; a socket in both gets one copy."""
+    return [watch_room(room_id), room_id]
+
+async def emit_room_update(room_id: str):
+    """Sends the current summary of one room to the admins watching it, so they can patch their room list."""
+    summary = await get_chat_service().get_room_summary(room_id)
+    if summary:
+        await emit_to(ADMIN_NAMESPACE, 'room_updated', jsonable_encoder(summary), room=room_watchers(room_id))
+
+room_updates = KeyedCoalescer(emit_room_update, ROOM_UPDATE_WINDOW_SECONDS, name="room_updated")
+metrics.register("room_updated", room_updates.stats)
+
+# Rooms changed since the last room_list_changed, and a version admins can compare
+changed_rooms = set()
+room_list_version = 0
 
-async def handle_user_authentication(sid, auth):
-    """Authenticates a user and saves their info to the session."""
+async def emit_room_list_changed(_key):
+    """Cheap global signal for rooms an admin does not watch: how many changed, not what."""
+    global room_list_version
+    count = len(changed_rooms)
+    changed_rooms.clear()
+    room_list_version += 1
+    await emit_to_admins('room_list_changed', {'changed_rooms': count, 'version': room_list_version})
+
+room_list_counter = KeyedCoalescer(emit_room_list_changed, ROOM_LIST_COUNTER_WINDOW_SECONDS, name="room_list_changed")
+metrics.register("room_list_changed", room_list_counter.stats)
+
+def schedule_room_update(room_id: str):
+    """Call after anything shown in the admin room list changes (message, read state, status)."""
+    room_updates.schedule(room_id)
+    changed_rooms.add(room_id)
+    room_list_counter.schedule('all')
+
+# room_id: classification results waiting for the next intent_classified event
+pending_intents: Dict[str, List[Dict[str, Any]]] = {}
+
+async def emit_intent_batch(room_id: str):
+    results = pending_intents.pop(room_id, None)
+    if results:
+        await emit_to(ADMIN_NAMESPACE, 'intent_classified', {'room_id': room_id, 'results': results}, room=room_watchers(room_id))
+
+intent_events = KeyedCoalescer(emit_intent_batch, INTENT_EVENT_WINDOW_SECONDS, name="intent_classified")
+metrics.register("intent_classified", intent_events.stats)
+
+def queue_intent_result(room_id: str, message_id: str, intent: str, confidence: float, model_version: str):
+    pending_intents.setdefault(room_id, []).append({
+        'message_id': message_id,
+        'intent': intent,
+        'confidence': round(float(confidence), 4),
+        'model_version': model_version,
+    })
+    intent_events.schedule(room_id)
+
+def rate_limited(event: str, notify: bool = True):
+    """
+    Applies the system_config.rate_limits socket policy of `event` to a handler, per user.
+    Rejected events get a `rate_limited` reply unless notify is False: typing events are
+    emitted on every keystroke, and answering each excess one would add the traffic back.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(sid, *args, namespace):
+            policy_key, policy = rate_limiter.socket_policy(event)
+            if policy is not None:
+                session = await sio.get_session(sid, namespace=namespace)
+                principal = session.get('user_id') or f"sid:{sid}"
+                retry_after = rate_limiter.check(f"socket:{policy_key}", policy, principal)
+                if retry_after:
+                    if notify:
+                        await emit_to(namespace, 'rate_limited', {'event': event, 'retry_after': round(retry_after, 2)}, room=sid)
+                    return
+            return await handler(sid, *args, namespace=namespace)
+        return wrapper
+    return decorator
+
+async def handle_user_authentication(sid, auth, namespace):
+    """Authenticates a user of the namespace's user type and saves their info to the session."""
     print(f"[DEBUG] handle_user_authentication called for SID {sid}")
     print(f"[DEBUG] auth object: {auth}")
     print(f"[DEBUG] auth type: {type(auth)}")
@@ -54,102 +209,209 @@ async def handle_user_authentication(sid, auth):
 
     user_id = str(user.get('id'))
     user_type = user.get('user_type')
+    if user_type != NAMESPACE_USER_TYPES[namespace]:
+        logger.warning(f"Authentication failed for SID {sid}: {user_type} cannot connect to {namespace}.")
+        return False
     
-    # Save user info to the session
-    await sio.save_session(sid, {'user_id': user_id, 'user_type': user_type})
-    logger.info(f"User {user_id} authenticated as {user_type} (SID: {sid})")
+    # Save user info to the session, with the payload format this client asked for
+    await sio.save_session(sid, {'user_id': user_id, 'user_type': user_type, 'wire': wire.negotiate(auth)}, namespace=namespace)
+    await presence.set_user(sid, user_id, user_type)
+    logger.info(f"User {user_id} authenticated as {user_type} on {namespace} (SID: {sid})")
+    return True
 
-    # If the user is an admin, have them join the admin room
-    if user_type == UserType.ADMIN.value:
-        await sio.enter_room(sid, ADMIN_ROOM_NAME)
-        logger.info(f"Admin {user_id} joined {ADMIN_ROOM_NAME}")
+async def resume_session(sid, claims: Dict[str, Any], namespace):
+    """Restores session and room memberships from a resume token; no database access."""
+    user_id, user_type = claims['sub'], claims.get('user_type')
+    wire_format = claims.get('wire') if claims.get('wire') in wire.enabled_formats() else 'json'
+    await sio.save_session(sid, {'user_id': user_id, 'user_type': user_type, 'wire': wire_format}, namespace=namespace)
+    await presence.set_user(sid, user_id, user_type)
+    rooms = claims.get('rooms') or []
+    for room_id in rooms:
+        await sio.enter_room(sid, room_id, namespace=namespace)
+        await sio.enter_room(sid, wire.room_for(room_id, wire_format), namespace=namespace)
+        await presence.join(room_id, sid)
+    handshake_gate.resumed += 1
+    logger.info(f"User {user_id} resumed session on {namespace} with {len(rooms)} room(s) (SID: {sid})")
+    await emit_to(namespace, 'session_resumed', {'rooms': rooms}, room=sid)
 
-    return True
+async def issue_resume_token(sid, namespace):
+    """Sends the client a short-lived token describing its current session and rooms."""
+    session = await sio.get_session(sid, namespace=namespace)
+    if not session.get('user_id'):
+        return
+    rooms = sorted(await presence.sid_rooms_of(sid))
+    token = create_resume_token(session['user_id'], session.get('user_type'), rooms, session.get('wire', 'json'))
+    await emit_to(namespace, 'resume_token', {'token': token, 'expires_in': RESUME_TOKEN_TTL_SECONDS}, room=sid)
 
-@sio.event
-async def connect(sid, environ, auth):
-    logger.info(f"connection open")
-    logger.info(f"[SOCKET] Client connected: {sid}")
-    
-    # --- CRITICAL FIX: Actually call the authentication handler ---
-    authenticated = await handle_user_authentication(sid, auth)
+async def connect(sid, environ, auth=None, *, namespace):
+    logger.info(f"[SOCKET] Client connected: {sid} ({namespace})")
+    auth = auth or {}
+
+    # A valid resume token skips the user lookup, so it does not need a handshake slot
+    claims = decode_resume_token(auth.get('resume'))
+    if claims and claims.get('user_type') == NAMESPACE_USER_TYPES[namespace]:
+        await resume_session(sid, claims, namespace)
+        namespace_stats.count(namespace, 'connects')
+        namespace_stats.count(namespace, 'connected')
+        await issue_resume_token(sid, namespace)
+        return
+
+    try:
+        # Bounded concurrent handshakes; refused clients get a jittered delay before retrying
+        async with handshake_gate.admit():
+            authenticated = await handle_user_authentication(sid, auth, namespace)
+    except HandshakeRejected as e:
+        logger.warning(f"[SOCKET] Handshake refused for {sid}, retry after {e.retry_after}s")
+        namespace_stats.count(namespace, 'refused')
+        raise socketio.exceptions.ConnectionRefusedError({'message': 'Server busy', 'retry_after': e.retry_after})
     if not authenticated:
-        # If authentication fails, disconnect the user.
-        # This prevents unauthenticated users from proceeding.
-        await sio.disconnect(sid)
-        logger.info(f"Disconnected unauthenticated user {sid}")
-
-@sio.event
-async def authenticate(sid, data):
-    """Authenticate user and store their data"""
-    user_id = data.get('user_id')
-    user_type = data.get('user_type')
-    if not user_id or not user_type:
-        await sio.emit('auth_error', {'message': 'Missing credentials'}, room=sid)
+        # Refuse the connection: unauthenticated users (or users of the other
+        # namespace) never get a session, and the client receives connect_error.
+        namespace_stats.count(namespace, 'refused')
+        logger.info(f"Refused unauthenticated user {sid} on {namespace}")
+        return False
+    namespace_stats.count(namespace, 'connects')
+    namespace_stats.count(namespace, 'connected')
+    await issue_resume_token(sid, namespace)
+
+async def room_session(sid, namespace, room_id) -> Optional[Dict[str, Any]]:
+    """
+    Session of the socket if it may act in room_id, else None. The identity always comes
+    from the session saved when the connection was authenticated, never from event payloads.
+    """
+    session = await sio.get_session(sid, namespace=namespace)
+    # A customer's room id is their user id
+    if not room_id or not session.get('user_id') or (namespace == CUSTOMER_NAMESPACE and room_id != session['user_id']):
+        return None
+    return session
+
+@rate_limited('authenticate')
+async def authenticate(sid, data, *, namespace):
+    """
+    Kept for older clients: the connection is already authenticated by its token, so this
+    only confirms the identity of the session; user_id/user_type in the payload are ignored.
+    """
+    session = await sio.get_session(sid, namespace=namespace)
+    if not session.get('user_id'):
+        await emit_to(namespace, 'auth_error', {'message': 'Not authenticated'}, room=sid)
+        return
+    await emit_to(namespace, 'authenticated', {'status': 'success', 'user_id': session['user_id'],
+                                               'user_type': session.get('user_type')}, room=sid)
+
+@rate_limited('join_room')
+async def join_room(sid, data, *, namespace):
+    room_id = (data or {}).get("room_id")
+    session = await room_session(sid, namespace, room_id)
+    if session is None:
+        await emit_to(namespace, 'room_error', {'room_id': room_id, 'message': 'Not allowed'}, room=sid)
         return
-    active_users[sid] = {'user_id': user_id, 'user_type': user_type}
-    logger.info(f"User {user_id} authenticated as {user_type} (SID: {sid})")
-    if user_type == 'admin':
-        await sio.enter_room(sid, 'admin_room')
-        logger.info(f"Admin {user_id} joined admin_room")
-    await sio.emit('authenticated', {'status': 'success'}, room=sid)
-
-@sio.event
-async def join_room(sid, data):
-    room_id = data.get("room_id")
-    user_id = data.get("user_id")
-    user_type = data.get("user_type")
-    await sio.enter_room(sid, room_id)
+    user_id, user_type = session['user_id'], session.get('user_type')
+    await sio.enter_room(sid, room_id, namespace=namespace)
+    await sio.enter_room(sid, wire.room_for(room_id, session.get('wire', 'json')), namespace=namespace)
     print(f"[SOCKET] {user_type} {user_id} joined room {room_id} (sid={sid})")
-    if room_id not in active_rooms:
-        active_rooms[room_id] = set()
-    active_rooms[room_id].add(sid)
-    await sio.emit('room_joined', {'room_id': room_id}, room=sid)
+    await presence.join(room_id, sid)
+    await emit_to(namespace, 'room_joined', {'room_id': room_id}, room=sid)
+    await issue_resume_token(sid, namespace)
 
-@sio.event
-async def leave_room(sid, data):
+@rate_limited('leave_room')
+async def leave_room(sid, data, *, namespace):
     """Handle room leave request"""
     room_id = data.get('room_id')
     if not room_id:
         return
-    await sio.leave_room(sid, room_id)
-    if room_id in active_rooms:
-        active_rooms[room_id].discard(sid)
-        if not active_rooms[room_id]:
-            del active_rooms[room_id]
+    session = await sio.get_session(sid, namespace=namespace)
+    await sio.leave_room(sid, room_id, namespace=namespace)
+    await sio.leave_room(sid, wire.room_for(room_id, session.get('wire', 'json')), namespace=namespace)
+    await presence.leave(room_id, sid)
     logger.info(f"Client {sid} left room {room_id}")
+    await issue_resume_token(sid, namespace)
+
+@rate_limited('watch_rooms')
+async def watch_rooms(sid, data, *, namespace):
+    """
+    An admin declares the rooms its room list shows; the list replaces the previous one.
+    room_updated and intent_classified for other rooms are not sent to this socket.
+    """
+    room_ids = [room_id for room_id in dict.fromkeys((data or {}).get('room_ids') or []) if isinstance(room_id, str)]
+    room_ids = room_ids[:WATCH_ROOMS_MAX]
+    session = await sio.get_session(sid, namespace=namespace)
+    previous = set(session.get('watching', ()))
+    for room_id in previous.difference(room_ids):
+        await sio.leave_room(sid, watch_room(room_id), namespace=namespace)
+    for room_id in set(room_ids).difference(previous):
+        await sio.enter_room(sid, watch_room(room_id), namespace=namespace)
+    session['watching'] = room_ids
+    await sio.save_session(sid, session, namespace=namespace)
+    return {'room_ids': room_ids, 'version': room_list_version}
 
-async def classify_and_update_intent(message_id: str, content: str):
+@rate_limited('sync')
+async def sync(sid, data, *, namespace):
+    """
+    Messages of a room with seq > after_seq, returned as the event's acknowledgement.
+    Clients call it after reconnecting, or when a new_message seq skips a number.
+    """
+    data = data or {}
+    room_id = data.get('room_id')
+    try:
+        after_seq = int(data.get('after_seq', 0))
+    except (TypeError, ValueError):
+        return {'error': 'after_seq must be an integer'}
+    if await room_session(sid, namespace, room_id) is None:
+        return {'error': 'Not allowed'}
+    messages, has_more = await get_chat_service().get_messages_after_seq(room_id, after_seq, SYNC_MAX_MESSAGES)
+    messages = [wire.compact_message(message) for message in messages]
+    return {'room_id': room_id, 'messages': messages, 'has_more': has_more}
+
+async def emit_new_message(message: dict, room_id: str):
+    """Sends the compact projection of a message to a room, once per wire format in use."""
+    compact = wire.compact_message(message)
+    wire.wire_stats.sample(message, compact)
+    for wire_format in wire.enabled_formats():
+        payload = wire.encode(compact, wire_format)
+        for namespace in CHAT_NAMESPACES:
+            await emit_to(namespace, 'new_message', payload, room=wire.room_for(room_id, wire_format))
+
+async def classify_and_update_intent(message_id: str, content: str, room_id: str = None):
     """
     A background task to classify message intent and update the database.
     This runs separately and does not block the message flow.
+    The result is pushed to the room and to admins as an intent_classified event.
     """
     chat_service = get_chat_service()
     ai_service = get_ai_service()
     db = get_database()
     try:
         logging.info(f"Starting background intent classification for message {message_id}")
-        intent, confidence = ai_service.classify_intent(content)
+        result = ai_service.classify_intent_detailed(content)
+        intent, confidence, model_version = result["intent"], result["confidence"], result["model_version"]
         # Luôn lưu intent và confidence vào intent_history (bản sao audit)
-        # Lấy room_id từ message
-        msg = await db["messages"].find_one({"_id": ObjectId(message_id)})
-        room_id = msg["room_id"] if msg else None
+        # Lấy room_id từ message nếu caller không truyền vào
+        if not room_id:
+            msg = await db["messages"].find_one({"_id": ObjectId(message_id)}, {"room_id": 1})
+            room_id = msg["room_id"] if msg else None
         if room_id:
             intent_service = IntentHistoryService(db)
-            await intent_service.add_intent(message_id, room_id, intent, confidence, "ai")
+            await intent_service.add_intent(message_id, room_id, intent, confidence, "ai",
+                                            model_version=model_version, probs=result["probs"])
         # (Tùy chọn) vẫn update intent vào message để hiển thị nhanh
-        await chat_service.update_message_intent(message_id, intent, confidence)
+        await chat_service.update_message_intent(message_id, intent, confidence,
+                                                 model_version=model_version, probs=result["probs"])
+        if room_id:
+            queue_intent_result(room_id, message_id, intent, confidence, model_version)
         logging.info(f"Classified intent for message {message_id} as '{intent}' with confidence {confidence:.2f} and saved to intent_history")
     except Exception as e:
         logging.error(f"Error in background task for message {message_id}: {e}")
 
 
-@sio.on('send_message')
-async def send_message(sid, data):
+@rate_limited('send_message')
+async def send_message(sid, data, *, namespace):
     # ... (existing code from inside the original send_message)
     room_id = data.get('room_id')
     
-    session = await sio.get_session(sid)
+    session = await room_session(sid, namespace, room_id)
+    if session is None:
+        logging.warning(f"[SEND_MESSAGE] SID {sid} may not post to room {room_id}. Aborting.")
+        return
     # --- DEBUGGING: Log the entire session object ---
     logging.info(f"[DEBUG] Session data for SID {sid}: {session}")
 
@@ -158,6 +420,8 @@ async def send_message(sid, data):
 
     content = data.get('content')
     reply_to_message_id = data.get('reply_to')
+    # Admins flag messages sent from an AI suggestion; counted in the room's AI usage
+    is_ai_generated = namespace == ADMIN_NAMESPACE and bool(data.get('is_ai_generated'))
 
     logging.info(f"[SEND_MESSAGE] Received from SID {sid}: room_id={room_id}, user_id={user_id}, user_type={user_type}, content='{content[:20]}...', reply_to='{reply_to_message_id}'")
 
@@ -168,23 +432,20 @@ async def send_message(sid, data):
     chat_service: ChatService = get_chat_service()
     db = get_database()
     try:
-        # Kiểm tra nếu là customer gửi tin nhắn đầu tiên (phòng vừa tạo)
-        room = await db["chat_rooms"].find_one({"_id": room_id})
-        is_first_message = False
-        if room:
-            msg_count = await db["messages"].count_documents({"room_id": room_id})
-            is_first_message = (msg_count == 0)
-        new_message = await chat_service.save_message(
+        new_message, room_before = await chat_service.save_message_with_room(
             room_id=room_id,
             user_id=user_id,
             user_type=user_type,
             content=content,
-            reply_to_message_id=reply_to_message_id
+            reply_to_message_id=reply_to_message_id,
+            is_ai_generated=is_ai_generated
         )
-        await sio.emit('new_message', new_message, room=room_id)
-        await sio.emit('update_room_list', room=ADMIN_ROOM_NAME)
+        # Kiểm tra nếu là customer gửi tin nhắn đầu tiên (phòng vừa tạo), dựa vào bộ đếm của phòng
+        is_first_message = ChatService.is_first_message(room_before)
+        await emit_new_message(new_message, room_id)
+        schedule_room_update(room_id)
         if user_type == 'customer':
-            sio.start_background_task(classify_and_update_intent, new_message['_id'], content)
+            sio.start_background_task(classify_and_update_intent, new_message['_id'], content, room_id)
             # Nếu là tin nhắn đầu tiên, gửi auto-reply từ admin
             if is_first_message:
                 auto_reply = "Thank you for reaching out to our design team! We specialize in providing custom website and application design solutions. Our team will get back to you as soon as possible."
@@ -196,21 +457,17 @@ async def send_message(sid, data):
                     user_type="admin",
                     content=auto_reply
                 )
-                await sio.emit('new_message', auto_msg, room=room_id)
+                await emit_new_message(auto_msg, room_id)
+                schedule_room_update(room_id)
     except Exception as e:
         logging.error(f"[SEND_MESSAGE] Error processing message for room {room_id}: {e}")
-        await sio.emit('message_error', {'error': str(e)}, room=sid)
-
-@sio.event
-def disconnect(sid):
-    print(f"[SOCKET] Client disconnected: {sid}")
-    if sid in active_users:
-        del active_users[sid]
-    for room_id, sids in list(active_rooms.items()):
-        if sid in sids:
-            sids.remove(sid)
-            if not sids:
-                del active_rooms[room_id]
+        await emit_to(namespace, 'message_error', {'error': str(e)}, room=sid)
+
+async def disconnect(sid, *args, namespace):
+    print(f"[SOCKET] Client disconnected: {sid} ({namespace})")
+    namespace_stats.count(namespace, 'connected', -1)
+    await presence.disconnect(sid)
+    await typing_engine.clear_sid(sid)
 
 def init_app(app: FastAPI):
     """Mount the Socket.IO application to the main FastAPI app."""
@@ -219,59 +476,76 @@ def init_app(app: FastAPI):
 
 async def add_user_to_room(room: str, user_data: dict) -> None:
     """Add a user to a room"""
-    if room not in active_rooms:
-        active_rooms[room] = set()
-    active_rooms[room].add(user_data['sid'])
+    await presence.join(room, user_data['sid'])
 
 async def remove_user_from_room(room: str, user_data: dict) -> None:
     """Remove a user from a room"""
-    if room in active_rooms:
-        active_rooms[room].remove(user_data['sid'])
-        if not active_rooms[room]:
-            del active_rooms[room]
+    await presence.leave(room, user_data['sid'])
 
 async def cleanup_user(sid: str) -> None:
     """Clean up user data when they disconnect"""
-    if sid in active_users:
-        user_data = active_users[sid]
-        for room in user_data.get('rooms', []):
-            await remove_user_from_room(room, user_data)
-        del active_users[sid]
+    await presence.disconnect(sid)
 
 async def get_room_users(room: str) -> List[dict]:
     """Get list of users in a room"""
-    if room not in active_rooms:
-        return []
-    return [
-        {
-            'user': user['user'],
-            'user_type': user['user_type'],
-            'joined_at': user['joined_at']
-        }
-        for user in active_rooms[room]
-    ]
+    return await presence.room_users(room)
 
-@sio.on('typing')
-async def handle_typing(sid, data):
-    room_id = data.get('room_id')
-    user_id = data.get('user_id')
-    user_type = data.get('user_type')
-    if room_id and user_id and user_type:
-        await sio.emit('typing', {'room_id': room_id, 'user_id': user_id, 'user_type': user_type}, room=room_id, skip_sid=sid)
+async def sweep_presence():
+    """Periodically removes sids whose socket is gone from the presence registry."""
+    await sweep_forever(presence, lambda sid: any(sio.manager.is_connected(sid, namespace) for namespace in CHAT_NAMESPACES))
 
-@sio.on('stop_typing')
-async def handle_stop_typing(sid, data):
-    room_id = data.get('room_id')
-    user_id = data.get('user_id')
-    user_type = data.get('user_type')
-    if room_id and user_id and user_type:
-        await sio.emit('stop_typing', {'room_id': room_id, 'user_id': user_id, 'user_type': user_type}, room=room_id, skip_sid=sid)
+@rate_limited('typing', notify=False)
+async def handle_typing(sid, data, *, namespace):
+    room_id = (data or {}).get('room_id')
+    session = await room_session(sid, namespace, room_id)
+    if session:
+        await typing_engine.typing(sid, room_id, session['user_id'], session.get('user_type'))
 
-@sio.on('seen')
-async def handle_seen(sid, data):
-    room_id = data.get('room_id')
-    user_id = data.get('user_id')
-    user_type = data.get('user_type')
-    last_message_id = data.get('last_message_id')
-    if room_id and user_id and last_message_id:
-        await sio.emit('seen', {'room_id': room_id, 'user_id': user_id, 'user_type': user_type, 'last_message_id': last_message_id}, room=room_id, skip_sid=sid) 
\ No newline at end of file
+@rate_limited('stop_typing', notify=False)
+async def handle_stop_typing(sid, data, *, namespace):
+    room_id = (data or {}).get('room_id')
+    session = await room_session(sid, namespace, room_id)
+    if session:
+        await typing_engine.stop_typing(sid, room_id, session['user_id'], session.get('user_type'))
+
+@rate_limited('seen')
+async def handle_seen(sid, data, *, namespace):
+    room_id = (data or {}).get('room_id')
+    last_message_id = (data or {}).get('last_message_id')
+    session = await room_session(sid, namespace, room_id)
+    if session and last_message_id:
+        await emit_to_room('seen', {'room_id': room_id, 'user_id': session['user_id'], 'user_type': session.get('user_type'),
+                                    'last_message_id': last_message_id}, room=room_id, skip_sid=sid)
+
+# Events each namespace handles; both share the chat events, admin-only
+# events are added to ADMIN_EVENTS.
+CHAT_EVENTS = {
+    'connect': connect,
+    'disconnect': disconnect,
+    'authenticate': authenticate,
+    'join_room': join_room,
+    'leave_room': leave_room,
+    'send_message': send_message,
+    'typing': handle_typing,
+    'stop_typing': handle_stop_typing,
+    'seen': handle_seen,
+    'sync': sync,
+}
+ADMIN_EVENTS = dict(CHAT_EVENTS, watch_rooms=watch_rooms)
+CUSTOMER_EVENTS = dict(CHAT_EVENTS)
+
+def _bind(event: str, handler, namespace: str):
+    """Handler registered on one namespace; shared handlers receive it as a keyword."""
+    counted = event not in ('connect', 'disconnect')
+    async def bound(sid, *args):
+        if counted:
+            namespace_stats.count(namespace, 'events')
+        return await handler(sid, *args, namespace=namespace)
+    return bound
+
+def register_namespace(namespace: str, events: Dict[str, Any]):
+    for event, handler in events.items():
+        sio.on(event, _bind(event, handler, namespace), namespace=namespace)
+
+register_namespace(ADMIN_NAMESPACE, ADMIN_EVENTS)
+register_namespace(CUSTOMER_NAMESPACE, CUSTOMER_EVENTS)
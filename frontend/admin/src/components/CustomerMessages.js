@@ -1,6 +1,7 @@
 import React, { useEffect, useState } from 'react';
 import { useLocation } from 'react-router-dom';
 import { API_BASE_URL } from '../config';
+import { useSocket } from '../contexts/SocketContext';
 import * as XLSX from 'xlsx';
 
 const INTENT_MAP = {
@@ -62,6 +63,21 @@ const CustomerMessages = () => {
     // eslint-disable-next-line
   }, [roomId]);
 
+  // Intent mới được server đẩy về qua socket -> thêm vào intentHistory, không cần fetch lại
+  const { subscribeToEvent, watchRooms } = useSocket();
+  useEffect(() => {
+    if (!roomId) return;
+    watchRooms([roomId]);
+    return subscribeToEvent('intent_classified', ({ room_id, results }) => {
+      if (room_id !== roomId) return;
+      const now = new Date().toISOString();
+      setIntentHistory(prev => [
+        ...prev,
+        ...results.map(r => ({ ...r, room_id, classified_by: 'ai', created_at: now }))
+      ]);
+    });
+  }, [roomId, subscribeToEvent, watchRooms]);
+
   // Lấy intent mới nhất cho mỗi message
   const getLatestIntent = (messageId) => {
     const intents = intentHistory.filter(i => i.message_id === messageId);
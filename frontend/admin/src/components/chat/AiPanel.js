@@ -23,12 +23,25 @@ const AiPanel = ({ message, onUseSuggestion, onClose, onSuggestionGenerated }) =
   const [feedbackStates, setFeedbackStates] = useState({});
   const [feedbackLoading, setFeedbackLoading] = useState({});
   const [modelVersion, setModelVersion] = useState('v1.00');
-  const modelOptions = [
-    { value: 'v1.00', label: 'v1.00' },
-    { value: 'v1.01', label: 'v1.01 (Beta)' },
-  ];
+  const [modelOptions, setModelOptions] = useState([{ value: 'v1.00', label: 'v1.00' }]);
   const isDarkMode = useIsDarkMode();
 
+  // Only offer the suggestion model versions the server will actually run
+  useEffect(() => {
+    const token = localStorage.getItem('admin_token');
+    axios.get(`${API_BASE_URL}${API_ENDPOINTS.AI_MODELS}`, { headers: { Authorization: `Bearer ${token}` } })
+      .then(response => {
+        const { default_version: defaultVersion, allowed_versions: allowed = [] } = response.data.suggest || {};
+        if (!defaultVersion) return;
+        setModelOptions(allowed.map(version => ({
+          value: version,
+          label: version === defaultVersion ? version : `${version} (Beta)`,
+        })));
+        setModelVersion(current => (allowed.includes(current) ? current : defaultVersion));
+      })
+      .catch(err => console.error('Error loading suggestion model versions:', err));
+  }, []);
+
   const resetLocalStates = useCallback(() => {
     setLoadingStates({});
     setSuggestions([]);
@@ -74,7 +87,9 @@ const AiPanel = ({ message, onUseSuggestion, onClose, onSuggestionGenerated }) =
       }
     } catch (err) {
       console.error(`Error generating ${style} suggestion:`, err);
-      setError(`Failed to generate ${style} suggestion. Please try again.`);
+      setError(err.response?.status === 400 && err.response.data?.detail
+        ? err.response.data.detail
+        : `Failed to generate ${style} suggestion. Please try again.`);
     } finally {
       setLoadingStates(prev => ({ ...prev, [style]: false }));
     }
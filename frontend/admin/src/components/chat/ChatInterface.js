@@ -12,8 +12,11 @@ import ChatWindow from './ChatWindow';
 import AiPanel from './AiPanel';
 import { Bot } from 'lucide-react';
 
+// Số phòng đầu danh sách được theo dõi realtime (room_updated); các phòng còn lại chỉ báo qua room_list_changed
+const WATCH_WINDOW = 50;
+
 const ChatInterface = () => {
-  const { isConnected, joinRoom, leaveRoom, sendMessage, subscribeToEvent, emitTyping, emitStopTyping, emitSeen } = useSocket();
+  const { isConnected, joinRoom, leaveRoom, sendMessage, subscribeToEvent, watchRooms, emitTyping, emitStopTyping, emitSeen } = useSocket();
   const { user } = useAuth();
   const location = useLocation();
   const navigate = useNavigate();
@@ -21,6 +24,7 @@ const ChatInterface = () => {
   const [rooms, setRooms] = useState([]);
   const [activeRoom, setActiveRoom] = useState(null);
   const [messages, setMessages] = useState([]);
+  const [olderCursor, setOlderCursor] = useState(null); // X-Prev-Cursor của trang đang hiển thị
   
   const [replyingTo, setReplyingTo] = useState(null);
   const [isRoomListCollapsed, setRoomListCollapsed] = useState(false);
@@ -56,9 +60,17 @@ const ChatInterface = () => {
     }
   }, [fetchRooms, user]);
 
+  // Theo dõi cửa sổ đầu danh sách phòng; chỉ gửi lại khi tập phòng thay đổi
+  const watchKey = rooms.slice(0, WATCH_WINDOW).map(r => r._id).join(',');
+  useEffect(() => {
+    if (!isConnected) return;
+    watchRooms(watchKey ? watchKey.split(',') : []);
+  }, [isConnected, watchKey, watchRooms]);
+
   useEffect(() => {
     if (!activeRoom) {
       setMessages([]);
+      setOlderCursor(null);
       setLastSeen(null); // reset seen khi đổi phòng
       return;
     };
@@ -70,6 +82,7 @@ const ChatInterface = () => {
             headers: { Authorization: `Bearer ${token}` }
         });
         setMessages(response.data || []);
+        setOlderCursor(response.headers['x-prev-cursor'] || null);
         // Fetch trạng thái seen
         const seenRes = await axios.get(`${API_BASE_URL}/api/admin/rooms/${activeRoom._id}/last-seen`, {
             headers: { Authorization: `Bearer ${token}` }
@@ -77,6 +90,7 @@ const ChatInterface = () => {
         setLastSeen(seenRes.data);
       } catch (error) {
         setMessages([]);
+        setOlderCursor(null);
         setLastSeen(null);
       }
     };
@@ -84,6 +98,22 @@ const ChatInterface = () => {
     fetchMessages();
   }, [activeRoom]);
 
+  // Tải trang tin nhắn cũ hơn (keyset cursor), ghép vào đầu danh sách
+  const handleLoadOlder = useCallback(async () => {
+    if (!activeRoom || !olderCursor) return;
+    try {
+      const token = localStorage.getItem(STORAGE_KEYS.ACCESS_TOKEN);
+      const response = await axios.get(`${API_BASE_URL}/api/admin/rooms/${activeRoom._id}/messages`, {
+          headers: { Authorization: `Bearer ${token}` },
+          params: { before: olderCursor }
+      });
+      setMessages(prev => [...(response.data || []), ...prev]);
+      setOlderCursor(response.headers['x-prev-cursor'] || null);
+    } catch (error) {
+      console.error("Error loading older messages:", error);
+    }
+  }, [activeRoom, olderCursor]);
+
   useEffect(() => {
     if (!isConnected || !user) return;
 
@@ -102,21 +132,45 @@ const ChatInterface = () => {
       fetchRooms();
     };
 
-    const handleUpdateRoomList = () => {
-      console.log('[ChatInterface] Received update_room_list event');
-      fetchRooms();
+    // room_updated mang summary của đúng phòng thay đổi -> vá danh sách tại chỗ, không refetch
+    const handleRoomUpdated = (summary) => {
+      setRooms(prev => {
+        const others = prev.filter(r => r._id !== summary._id);
+        if (summary.status !== 'active') return others;
+        return [summary, ...others].sort((a, b) =>
+          new Date(b.last_message_at || 0) - new Date(a.last_message_at || 0)
+        );
+      });
     };
     
+    // Kết quả phân loại intent được đẩy về theo lô, cập nhật message tại chỗ
+    const handleIntentClassified = ({ room_id, results }) => {
+      if (room_id !== activeRoom?._id) return;
+      const byId = Object.fromEntries(results.map(r => [r.message_id, r]));
+      setMessages(prev => prev.map(m => byId[m._id]
+        ? { ...m, intent: byId[m._id].intent, confidence: byId[m._id].confidence }
+        : m));
+    };
+    
+    // Bộ đếm toàn cục: chỉ refetch khi có phòng ngoài cửa sổ theo dõi (phòng trong cửa sổ đã có room_updated)
+    const handleRoomListChanged = () => {
+      if (rooms.length > WATCH_WINDOW) fetchRooms();
+    };
+
     const unsubscribeNewMessage = subscribeToEvent('new_message', handleNewMessage);
     const unsubscribeNewRoom = subscribeToEvent('new_room', handleNewRoom);
-    const unsubscribeUpdateRoomList = subscribeToEvent('update_room_list', handleUpdateRoomList);
+    const unsubscribeRoomUpdated = subscribeToEvent('room_updated', handleRoomUpdated);
+    const unsubscribeIntentClassified = subscribeToEvent('intent_classified', handleIntentClassified);
+    const unsubscribeRoomListChanged = subscribeToEvent('room_list_changed', handleRoomListChanged);
 
     return () => {
         unsubscribeNewMessage();
         unsubscribeNewRoom();
-        unsubscribeUpdateRoomList();
+        unsubscribeRoomUpdated();
+        unsubscribeIntentClassified();
+        unsubscribeRoomListChanged();
     };
-  }, [isConnected, user, activeRoom?._id, subscribeToEvent, fetchRooms]);
+  }, [isConnected, user, activeRoom?._id, rooms.length, subscribeToEvent, fetchRooms]);
 
   const handleSelectRoom = useCallback(async (room) => {
     const roomId = room._id || room.room_id;
@@ -179,7 +233,7 @@ const ChatInterface = () => {
 
   const handleUseSuggestion = useCallback((suggestionText) => {
     if (!suggestionText.trim() || !activeRoom || !user) return;
-    sendMessage(activeRoom._id, suggestionText);
+    sendMessage(activeRoom._id, suggestionText, null, true);
   }, [activeRoom, user, sendMessage]);
 
   const handleSuggestionGenerated = (messageId, newSuggestions) => {
@@ -265,6 +319,7 @@ const ChatInterface = () => {
           <ChatWindow
             room={activeRoom}
             messages={messages}
+            onLoadOlder={olderCursor ? handleLoadOlder : null}
             onSendMessage={handleSendMessage}
             onReply={handleReply}
             onSuggest={handleSuggest}
@@ -2,7 +2,7 @@ import React, { useRef, useEffect, useState } from 'react';
 import ChatMessage from './ChatMessage';
 import { Send, X, Bot, MessageSquare, Search, Shield, User } from 'lucide-react';
 
-const ChatWindow = ({ room, messages, onSendMessage, onReply, onSuggest, replyingTo, onCancelReply, currentUser, onChatAreaClick, isOtherTyping, lastSeen, handleInputChange }) => {
+const ChatWindow = ({ room, messages, onLoadOlder, onSendMessage, onReply, onSuggest, replyingTo, onCancelReply, currentUser, onChatAreaClick, isOtherTyping, lastSeen, handleInputChange }) => {
   const messageEndRef = useRef(null);
   const [input, setInput] = useState('');
   const [searchUser, setSearchUser] = useState('');
@@ -62,6 +62,13 @@ const ChatWindow = ({ room, messages, onSendMessage, onReply, onSuggest, replyin
       <div className="flex-1 overflow-y-auto px-6 py-6 bg-[#FBFCFE] dark:bg-[#23243a] space-y-5 transition-colors duration-300">
         {messages && messages.length > 0 ? (
           <>
+            {onLoadOlder && (
+              <div className="flex justify-center">
+                <button onClick={onLoadOlder} className="text-xs text-indigo-600 dark:text-indigo-300 hover:underline">
+                  Load older messages
+                </button>
+              </div>
+            )}
             {messages.map((msg, idx) => {
               const isSeen = lastSeen && lastSeen.last_message_id === msg._id && msg.user_type === 'admin' && lastSeen.user_type === 'customer';
               return (
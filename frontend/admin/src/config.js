@@ -27,6 +27,7 @@ export const API_ENDPOINTS = {
   
   // AI
   SUGGEST_REPLY: '/api/ai/suggest',
+  AI_MODELS: '/api/admin/ai/models',
   FEEDBACK: '/api/ai/feedback',
   
   // Admin
@@ -17,6 +17,7 @@ export const SocketProvider = ({ children }) => {
     const eventHandlers = useRef({});
     const notificationAudioRef = useRef(null);
     const lastPlayTimeRef = useRef(0);
+    const watchedRoomsRef = useRef([]); // room_ids gửi qua watch_rooms gần nhất
 
     useEffect(() => {
         // Only connect if the user is logged in and there's no active socket
@@ -30,18 +31,27 @@ export const SocketProvider = ({ children }) => {
                 return;
             }
             
-            const newSocket = io(API_BASE_URL, {
+            // Resume token do server cấp: khi reconnect thì khôi phục session + room mà không cần tra user
+            let resumeToken = null;
+
+            const newSocket = io(`${API_BASE_URL}/admin`, {
                 reconnectionAttempts: 5,
                 reconnectionDelay: 5000,
                 transports: ['websocket'],
-                auth: {
-                    token: token,
-                },
+                auth: (cb) => cb(resumeToken ? { token: token, resume: resumeToken } : { token: token }),
+            });
+
+            newSocket.on('resume_token', (data) => {
+                resumeToken = data.token;
             });
 
             newSocket.on('connect', () => {
                 console.log('Admin SocketContext: Connected with ID:', newSocket.id);
                 setIsConnected(true);
+                // Đăng ký lại các phòng đang theo dõi sau khi (re)connect
+                if (watchedRoomsRef.current.length) {
+                    newSocket.emit('watch_rooms', { room_ids: watchedRoomsRef.current });
+                }
             });
 
             newSocket.on('disconnect', (reason) => {
@@ -52,6 +62,10 @@ export const SocketProvider = ({ children }) => {
             newSocket.on('connect_error', (err) => {
                 console.error('[SocketContext] connect_error:', err);
                 setIsConnected(false);
+                // Server đang quá tải (vừa restart): thử lại sau khoảng thời gian server gợi ý
+                if (err.data?.retry_after) {
+                    setTimeout(() => newSocket.connect(), err.data.retry_after * 1000);
+                }
             });
 
             setSocket(newSocket);
@@ -84,7 +98,7 @@ export const SocketProvider = ({ children }) => {
         });
     }, [socket, user]);
 
-    const sendMessage = useCallback((roomId, content, replyToId = null) => {
+    const sendMessage = useCallback((roomId, content, replyToId = null, isAiGenerated = false) => {
         if (!socket || !user) return;
         
         const payload = {
@@ -97,11 +111,23 @@ export const SocketProvider = ({ children }) => {
         if (replyToId) {
             payload.reply_to = replyToId;
         }
+        // Tin nhắn gửi từ gợi ý AI -> tính vào tỉ lệ sử dụng AI của phòng
+        if (isAiGenerated) {
+            payload.is_ai_generated = true;
+        }
 
         console.log("Admin SocketContext: Sending message with payload:", payload);
         socket.emit('send_message', payload);
     }, [socket, user]);
 
+    // Khai báo các phòng đang hiển thị: server chỉ gửi room_updated/intent_classified của các phòng này
+    const watchRooms = useCallback((roomIds) => {
+        watchedRoomsRef.current = roomIds;
+        if (socket && socket.connected) {
+            socket.emit('watch_rooms', { room_ids: roomIds });
+        }
+    }, [socket]);
+
     const subscribeToEvent = useCallback((event, handler) => {
         if (!eventHandlers.current[event]) {
             eventHandlers.current[event] = new Set();
@@ -159,6 +185,7 @@ export const SocketProvider = ({ children }) => {
         leaveRoom,
         sendMessage,
         subscribeToEvent,
+        watchRooms,
         emitTyping,
         emitStopTyping,
         emitSeen
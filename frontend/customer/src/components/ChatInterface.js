@@ -55,6 +55,7 @@ const ChatInterface = () => {
   const [input, setInput] = useState('');
   const [replyingTo, setReplyingTo] = useState(null);
   const [isLoadingHistory, setIsLoadingHistory] = useState(false);
+  const [olderCursor, setOlderCursor] = useState(null); // X-Prev-Cursor: còn tin nhắn cũ hơn để tải
   const messagesEndRef = useRef(null);
   const roomId = user?.id; // The room is identified by the customer's ID
   const [isOtherTyping, setIsOtherTyping] = useState(false);
@@ -91,10 +92,11 @@ const ChatInterface = () => {
 
         if (!isActive) return;
 
-        // Fetch history
+        // Fetch history: chỉ trang mới nhất, tin nhắn cũ hơn tải khi người dùng yêu cầu
         const res = await axios.get(`${API_BASE_URL}/api/public/rooms/${roomId}/messages`);
         if (isActive) {
           setMessages(res.data || []);
+          setOlderCursor(res.headers['x-prev-cursor'] || null);
         }
 
       } catch (err) {
@@ -110,15 +112,62 @@ const ChatInterface = () => {
     return () => { isActive = false; };
   }, [roomId, user]);
 
+  const loadOlderMessages = async () => {
+    if (!olderCursor) return;
+    try {
+      const res = await axios.get(`${API_BASE_URL}/api/public/rooms/${roomId}/messages`, {
+        params: { before: olderCursor }
+      });
+      setMessages(prev => [...(res.data || []), ...prev]);
+      setOlderCursor(res.headers['x-prev-cursor'] || null);
+    } catch (err) {
+      console.error("Error loading older messages:", err);
+    }
+  };
+
+  // seq lớn nhất đã nhận: dùng để lấy bù tin nhắn bị lỡ khi mất kết nối
+  const lastSeqRef = useRef(0);
+  useEffect(() => {
+    lastSeqRef.current = messages.reduce((max, m) => Math.max(max, m.seq || 0), 0);
+  }, [messages]);
+
   // Effect to handle incoming messages and join room
   useEffect(() => {
     if (isConnected && socket && roomId) {
       console.log(`Joining room: ${roomId}`);
       socket.emit('join_room', { room_id: roomId, user_id: roomId, user_type: 'customer' });
 
+      // Gộp tin nhắn mới, bỏ trùng theo _id
+      const mergeMessages = (incoming) => {
+        setMessages((prevMessages) => {
+          const known = new Set(prevMessages.map(m => m._id));
+          const fresh = incoming.filter(m => !known.has(m._id));
+          return fresh.length ? [...prevMessages, ...fresh] : prevMessages;
+        });
+      };
+
+      // Chỉ tải các tin nhắn có seq > seq cuối cùng đã nhận
+      const syncMissed = () => {
+        if (!lastSeqRef.current) return;
+        socket.emit('sync', { room_id: roomId, after_seq: lastSeqRef.current }, (res) => {
+          if (!res || res.error) return;
+          mergeMessages(res.messages);
+          if (res.has_more) {
+            lastSeqRef.current = res.messages[res.messages.length - 1].seq;
+            syncMissed();
+          }
+        });
+      };
+      // Kết nối lại sau khi rớt mạng -> lấy bù phần bị lỡ
+      syncMissed();
+
       const handleNewMessage = (message) => {
         if (message.room_id === roomId) {
-          setMessages((prevMessages) => [...prevMessages, message]);
+          // seq bị nhảy cóc -> có tin nhắn bị lỡ ở giữa
+          if (message.seq && lastSeqRef.current && message.seq > lastSeqRef.current + 1) {
+            syncMissed();
+          }
+          mergeMessages([message]);
         }
       };
 
@@ -251,6 +300,13 @@ const ChatInterface = () => {
           </div>
         ) : (
           <>
+            {olderCursor && (
+              <div className="flex justify-center mb-3">
+                <button onClick={loadOlderMessages} className="text-xs text-indigo-600 hover:underline">
+                  Load older messages
+                </button>
+              </div>
+            )}
             {messages.map((msg, idx) => (
               <div key={msg._id} className="relative">
                 <Message msg={msg} onReply={handleReply} isOtherTyping={isOtherTyping} lastSeen={lastSeen} handleInputChange={handleInputChange} />
@@ -24,12 +24,19 @@ export const SocketProvider = ({ children }) => {
         return; // Abort if no token
       }
 
+      // Resume token do server cấp: khi reconnect thì khôi phục session + room mà không cần tra user
+      let resumeToken = null;
+
       // Create a new socket connection
-      const newSocket = io(API_BASE_URL, {
+      const newSocket = io(`${API_BASE_URL}/customer`, {
         reconnectionAttempts: 5,
         reconnectionDelay: 2000,
         transports: ['websocket'],
-        auth: { token },
+        auth: (cb) => cb(resumeToken ? { token, resume: resumeToken } : { token }),
+      });
+
+      newSocket.on('resume_token', (data) => {
+        resumeToken = data.token;
       });
 
       setSocket(newSocket);
@@ -47,6 +54,10 @@ export const SocketProvider = ({ children }) => {
       newSocket.on('connect_error', (error) => {
         console.error('SocketContext: Connection Error ->', error.message);
         setIsConnected(false);
+        // Server đang quá tải (vừa restart): thử lại sau khoảng thời gian server gợi ý
+        if (error.data?.retry_after) {
+          setTimeout(() => newSocket.connect(), error.data.retry_after * 1000);
+        }
       });
 
       // The cleanup function will run ONLY when user.id changes (i.e., on logout)